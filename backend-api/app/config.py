@@ -12,6 +12,44 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 43200
     
+    # Identity cache (get_current_user), per worker. TTL 0 disables it.
+    IDENTITY_CACHE_TTL_SECONDS: int = 60
+    IDENTITY_CACHE_MAX_SIZE: int = 5000
+    
+    # /reports/dashboard cache per jurisdiction scope, per worker. 0 disables it.
+    DASHBOARD_CACHE_TTL_SECONDS: int = 15
+    
+    # /approvals/count (pending badge) cache, per worker; dropped on local approval changes. 0 disables it.
+    APPROVALS_COUNT_CACHE_TTL_SECONDS: int = 30
+    
+    # /reports/chart/hourly: in-memory histogram, resynced from the DB at most this often
+    HOURLY_HISTOGRAM_RESYNC_SECONDS: int = 60
+    HOURLY_CHART_START_HOUR: int = 6    # First hour shown (inclusive)
+    HOURLY_CHART_END_HOUR: int = 22     # Last hour shown (exclusive)
+    
+    # Receipt lookup / QR verification views (LRU per worker); dropped on reprint. TTL 0 disables it.
+    RECEIPT_CACHE_TTL_SECONDS: int = 300
+    RECEIPT_CACHE_MAX_SIZE: int = 10000
+    
+    # Receipt numbers reserved per worker at a time (per market/month). 1 = no gaps, one allocation per receipt.
+    RECEIPT_SEQUENCE_BLOCK_SIZE: int = 20
+
+    # Background exports (/exports): files on local disk, shared by all workers of the host
+    EXPORT_DIR: str = str(Path(__file__).resolve().parent.parent / "exports")
+    EXPORT_JOB_RETENTION_HOURS: int = 24      # Files are deleted (job EXPIRED) after this
+    EXPORT_JOB_POLL_SECONDS: int = 10         # How often the worker looks for QUEUED jobs
+    EXPORT_JOB_STALE_SECONDS: int = 600       # RUNNING without progress for this long = FAILED
+    EXPORT_JOBS_IN_SCHEDULER: bool = False    # True = run jobs in the API scheduler leader instead of scripts/export_worker.py
+
+    # Write-behind audit sink (AuditService.log_audit(..., deferred=True)), per worker
+    AUDIT_ASYNC_SINK: bool = True              # False = deferred entries are written inline like the others
+    AUDIT_SINK_BATCH_SIZE: int = 200           # Rows per multi-row INSERT
+    AUDIT_SINK_FLUSH_MS: int = 500             # Max time an entry waits in memory
+    AUDIT_SINK_MAX_QUEUE: int = 10000          # Beyond this, the queue is moved to the spill file
+    AUDIT_SINK_WRITE_TIMEOUT_SECONDS: float = 5  # A slower INSERT counts as failed (spilled)
+    AUDIT_SPILL_DIR: str = str(Path(__file__).resolve().parent.parent / "audit_spill")
+    AUDIT_SPILL_RETRY_SECONDS: int = 30        # How often spilled entries are retried
+
     # Database
     DATABASE_URL: str
     
@@ -21,6 +59,10 @@ class Settings(BaseSettings):
     PORTAL_ADDRESS: str
     PORTAL_PORT: int
     PORTAL_SSL: bool = True
+    PORTAL_TIMEOUT_SECONDS: float = 60.0         # Per-call timeout (USSD push waits for the customer PIN)
+    PORTAL_CONNECT_TIMEOUT_SECONDS: float = 10.0
+    PORTAL_MAX_CONNECTIONS: int = 20             # Pooled gateway connections per worker
+    PORTAL_TOKEN_LIFETIME_SECONDS: int = 300     # Bearer token reuse (0 = encrypt per request)
     
     # Logging
     LOG_LEVEL: str = "INFO"
@@ -8,6 +8,7 @@ from app.routers import api_router
 from app.database import get_db
 from app.tasks import start_scheduler, stop_scheduler
 from datetime import datetime
+import logging
 import platform
 import sys
 from app.logging_config import setup_logging
@@ -15,19 +16,38 @@ from app.middleware.rate_limit import RateLimitMiddleware
 
 # Setup structured logging
 setup_logging()
+logger = logging.getLogger(__name__)
 
 # App startup time for uptime calculation
 APP_START_TIME = datetime.now()
 
 
+async def _seed_hourly_histogram():
+    from app.database import SessionLocal
+    from app.services.hourly_histogram import seed_hourly_histogram
+    try:
+        async with SessionLocal() as db:
+            await seed_hourly_histogram(db)
+    except Exception as e:
+        # Not fatal: /reports/chart/hourly resyncs on demand
+        logger.error(f"Hourly histogram seed failed: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifecycle events."""
     # Startup
+    from app.services.audit_sink import audit_sink
+    if settings.AUDIT_ASYNC_SINK:
+        audit_sink.start()
     start_scheduler()
+    await _seed_hourly_histogram()
     yield
     # Shutdown
     stop_scheduler()
+    await audit_sink.stop()  # Writes (or spills) queued audit entries
+    from app.services.payment_service import close_async_client
+    await close_async_client()
 
 
 app = FastAPI(
@@ -47,6 +67,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Rate Limiting (300 req/min)
@@ -174,6 +195,20 @@ async def system_stats(db: AsyncSession = Depends(get_db)):
             "checked_out": pool.checkedout(),
             "overflow": pool.overflow(),
         }
+        
+        # Identity cache (this worker only)
+        from app.services.identity_cache import identity_cache
+        stats["identity_cache"] = identity_cache.stats()
+        from app.routers.reports import dashboard_cache
+        stats["dashboard_cache"] = dashboard_cache.stats()
+        from app.services.approval_service import pending_count_cache
+        stats["approvals_count_cache"] = pending_count_cache.stats()
+        from app.services.receipt_sequence import receipt_sequences
+        stats["receipt_sequences"] = receipt_sequences.stats()
+        from app.services.receipt_lookup import receipt_view_cache
+        stats["receipt_view_cache"] = receipt_view_cache.stats()
+        from app.services.audit_sink import audit_sink
+        stats["audit_sink"] = audit_sink.stats()
     except Exception as e:
         stats["error"] = str(e)
     
@@ -4,13 +4,16 @@ from .merchant_fee_payment import MerchantFeePayment
 from .agent import Agent, AgentStatus
 from .pos_device import POSDevice, POSStatus
 from .transaction import Transaction, PaymentMethod, TransactionStatus
+from .daily_revenue_rollup import DailyRevenueRollup
 from .receipt import Receipt
+from .receipt_sequence import ReceiptSequence
 from .balance import Balance
 from .user import User, UserRole, UserStatus
 from .audit_log import AuditLog, ActorType
 from .jurisdiction_change_request import JurisdictionChangeRequest, EntityType
 from .location import Province, Municipality
 from .app_version import AppVersion, AppUpdateEvent
+from .export_job import ExportJob, ExportKind, ExportJobStatus
 
 __all__ = [
     "Market", "MarketStatus", "ApprovalStatus",
@@ -19,13 +22,15 @@ __all__ = [
     "Agent", "AgentStatus",
     "POSDevice", "POSStatus",
     "Transaction", "PaymentMethod", "TransactionStatus",
-    "Receipt",
+    "DailyRevenueRollup",
+    "Receipt", "ReceiptSequence",
     "Balance",
     "User", "UserRole", "UserStatus",
     "AuditLog", "ActorType",
     "JurisdictionChangeRequest", "EntityType",
     "Province", "Municipality",
     "AppVersion", "AppUpdateEvent",
+    "ExportJob", "ExportKind", "ExportJobStatus",
 ]
 
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, BigInteger, String, Enum, TIMESTAMP, ForeignKey, func
+from sqlalchemy import Column, BigInteger, Integer, String, Enum, TIMESTAMP, ForeignKey, func
 from sqlalchemy.orm import relationship
 from app.database import Base
 import enum
@@ -25,6 +25,7 @@ class Agent(Base):
     # PIN de acesso ao POS (hash)
     pin_hash = Column(String(255), nullable=False)
     last_login_at = Column(TIMESTAMP, nullable=True)
+    token_version = Column(Integer, nullable=False, default=0)  # Incrementado para revogar tokens emitidos
     
     # Mercado e região
     assigned_market_id = Column(BigInteger, ForeignKey("markets.id"), nullable=True)
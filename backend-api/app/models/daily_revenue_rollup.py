@@ -0,0 +1,31 @@
+from sqlalchemy import Column, BigInteger, Integer, Date, Enum, Numeric, Index, UniqueConstraint
+from app.database import Base
+from app.models.transaction import PaymentMethod, TransactionStatus
+
+
+class DailyRevenueRollup(Base):
+    """
+    Pre-aggregated transactions per day (DATE(created_at)) and dimension.
+    Maintained by app.services.revenue_rollup_service; rebuildable from
+    transactions with scripts/rebuild_revenue_rollup.py.
+    """
+    __tablename__ = "daily_revenue_rollup"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False)
+    market_id = Column(BigInteger, nullable=False)           # Transaction.market_id (snapshot)
+    agent_id = Column(BigInteger, nullable=False, default=0)  # 0 = no agent
+    pos_id = Column(BigInteger, nullable=False, default=0)    # 0 = no POS
+    payment_method = Column(Enum(PaymentMethod), nullable=False)
+    status = Column(Enum(TransactionStatus), nullable=False)
+
+    total_amount = Column(Numeric(18, 2), nullable=False, default=0)
+    tx_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # 0 instead of NULL for agent/pos: NULLs never collide in a UNIQUE key
+        UniqueConstraint("day", "market_id", "agent_id", "pos_id", "payment_method", "status",
+                         name="uq_daily_revenue_rollup_key"),
+        Index("idx_daily_revenue_rollup_market_day", "market_id", "day"),
+        Index("idx_daily_revenue_rollup_agent_day", "agent_id", "day"),
+    )
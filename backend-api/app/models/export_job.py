@@ -0,0 +1,62 @@
+from sqlalchemy import Column, BigInteger, Integer, String, Boolean, Text, Enum, TIMESTAMP, JSON, Index, func
+from app.database import Base
+import enum
+
+
+class ExportKind(str, enum.Enum):
+    TRANSACTIONS = "TRANSACTIONS"
+    AUDIT_LOGS = "AUDIT_LOGS"
+
+
+class ExportJobStatus(str, enum.Enum):
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+    EXPIRED = "EXPIRED"   # File removed after EXPORT_JOB_RETENTION_HOURS
+
+
+class ExportJob(Base):
+    """
+    Background export (transactions / audit logs) written to EXPORT_DIR by
+    app.services.export_job_service and downloaded from /exports/{job_uuid}/download.
+    """
+    __tablename__ = "export_jobs"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    job_uuid = Column(String(36), nullable=False, unique=True)
+
+    # O que
+    kind = Column(Enum(ExportKind), nullable=False)
+    export_format = Column(String(10), nullable=False, default="csv")  # csv, parquet, arrow
+    gzip = Column(Boolean, nullable=False, default=False)              # CSV only
+    params = Column(JSON, nullable=True)                               # Filters, as sent to the endpoint
+
+    # Quem (snapshot of the requester's role and jurisdiction at request time)
+    requested_by_type = Column(String(20), nullable=False, default="User")  # User, Agent or Merchant (separate id sequences)
+    requested_by_user_id = Column(BigInteger, nullable=False)
+    user_role = Column(String(50), nullable=True)
+    scope_province = Column(String(100), nullable=True)
+    scope_district = Column(String(100), nullable=True)
+
+    # Estado / progresso
+    status = Column(Enum(ExportJobStatus), nullable=False, default=ExportJobStatus.QUEUED)
+    rows_total = Column(Integer, nullable=True)     # COUNT taken when the job starts
+    rows_written = Column(Integer, nullable=False, default=0)
+    bytes_written = Column(BigInteger, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+
+    # Ficheiro
+    file_path = Column(String(500), nullable=True)  # On the worker's disk (EXPORT_DIR)
+    file_name = Column(String(255), nullable=True)  # Download name
+
+    created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+    started_at = Column(TIMESTAMP, nullable=True)
+    heartbeat_at = Column(TIMESTAMP, nullable=True)  # Last progress update of a RUNNING job
+    finished_at = Column(TIMESTAMP, nullable=True)
+    expires_at = Column(TIMESTAMP, nullable=True)
+
+    __table_args__ = (
+        Index("idx_export_jobs_status", "status", "id"),
+        Index("idx_export_jobs_requester", "requested_by_type", "requested_by_user_id", "id"),
+    )
@@ -64,6 +64,7 @@ class Merchant(Base):
     # Acesso ao portal
     password_hash = Column(String(255), nullable=True)
     last_login_at = Column(TIMESTAMP, nullable=True)
+    token_version = Column(Integer, nullable=False, default=0)  # Incrementado para revogar tokens emitidos
     
     # NFC
     nfc_uid = Column(String(100), unique=True, nullable=True)
@@ -80,6 +81,11 @@ class Merchant(Base):
     overdue_balance = Column(Numeric(10, 2), default=0.00) # Valor exato em atraso
     credit_balance = Column(Numeric(10, 2), default=0.00) # Valor excedente (crédito)
     
+    # Ledger incremental de taxas: Sum(FeePayments) + Sum(Transactions SUCESSO)
+    # NULL = ledger ainda não reconstruído (ver scripts/rebuild_fee_ledger.py)
+    fee_total_paid = Column(Numeric(14, 2), nullable=True, default=0.00)
+    fee_ledger_reconciled_date = Column(Date, nullable=True)  # Última reconciliação com o histórico
+    
     # Datas
     registered_at = Column(TIMESTAMP, server_default=func.current_timestamp())
     
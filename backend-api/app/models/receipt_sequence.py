@@ -0,0 +1,19 @@
+from sqlalchemy import Column, BigInteger, String, UniqueConstraint
+from app.database import Base
+
+
+class ReceiptSequence(Base):
+    """
+    Last receipt number handed out per (market, month) - the 000123 part of
+    MKT12-2025-02-000123. Allocated in blocks by app.services.receipt_sequence.
+    """
+    __tablename__ = "receipt_sequences"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    market_id = Column(BigInteger, nullable=False)
+    period = Column(String(7), nullable=False)      # YYYY-MM
+    last_value = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("market_id", "period", name="uq_receipt_sequences_market_period"),
+    )
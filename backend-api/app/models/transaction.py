@@ -1,4 +1,4 @@
-from sqlalchemy import Column, BigInteger, String, Enum, TIMESTAMP, func, ForeignKey, Numeric, JSON
+from sqlalchemy import Column, BigInteger, String, Enum, TIMESTAMP, func, ForeignKey, Numeric, JSON, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 import enum
@@ -42,6 +42,7 @@ class Transaction(Base):
     funcionario_id = Column(BigInteger, ForeignKey("users.id"), nullable=True) # User who initiated
     
     # Location Snapshot (for audit/reports even if entities move)
+    market_id = Column(BigInteger, ForeignKey("markets.id"), nullable=False)
     province = Column(String(100), nullable=True)
     district = Column(String(100), nullable=True)
     
@@ -54,6 +55,9 @@ class Transaction(Base):
     # Audit/Technical
     request_payload = Column(JSON, nullable=True)
     response_payload = Column(JSON, nullable=True)
+    # Set by the reconciliation job when the gateway gave no final status within
+    # RECONCILE_GIVE_UP_HOURS: status left as is, to be settled manually
+    reconcile_review_at = Column(TIMESTAMP, nullable=True)
     
     # Timestamps
     created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
@@ -63,4 +67,13 @@ class Transaction(Base):
     merchant = relationship("Merchant", back_populates="transactions")
     pos_device = relationship("POSDevice", back_populates="transactions")
     agent = relationship("Agent", back_populates="transactions")
-    funcionario = relationship("User") 
+    funcionario = relationship("User")
+    
+    __table_args__ = (
+        # Status scans by age (reconciliation of PENDING/TIMEOUT, status filters by date)
+        Index("idx_transactions_status_created_at", "status", "created_at"),
+        # Keyset pagination on (created_at, id) (InnoDB secondary indexes carry the PK)
+        Index("idx_transactions_created_at", "created_at"),
+        Index("idx_transactions_merchant_created_at", "merchant_id", "created_at"),
+        Index("idx_transactions_agent_created_at", "agent_id", "created_at"),
+    ) 
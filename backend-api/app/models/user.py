@@ -1,4 +1,4 @@
-from sqlalchemy import Column, BigInteger, String, Enum, TIMESTAMP, func
+from sqlalchemy import Column, BigInteger, Integer, String, Enum, TIMESTAMP, func
 from app.database import Base
 from pydantic import EmailStr
 import enum
@@ -35,4 +35,5 @@ class User(Base):
     status = Column(Enum(UserStatus), default=UserStatus.ATIVO)
     
     last_login_at = Column(TIMESTAMP, nullable=True)
+    token_version = Column(Integer, nullable=False, default=0)  # Incremented to revoke issued tokens
     created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
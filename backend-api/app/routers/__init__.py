@@ -15,6 +15,7 @@ from .locations import router as locations_router
 from .payments import router as payments_router
 from .merchant_fees import router as merchant_fees_router
 from .app_updates import router as app_updates_router
+from .export_jobs import router as export_jobs_router
 
 api_router = APIRouter()
 api_router.include_router(auth_router)
@@ -32,5 +33,6 @@ api_router.include_router(locations_router)
 api_router.include_router(payments_router)
 api_router.include_router(merchant_fees_router)
 api_router.include_router(app_updates_router)
+api_router.include_router(export_jobs_router)
 
 
@@ -24,11 +24,25 @@ async def list_agents(
     db: AsyncSession = Depends(get_db),
     current_user: UserModel = Depends(get_current_user)
 ):
-    from datetime import datetime, time
-    from sqlalchemy import func, and_
-    from app.models.transaction import Transaction
+    from datetime import date
+    from sqlalchemy import func
+    from app.models import DailyRevenueRollup
+    
+    # Today's SUCESSO totals per agent from the daily rollup, joined into the
+    # same statement (no query per agent)
+    today_totals = (
+        select(DailyRevenueRollup.agent_id, func.sum(DailyRevenueRollup.total_amount).label("total"))
+        .where(DailyRevenueRollup.day == date.today(), DailyRevenueRollup.status == "SUCESSO")
+        .group_by(DailyRevenueRollup.agent_id)
+        .subquery()
+    )
     
-    query = select(AgentModel).outerjoin(MarketModel, AgentModel.assigned_market_id == MarketModel.id).options(selectinload(AgentModel.pos_devices))
+    query = (
+        select(AgentModel, today_totals.c.total)
+        .outerjoin(MarketModel, AgentModel.assigned_market_id == MarketModel.id)
+        .outerjoin(today_totals, today_totals.c.agent_id == AgentModel.id)
+        .options(selectinload(AgentModel.pos_devices))
+    )
 
     # 1. Explicit Filters
     if province:
@@ -47,25 +61,12 @@ async def list_agents(
         if current_user.scope_province:
             query = query.where(MarketModel.province == current_user.scope_province)
 
-    result = await db.execute(query.offset(skip).limit(limit))
-    agents = result.scalars().all()
+    result = await db.execute(query.order_by(AgentModel.id).offset(skip).limit(limit))
     
-    # Calculate today's stats for each agent
-    now = datetime.now()
-    today_start = datetime.combine(now.date(), time.min)
-    
-    for agent in agents:
-        today_stats = await db.execute(
-            select(func.sum(Transaction.amount))
-            .where(
-                and_(
-                    Transaction.agent_id == agent.id,
-                    Transaction.created_at >= today_start,
-                    Transaction.status == "SUCESSO"
-                )
-            )
-        )
-        agent.total_collected_today = float(today_stats.scalar() or 0)
+    agents = []
+    for agent, total_today in result.all():
+        agent.total_collected_today = float(total_today or 0)
+        agents.append(agent)
     
     return agents
 
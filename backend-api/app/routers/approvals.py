@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select
 from typing import List, Optional
 from datetime import datetime
 
@@ -16,6 +16,7 @@ from app.schemas.jurisdiction_change_request import (
 )
 from app.routers.auth import get_current_user, require_admin
 from app.models.user import User as UserModel
+from app.services.approval_service import enrich_requests, get_pending_count as count_pending_requests
 
 router = APIRouter(prefix="/approvals", tags=["Approvals"])
 
@@ -32,39 +33,8 @@ async def list_pending_approvals(
     )
     requests = result.scalars().all()
     
-    # Enrich with user names and entity names
-    enriched = []
-    for req in requests:
-        # Get requester name
-        user_result = await db.execute(
-            select(UserModel).where(UserModel.id == req.requested_by_user_id)
-        )
-        user = user_result.scalar_one_or_none()
-        
-        # Get entity name
-        entity_name = None
-        if req.entity_type == EntityType.MARKET:
-            entity_result = await db.execute(select(Market).where(Market.id == req.entity_id))
-            entity = entity_result.scalar_one_or_none()
-            entity_name = entity.name if entity else None
-        elif req.entity_type == EntityType.MERCHANT:
-            entity_result = await db.execute(select(Merchant).where(Merchant.id == req.entity_id))
-            entity = entity_result.scalar_one_or_none()
-            entity_name = entity.full_name if entity else None
-        elif req.entity_type == EntityType.AGENT:
-            entity_result = await db.execute(select(Agent).where(Agent.id == req.entity_id))
-            entity = entity_result.scalar_one_or_none()
-            entity_name = entity.full_name if entity else None
-        elif req.entity_type == EntityType.POS:
-            entity_result = await db.execute(select(POSDevice).where(POSDevice.id == req.entity_id))
-            entity = entity_result.scalar_one_or_none()
-            entity_name = entity.serial_number if entity else None
-        
-        req.requested_by_name = user.full_name if user else "Unknown"
-        req.entity_name = entity_name
-        enriched.append(req)
-    
-    return enriched
+    # Enrich with user names and entity names (batched: one query per type)
+    return await enrich_requests(db, requests)
 
 @router.get("/history", response_model=List[JCRSchema])
 async def list_approval_history(
@@ -96,32 +66,8 @@ async def list_my_requests(
     )
     requests = result.scalars().all()
     
-    # Enrich with entity names (simplified for user view)
-    enriched = []
-    for req in requests:
-        entity_name = None
-        if req.entity_type == EntityType.MARKET:
-            entity_result = await db.execute(select(Market).where(Market.id == req.entity_id))
-            entity = entity_result.scalar_one_or_none()
-            entity_name = entity.name if entity else None
-        elif req.entity_type == EntityType.MERCHANT:
-            entity_result = await db.execute(select(Merchant).where(Merchant.id == req.entity_id))
-            entity = entity_result.scalar_one_or_none()
-            entity_name = entity.full_name if entity else None
-        elif req.entity_type == EntityType.AGENT:
-            entity_result = await db.execute(select(Agent).where(Agent.id == req.entity_id))
-            entity = entity_result.scalar_one_or_none()
-            entity_name = entity.full_name if entity else None
-        elif req.entity_type == EntityType.POS:
-            entity_result = await db.execute(select(POSDevice).where(POSDevice.id == req.entity_id))
-            entity = entity_result.scalar_one_or_none()
-            entity_name = entity.serial_number if entity else None
-        
-        req.entity_name = entity_name
-        req.requested_by_name = current_user.full_name
-        enriched.append(req)
-        
-    return enriched
+    # Enrich with entity names (batched; the requester is the current user)
+    return await enrich_requests(db, requests, requester_name=current_user.full_name)
 
 @router.post("/{request_id}/cancel")
 async def cancel_request(
@@ -349,9 +295,5 @@ async def get_pending_count(
     db: AsyncSession = Depends(get_db),
     current_user: UserModel = Depends(require_admin)
 ):
-    """Get count of pending approvals (for badge display)"""
-    count = await db.scalar(
-        select(func.count(JCRModel.id))
-        .where(JCRModel.status == ApprovalStatus.PENDENTE)
-    )
-    return {"pending_count": count or 0}
+    """Get count of pending approvals (for badge display, cached per worker)"""
+    return {"pending_count": await count_pending_requests(db)}
@@ -82,9 +82,13 @@ async def list_audit_logs(
     return result.scalars().all()
 
 
-import csv
-import io
 from fastapi.responses import StreamingResponse
+from app.utils.csv_stream import csv_response, iter_rows_keyset
+from app.utils.columnar_stream import columnar_response
+from app.services.export_service import (
+    AUDIT_EXPORT_ROLES, AUDIT_EXPORT_HEADER, AUDIT_EXPORT_COLUMNS,
+    audit_export_query, format_audit_row
+)
 
 @router.get("/export", response_class=StreamingResponse)
 async def export_audit_logs(
@@ -97,82 +101,40 @@ async def export_audit_logs(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     actor_id: Optional[int] = None,
+    gzip: bool = Query(False, description="Download as .csv.gz"),
+    export_format: str = Query("csv", alias="format", pattern="^(csv|parquet|arrow)$"),
     db: AsyncSession = Depends(get_db),
     current_user: UserModel = Depends(get_current_user)
 ):
-    """Export audit logs to CSV file"""
+    """
+    Export audit logs to CSV file (all matching rows), or Parquet / Arrow IPC.
+    Streamed in keyset chunks on (created_at, id), newest first.
+    For very large exports use POST /exports/audit-logs (background job).
+    """
     # RBAC
-    allowed_roles = ["ADMIN", "AUDITOR"]
-    if current_user.role.value not in allowed_roles:
+    if current_user.role.value not in AUDIT_EXPORT_ROLES:
          raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
 
-    query = select(AuditLog)
-    
-    # Apply filters
-    if search:
-        search_filter = f"%{search}%"
-        query = query.where(
-            or_(
-                AuditLog.description.ilike(search_filter),
-                AuditLog.actor_name.ilike(search_filter),
-                AuditLog.entity.ilike(search_filter),
-                AuditLog.action.ilike(search_filter)
-            )
-        )
-    if severity: query = query.where(AuditLog.severity == severity)
-    if event_type: query = query.where(AuditLog.event_type == event_type)
-    if actor_type: query = query.where(AuditLog.actor_type == actor_type)
-    if actor_id: query = query.where(AuditLog.actor_id == actor_id)
-    if action: query = query.where(AuditLog.action.ilike(f"%{action}%"))
-    if entity: query = query.where(AuditLog.entity.ilike(f"%{entity}%"))
-    if start_date: query = query.where(AuditLog.created_at >= start_date)
-    if end_date: query = query.where(AuditLog.created_at <= end_date)
-
-    query = query.order_by(desc(AuditLog.created_at)).limit(10000) # Limit export to 10k for safety
-    
-    result = await db.execute(query)
-    logs = result.scalars().all()
-    
-    # Generate CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Headers
-    writer.writerow([
-        "ID", "Data/Hora", "Severidade", "Tipo Evento", 
-        "Tipo Ator", "ID Ator", "Nome Ator", "Role Ator", "Jurisdição Ator",
-        "Ação", "Entidade", "ID Entidade", "Descrição", "IP", "User Agent"
-    ])
-    
-    for log in logs:
-        writer.writerow([
-            log.id,
-            log.created_at.isoformat(),
-            log.severity.value,
-            log.event_type.value,
-            log.actor_type.value,
-            log.actor_id,
-            log.actor_name,
-            log.actor_role,
-            f"{log.actor_province}/{log.actor_district}" if log.actor_province else "",
-            log.action,
-            log.entity,
-            log.entity_id,
-            log.description,
-            log.ip_address,
-            log.user_agent
-        ])
-        
-    output.seek(0)
+    # Flat projection: no ORM objects, no before/after JSON (shared with export jobs)
+    query = audit_export_query(
+        search=search,
+        severity=severity,
+        event_type=event_type,
+        actor_type=actor_type,
+        action=action,
+        entity=entity,
+        start_date=start_date,
+        end_date=end_date,
+        actor_id=actor_id,
+    )
     
-    filename = f"audit_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    filename = f"audit_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    rows = iter_rows_keyset(query, AuditLog.created_at, AuditLog.id)
     
-    response = StreamingResponse(
-        iter([output.getvalue()]), 
-        media_type="text/csv"
-    )
-    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
-    return response
+    if export_format != "csv":
+        # Parquet / Arrow are compressed already: gzip does not apply
+        return columnar_response(rows, AUDIT_EXPORT_COLUMNS, filename, export_format)
+    return csv_response(rows, AUDIT_EXPORT_HEADER, format_audit_row, f"{filename}.csv", gzip=gzip)
 
 
 @router.get("/{log_id}", response_model=AuditLogSchema)
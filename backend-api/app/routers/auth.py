@@ -11,6 +11,7 @@ from app.models.user import User
 from app.schemas.user import Token, User as UserSchema
 from app.services.auth_service import AuthService, verify_password
 from app.config import settings
+from app.services.identity_cache import identity_cache
 from jose import JWTError, jwt
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
@@ -33,6 +34,115 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: As
     except JWTError:
         raise credentials_exception
         
+    # Typed tokens: (typ, pid, ver) identifies the principal; legacy tokens
+    # (issued before typed claims, still in the field on POS devices) only
+    # carry sub/role and go through the users -> merchants -> agents probe.
+    principal_type = payload.get("typ")
+    if principal_type:
+        cache_key = (principal_type, payload.get("pid"), payload.get("ver"))
+    else:
+        cache_key = (identifier, payload.get("role"))
+    
+    # Fast path: principal already resolved by this worker
+    principal = identity_cache.get(cache_key)
+    if principal is not None:
+        return principal
+    
+    if principal_type:
+        principal = await _resolve_typed_principal(payload, db)
+    else:
+        principal = await _resolve_principal(identifier, db)
+    if principal is None:
+        raise credentials_exception
+    
+    # Detach so the cached instance is never tied to (or expired by) this session
+    db.expunge(principal)
+    identity_cache.put(cache_key, principal)
+    return principal
+
+
+def _merchant_principal(merchant, market):
+    """Duck typing for Merchant as User (role + scope from its market)."""
+    if market:
+        merchant.scope_province = market.province
+        merchant.scope_district = market.district
+        merchant.scope_market_id = market.id
+    
+    merchant.role = type('obj', (object,), {'value': 'MERCHANT'})
+    merchant.username = merchant.nfc_uid
+    return merchant
+
+
+def _agent_principal(agent, market):
+    """Duck typing for Agent as User (AGENTE role, scoped to its assigned market)."""
+    # AGENTE role - distinct from FUNCIONARIO, scoped to market
+    agent.role = type('obj', (object,), {'value': 'AGENTE'})
+    agent.username = agent.agent_code
+    agent.email = f"{agent.agent_code}@agent.local"
+    
+    # Populate scope from assigned market
+    if market:
+        agent.scope_province = market.province
+        agent.scope_district = market.district
+        agent.scope_market_id = market.id  # Market-level scope
+    else:
+        # Safety fallback: No market = No access
+        agent.scope_province = None
+        agent.scope_district = None
+        agent.scope_market_id = None
+    return agent
+
+
+async def _resolve_typed_principal(payload: dict, db: AsyncSession):
+    """
+    Resolve a typed token with one primary-key lookup (market joined in for
+    agents/merchants so scope is always current). Returns None if the
+    principal no longer exists or its token_version moved past the token's.
+    """
+    from app.models.merchant import Merchant
+    from app.models.agent import Agent
+    from app.models.market import Market
+    
+    principal_type = payload.get("typ")
+    principal_id = payload.get("pid")
+    
+    if principal_type == "user":
+        result = await db.execute(select(User).where(User.id == principal_id))
+        row = (result.scalar_one_or_none(), None)
+    elif principal_type == "merchant":
+        result = await db.execute(
+            select(Merchant, Market)
+            .outerjoin(Market, Merchant.market_id == Market.id)
+            .where(Merchant.id == principal_id)
+        )
+        row = result.first() or (None, None)
+    elif principal_type == "agent":
+        result = await db.execute(
+            select(Agent, Market)
+            .outerjoin(Market, Agent.assigned_market_id == Market.id)
+            .where(Agent.id == principal_id)
+        )
+        row = result.first() or (None, None)
+    else:
+        return None
+    
+    principal, market = row
+    if principal is None:
+        return None
+    
+    # Revoked: status/role/scope/credentials changed since the token was issued
+    if (principal.token_version or 0) != payload.get("ver", 0):
+        return None
+    
+    if principal_type == "merchant":
+        return _merchant_principal(principal, market)
+    if principal_type == "agent":
+        return _agent_principal(principal, market)
+    return principal
+
+
+async def _resolve_principal(identifier: str, db: AsyncSession):
+    """Resolve a legacy token subject to a User, Merchant or Agent (duck-typed as User)."""
     # Check User (Username OR Email)
     result = await db.execute(select(User).where(or_(User.email == identifier, User.username == identifier)))
     user = result.scalars().first()
@@ -40,16 +150,8 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: As
     if user:
         return user
         
-    # If not User, check Merchant (UID) - reusing identifier
-    # Note: Merchants login with UID as 'username', which becomes 'sub'
-    # We need to query Merchant model too if User not found, 
-    # BUT `get_current_user` return type hint is `User`.
-    # As per previous code, it only returned User. 
-    # If this token is for a Merchant, how does it work?
-    # Based on `login_for_access_token`, Merchants get a token too.
-    # We should probably check Merchant table too.
-    
     # If not User, check Merchant (UID)
+    # Note: Merchants login with UID as 'username', which becomes 'sub'
     from app.models.merchant import Merchant
     result_merchant = await db.execute(select(Merchant).where(Merchant.nfc_uid == identifier))
     merchant = result_merchant.scalars().first()
@@ -58,17 +160,7 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: As
          # Fetch Merchant's Market to set Scope (fix for Audit Logs location)
          from app.models.market import Market
          market_result = await db.execute(select(Market).where(Market.id == merchant.market_id))
-         market = market_result.scalar_one_or_none()
-
-         if market:
-             merchant.scope_province = market.province
-             merchant.scope_district = market.district
-             merchant.scope_market_id = market.id
-         
-         # Duck typing for Merchant as User
-         merchant.role = type('obj', (object,), {'value': 'MERCHANT'})
-         merchant.username = merchant.nfc_uid
-         return merchant
+         return _merchant_principal(merchant, market_result.scalar_one_or_none())
 
     # If not Merchant, check Agent (Agent Code)
     from app.models.agent import Agent
@@ -79,27 +171,9 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: As
          # Fetch Agent's Market to set Scope
          from app.models.market import Market
          market_result = await db.execute(select(Market).where(Market.id == agent.assigned_market_id))
-         market = market_result.scalar_one_or_none()
+         return _agent_principal(agent, market_result.scalar_one_or_none())
 
-         # AGENTE role - distinct from FUNCIONARIO, scoped to market
-         agent.role = type('obj', (object,), {'value': 'AGENTE'})
-         agent.username = agent.agent_code
-         agent.email = f"{agent.agent_code}@agent.local"
-         
-         # Populate scope from assigned market
-         if market:
-             agent.scope_province = market.province
-             agent.scope_district = market.district
-             agent.scope_market_id = market.id  # Market-level scope
-         else:
-             # Safety fallback: No market = No access
-             agent.scope_province = None
-             agent.scope_district = None
-             agent.scope_market_id = None
-              
-         return agent
-
-    raise credentials_exception
+    return None
 
 async def require_admin(current_user = Depends(get_current_user)):
     """Dependency that requires user to be ADMIN"""
@@ -137,7 +211,8 @@ async def login_for_access_token(
                 db, request, "LOGIN_FAILED", 
                 f"Failed login attempt for user: {identifier}", 
                 severity=Severity.LOW, 
-                actor=user
+                actor=user,
+                deferred=True
             )
             # Need to commit the log even if we raise exception? 
             # Ideally yes, but depends on transaction management. 
@@ -159,7 +234,8 @@ async def login_for_access_token(
              await AuditService.log_audit(
                 db, user, "LOGIN_BLOCKED", "USER", 
                 "User account is not active", severity=Severity.MEDIUM, event_type=EventType.ACCESS_VIOLATION,
-                request=request
+                request=request,
+                deferred=True
             )
              await db.commit()
              raise HTTPException(
@@ -175,6 +251,10 @@ async def login_for_access_token(
         # Use username as primary if available, else email
         identifier = user.username if user.username else user.email
 
+        principal_type = "user"
+        principal = user
+        scope = {"province": user.scope_province, "district": user.scope_district, "market_id": None}
+
         # Update Last Login
         user.last_login_at = func.now()
         
@@ -184,7 +264,8 @@ async def login_for_access_token(
             f"User logged in successfully via API", 
             entity_name=user.full_name,
             severity=Severity.INFO,
-            request=request
+            request=request,
+            deferred=True
         )
         
         await db.commit()
@@ -199,7 +280,8 @@ async def login_for_access_token(
              await AuditService.log_security_event(
                 db, request, "LOGIN_FAILED", 
                 f"Failed login attempt for unknown ID or Merchant: {form_data.username}", 
-                severity=Severity.LOW
+                severity=Severity.LOW,
+                deferred=True
             )
              await db.commit()
              
@@ -224,6 +306,17 @@ async def login_for_access_token(
         
         identifier = merchant.nfc_uid
         
+        from app.models.market import Market
+        market_result = await db.execute(select(Market).where(Market.id == merchant.market_id))
+        market = market_result.scalar_one_or_none()
+        principal_type = "merchant"
+        principal = merchant
+        scope = {
+            "province": market.province if market else None,
+            "district": market.district if market else None,
+            "market_id": merchant.market_id,
+        }
+        
         # Log Success Merchant
         await AuditService.log_audit(
             db, None, "LOGIN_SUCCESS", "MERCHANT", 
@@ -232,12 +325,14 @@ async def login_for_access_token(
             entity_name=merchant.full_name,
             actor_type_override=ActorType.MERCHANT,
             severity=Severity.INFO,
-            request=request
+            request=request,
+            deferred=True
         )
 
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = AuthService.create_access_token(
-        data={"sub": identifier, "role": role}, expires_delta=access_token_expires
+    access_token = AuthService.create_principal_token(
+        principal_type, principal, role, identifier,
+        scope=scope, expires_delta=access_token_expires
     )
     
     # Filter out internal SQLAlchemy state
@@ -298,7 +393,8 @@ async def pos_device_login(
         await AuditService.log_security_event(
             db, request, "POS_LOGIN_UNREGISTERED_DEVICE",
             f"Login attempt from unregistered device: {device_serial}",
-            severity=Severity.HIGH
+            severity=Severity.HIGH,
+            deferred=True
         )
         await db.commit()
         raise HTTPException(
@@ -313,7 +409,8 @@ async def pos_device_login(
             f"Login attempt from {device.status.value} device: {device_serial}",
             severity=Severity.MEDIUM,
             actor_province=device.province,
-            actor_district=device.district
+            actor_district=device.district,
+            deferred=True
         )
         await db.commit()
         raise HTTPException(
@@ -333,7 +430,8 @@ async def pos_device_login(
             f"Failed agent login on device {device_serial}: {credentials.username}",
             severity=Severity.MEDIUM,
             actor_province=device.province,
-            actor_district=device.district
+            actor_district=device.district,
+            deferred=True
         )
         await db.commit()
         raise HTTPException(
@@ -356,7 +454,8 @@ async def pos_device_login(
             f"Login attempt on unassigned device {device_serial} by agent {agent.agent_code}",
             severity=Severity.MEDIUM,
             actor_province=device.province,
-            actor_district=device.district
+            actor_district=device.district,
+            deferred=True
         )
         await db.commit()
         raise HTTPException(
@@ -370,7 +469,8 @@ async def pos_device_login(
             f"Agent {agent.agent_code} (ID:{agent.id}) tried to login on device assigned to agent ID:{device.assigned_agent_id}",
             severity=Severity.HIGH,
             actor_province=device.province,
-            actor_district=device.district
+            actor_district=device.district,
+            deferred=True
         )
         await db.commit()
         raise HTTPException(
@@ -421,15 +521,22 @@ async def pos_device_login(
         severity=Severity.INFO,
         request=request,
         actor_province=device.province,
-        actor_district=device.district
+        actor_district=device.district,
+        deferred=True
     )
     await db.commit()
     
     # 10. Generate Token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = AuthService.create_access_token(
-        data={"sub": agent.agent_code, "role": "AGENTE", "device_id": device.id},
-        expires_delta=access_token_expires
+    access_token = AuthService.create_principal_token(
+        "agent", agent, "AGENTE", agent.agent_code,
+        scope={
+            "province": agent_data["scope_province"],
+            "district": agent_data["scope_district"],
+            "market_id": agent_data["scope_market_id"],
+        },
+        expires_delta=access_token_expires,
+        extra_claims={"device_id": device.id}
     )
     
     return {
@@ -0,0 +1,191 @@
+"""
+Background exports: queue a large export, poll its progress, download the file.
+
+    POST /exports/transactions     -> 202 + job (same filters as GET /transactions/export)
+    POST /exports/audit-logs       -> 202 + job (same filters as GET /audit-logs/export)
+    GET  /exports/{job_uuid}       -> status / progress
+    GET  /exports/{job_uuid}/download  -> the file (supports Range: resumable)
+
+The export itself runs in the export worker (see export_job_service), not in
+the request.
+"""
+import os
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, desc
+from typing import List, Optional
+from datetime import date, datetime
+
+from app.database import get_db
+from app.models import ExportJob as ExportJobModel, ExportKind, ExportJobStatus
+from app.models.audit_log import ActorType, Severity, EventType
+from app.models.user import User as UserModel
+from app.schemas.export_job import ExportJob
+from app.routers.auth import get_current_user
+from app.services.export_service import TRANSACTION_EXPORT_ROLES, AUDIT_EXPORT_ROLES
+from app.services.export_job_service import create_export_job, requester_type
+from app.utils.columnar_stream import COLUMNAR_FORMATS, require_pyarrow
+
+router = APIRouter(prefix="/exports", tags=["Exports"])
+
+
+def _queued_response(request: Request, response: Response, job: ExportJobModel) -> ExportJobModel:
+    # Status URL to poll
+    response.headers["Location"] = request.url_for("get_export", job_uuid=job.job_uuid).path
+    return job
+
+
+@router.post("/transactions", response_model=ExportJob, status_code=status.HTTP_202_ACCEPTED)
+async def queue_transactions_export(
+    request: Request,
+    response: Response,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    tx_status: Optional[str] = Query(None, alias="status"),
+    payment_method: Optional[str] = None,
+    province: Optional[str] = None,
+    district: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, description="Maximum rows (default: no limit)"),
+    gzip: bool = Query(False, description="Write .csv.gz (CSV only)"),
+    export_format: str = Query("csv", alias="format", pattern="^(csv|parquet|arrow)$"),
+    db: AsyncSession = Depends(get_db),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """Queue a transactions export (filters and role scoping as /transactions/export)."""
+    if current_user.role.value not in TRANSACTION_EXPORT_ROLES:
+        raise HTTPException(
+            status_code=403,
+            detail="Access denied. Only authorized users can export transactions."
+        )
+    if export_format != "csv":
+        require_pyarrow()
+
+    job = await create_export_job(
+        db, ExportKind.TRANSACTIONS,
+        {
+            "start_date": start_date,
+            "end_date": end_date,
+            "status": tx_status,
+            "payment_method": payment_method,
+            "province": province,
+            "district": district,
+            "limit": limit,
+        },
+        current_user, export_format=export_format, gzip=gzip
+    )
+    return _queued_response(request, response, job)
+
+
+@router.post("/audit-logs", response_model=ExportJob, status_code=status.HTTP_202_ACCEPTED)
+async def queue_audit_logs_export(
+    request: Request,
+    response: Response,
+    search: Optional[str] = None,
+    severity: Optional[Severity] = None,
+    event_type: Optional[EventType] = None,
+    actor_type: Optional[ActorType] = None,
+    action: Optional[str] = None,
+    entity: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    actor_id: Optional[int] = None,
+    gzip: bool = Query(False, description="Write .csv.gz (CSV only)"),
+    export_format: str = Query("csv", alias="format", pattern="^(csv|parquet|arrow)$"),
+    db: AsyncSession = Depends(get_db),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """Queue an audit log export (filters as /audit-logs/export)."""
+    if current_user.role.value not in AUDIT_EXPORT_ROLES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
+    if export_format != "csv":
+        require_pyarrow()
+
+    job = await create_export_job(
+        db, ExportKind.AUDIT_LOGS,
+        {
+            "search": search,
+            "severity": severity,
+            "event_type": event_type,
+            "actor_type": actor_type,
+            "action": action,
+            "entity": entity,
+            "start_date": start_date,
+            "end_date": end_date,
+            "actor_id": actor_id,
+        },
+        current_user, export_format=export_format, gzip=gzip
+    )
+    return _queued_response(request, response, job)
+
+
+@router.get("/", response_model=List[ExportJob])
+async def list_my_exports(
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """Export jobs of the current user, newest first."""
+    result = await db.execute(
+        select(ExportJobModel)
+        .where(
+            ExportJobModel.requested_by_type == requester_type(current_user),
+            ExportJobModel.requested_by_user_id == current_user.id
+        )
+        .order_by(desc(ExportJobModel.id))
+        .limit(limit)
+    )
+    return result.scalars().all()
+
+
+async def _get_visible_job(db: AsyncSession, job_uuid: str, current_user: UserModel) -> ExportJobModel:
+    job = (await db.execute(
+        select(ExportJobModel).where(ExportJobModel.job_uuid == job_uuid)
+    )).scalar_one_or_none()
+    # Only the requester (or an ADMIN) sees a job: its file carries their jurisdiction's data.
+    # Users, agents and merchants have separate id sequences, so the type must match too.
+    is_owner = job is not None and (
+        job.requested_by_type == requester_type(current_user)
+        and job.requested_by_user_id == current_user.id
+    )
+    is_admin = requester_type(current_user) == "User" and current_user.role.value == "ADMIN"
+    if job is None or not (is_owner or is_admin):
+        raise HTTPException(status_code=404, detail="Export not found")
+    return job
+
+
+@router.get("/{job_uuid}", response_model=ExportJob)
+async def get_export(
+    job_uuid: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """Status and progress of an export job."""
+    return await _get_visible_job(db, job_uuid, current_user)
+
+
+@router.get("/{job_uuid}/download", response_class=FileResponse)
+async def download_export(
+    job_uuid: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """
+    Download a finished export. Supports Range / If-Range requests, so an
+    interrupted download can be resumed (e.g. curl -C -).
+    """
+    job = await _get_visible_job(db, job_uuid, current_user)
+    if job.status == ExportJobStatus.EXPIRED:
+        raise HTTPException(status_code=410, detail="Export expired")
+    if job.status != ExportJobStatus.DONE:
+        raise HTTPException(status_code=409, detail=f"Export not ready (status: {job.status.value})")
+    if not job.file_path or not os.path.isfile(job.file_path):
+        raise HTTPException(status_code=410, detail="Export file no longer available")
+
+    if job.gzip:
+        media_type = "application/gzip"
+    elif job.export_format in COLUMNAR_FORMATS:
+        media_type = COLUMNAR_FORMATS[job.export_format][1]
+    else:
+        media_type = "text/csv"
+    return FileResponse(job.file_path, media_type=media_type, filename=job.file_name)
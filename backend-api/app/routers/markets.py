@@ -6,13 +6,14 @@ from typing import List
 from datetime import datetime
 from app.database import get_db
 from app.models import Market as MarketModel
-from app.models import Merchant, Agent, POSDevice, Transaction
+from app.models import Merchant, Agent, POSDevice, Transaction, DailyRevenueRollup
 from app.schemas import Market, MarketCreate, MarketUpdate
 
 router = APIRouter(prefix="/markets", tags=["Markets"])
 
 from app.routers.auth import get_current_user
 from app.models.user import User as UserModel
+from app.utils.date_range import date_range, on_day
 
 @router.get("/", response_model=List[Market])
 async def list_markets(
@@ -43,35 +44,33 @@ async def list_markets(
         if current_user.scope_province:
             query = query.where(MarketModel.province == current_user.scope_province)
     
-    # We need to compute counts for the list view.
-    # To be efficient, we can use subqueries or just load basic info.
-    # For now, let's fetch markets normaly and maybe just let the frontend separate fetch?
-    # NO, requirements say "Listar quantos comerciantes existem".
-    # Let's try to attach counts.
-    
-    # Simple approach: Fetch markets, then loop (N+1 but simple) or complex Group By.
-    # Given the scale (hundreds of markets?), aggregation is better.
-    
-    # For now, keeping it simple: just list markets. The user can view details for heavy stats.
-    # OR, we can add simple counts.
+    # Counts for the list view: grouped subqueries outer-joined in the same
+    # statement (one query for any page size)
+    merchants = (
+        select(Merchant.market_id, func.count(Merchant.id).label("merchants_count"))
+        .group_by(Merchant.market_id)
+        .subquery()
+    )
+    agents = (
+        select(Agent.assigned_market_id, func.count(Agent.id).label("agents_count"))
+        .where(Agent.assigned_market_id.is_not(None))
+        .group_by(Agent.assigned_market_id)
+        .subquery()
+    )
+    query = (
+        query.add_columns(merchants.c.merchants_count, agents.c.agents_count)
+        .outerjoin(merchants, merchants.c.market_id == MarketModel.id)
+        .outerjoin(agents, agents.c.assigned_market_id == MarketModel.id)
+        .order_by(MarketModel.id)
+    )
     
-    # Let's iterate and add counts effectively.
     result = await db.execute(query.offset(skip).limit(limit))
-    markets = result.scalars().all()
     
-    # Enrich with counts (looping for now, optimize later if slow)
-    for m in markets:
-        # Merchants
-        m_count = await db.scalar(
-            select(func.count(Merchant.id)).where(Merchant.market_id == m.id)
-        )
-        # Agents
-        a_count = await db.scalar(
-            select(func.count(Agent.id)).where(Agent.assigned_market_id == m.id)
-        )
-        
-        m.merchants_count = m_count or 0
-        m.agents_count = a_count or 0
+    markets = []
+    for m, merchants_count, agents_count in result.all():
+        m.merchants_count = merchants_count or 0
+        m.agents_count = agents_count or 0
+        markets.append(m)
         
     return markets
 
@@ -274,7 +273,7 @@ async def get_market(
         .join(Merchant, Transaction.merchant_id == Merchant.id)
         .where(and_(
             Merchant.market_id == market_id,
-            func.date(Transaction.created_at) == today,
+            *on_day(Transaction.created_at, today),
             Transaction.status == 'SUCESSO'
         ))
     )
@@ -284,7 +283,7 @@ async def get_market(
         .join(Merchant, Transaction.merchant_id == Merchant.id)
         .where(and_(
             Merchant.market_id == market_id,
-            func.date(Transaction.created_at) >= month_start,
+            *date_range(Transaction.created_at, month_start),
             Transaction.status == 'SUCESSO'
         ))
     )
@@ -485,21 +484,19 @@ async def get_market_revenue_chart(
         for n in range(int((end_date - start_date).days) + 1):
             yield start_date + timedelta(n)
 
+    # Pre-aggregated per day (daily_revenue_rollup)
     stmt = (
         select(
-            func.date(Transaction.created_at).label("date"),
-            func.sum(Transaction.amount).label("revenue")
+            DailyRevenueRollup.day.label("date"),
+            func.sum(DailyRevenueRollup.total_amount).label("revenue")
         )
-        .join(Merchant, Transaction.merchant_id == Merchant.id)
         .where(
-            and_(
-                Merchant.market_id == market_id,
-                func.date(Transaction.created_at) >= start_date,
-                Transaction.status == 'SUCESSO'
-            )
+            DailyRevenueRollup.market_id == market_id,
+            DailyRevenueRollup.day >= start_date,
+            DailyRevenueRollup.status == 'SUCESSO'
         )
-        .group_by(func.date(Transaction.created_at))
-        .order_by("date")
+        .group_by(DailyRevenueRollup.day)
+        .order_by(DailyRevenueRollup.day)
     )
     
     result = await db.execute(stmt)
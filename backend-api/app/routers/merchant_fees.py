@@ -2,12 +2,12 @@
 Merchant Fee Management API
 Endpoints para gerenciar taxas diárias dos comerciantes (10 MT/dia)
 """
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Body
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Body, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
-from typing import List
+from typing import List, Optional
 from datetime import date, datetime
-import math
 
 from app.database import get_db
 from app.models import Merchant, MerchantFeePayment, PaymentStatus
@@ -18,6 +18,9 @@ from app.schemas.merchant_fee import (
 )
 from app.schemas.merchant import MerchantResponse
 from app.routers.auth import get_current_user
+from app.utils.date_range import date_range, on_day
+from app.utils.csv_stream import csv_response, iter_rows_keyset
+from app.utils.columnar_stream import columnar_response
 
 router = APIRouter(prefix="/merchant-fees", tags=["Merchant Fees"])
 
@@ -73,34 +76,12 @@ async def record_fee_payment(
     db.add(fee_payment)
     await db.flush() # Ensure payment is counted in sum
     
-    # Recalculate Status check (Cumulative)
-    today = date.today()
-    reg_date = merchant.registered_at.date() if merchant.registered_at else today
-    billing_start_date = merchant.billing_start_date or reg_date
-    
-    if billing_start_date > today:
-        days_billed = 0
-    else:
-        days_billed = (today - billing_start_date).days + 1
-            
-    expected_amount = days_billed * DAILY_FEE_AMOUNT
-    
-    # Get total paid including this new payment
-    payment_result = await db.execute(
-        select(func.sum(MerchantFeePayment.amount))
-        .where(MerchantFeePayment.merchant_id == merchant_id)
-    )
-    total_paid = float(payment_result.scalar() or 0.0)
-    
-    balance = total_paid - expected_amount
-    
-    if balance >= 0:
-        merchant.payment_status = PaymentStatus.REGULAR
-        merchant.days_overdue = 0
-    else:
-        merchant.payment_status = PaymentStatus.IRREGULAR
-        overdue_amount = abs(balance)
-        merchant.days_overdue = math.ceil(overdue_amount / DAILY_FEE_AMOUNT)
+    # Update ledger + status (Cumulative: FeePayments + Transactions SUCESSO)
+    from app.services.fee_service import apply_fee_ledger_delta, validate_merchant_payment_status
+    await apply_fee_ledger_delta(db, merchant_id, fee_payment.amount, merchant)
+    if merchant.fee_total_paid is None:
+        # Ledger not built yet for this merchant - recompute from history
+        await validate_merchant_payment_status(merchant, db)
     
     merchant.last_fee_payment_date = date.today()
     
@@ -168,8 +149,15 @@ async def list_irregular_merchants(
         .limit(limit)
     )
     
+    rows = result.all()
+    
+    # Validação em lote (dias em atraso actualizados antes de listar)
+    from app.services.fee_service import validate_merchants_payment_status
+    if await validate_merchants_payment_status([row[0] for row in rows], db):
+        await db.commit()
+    
     merchants = []
-    for row in result:
+    for row in rows:
         merchant = row[0]
         market_name = row[1]
         merchants.append(IrregularMerchantResponse(
@@ -209,7 +197,7 @@ async def get_fee_summary(
     today = date.today()
     today_result = await db.execute(
         select(func.sum(MerchantFeePayment.amount))
-        .where(func.date(MerchantFeePayment.payment_date) == today)
+        .where(*on_day(MerchantFeePayment.payment_date, today))
     )
     total_collected_today = today_result.scalar() or 0.0
     
@@ -230,6 +218,93 @@ async def get_fee_summary(
     )
 
 
+# Colunas tipadas para exportação Parquet / Arrow: (coluna, tipo, label da query)
+FEE_PAYMENT_EXPORT_COLUMNS = [
+    ("id", "int64", "id"),
+    ("payment_date", "timestamp", "payment_date"),
+    ("amount", "decimal", "amount"),
+    ("payment_method", "string", "payment_method"),
+    ("merchant_id", "int64", "merchant_id"),
+    ("merchant_name", "string", "merchant_name"),
+    ("market", "string", "market_name"),
+    ("province", "string", "market_province"),
+    ("district", "string", "market_district"),
+    ("paid_by", "string", "paid_by_name"),
+    ("notes", "string", "notes"),
+]
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_fee_payments(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    export_format: str = Query("csv", alias="format", pattern="^(csv|parquet|arrow)$"),
+    db: AsyncSession = Depends(get_db),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """Exportar pagamentos de taxa (CSV, Parquet ou Arrow IPC), em streaming."""
+    from app.models import Market
+    
+    allowed_roles = ["ADMIN", "AUDITOR", "SUPERVISOR", "FUNCIONARIO"]
+    user_role = current_user.role.value
+    if user_role not in allowed_roles:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    query = (
+        select(
+            MerchantFeePayment.id,
+            MerchantFeePayment.payment_date,
+            MerchantFeePayment.amount,
+            MerchantFeePayment.payment_method,
+            MerchantFeePayment.merchant_id,
+            Merchant.full_name.label("merchant_name"),
+            Market.name.label("market_name"),
+            Market.province.label("market_province"),
+            Market.district.label("market_district"),
+            UserModel.full_name.label("paid_by_name"),
+            MerchantFeePayment.notes,
+        )
+        .join(Merchant, MerchantFeePayment.merchant_id == Merchant.id)
+        .join(Market, Merchant.market_id == Market.id)
+        .outerjoin(UserModel, MerchantFeePayment.paid_by_user_id == UserModel.id)
+        .where(*date_range(MerchantFeePayment.payment_date, start_date, end_date))
+    )
+    
+    # Âmbito geográfico (como na exportação de transações)
+    if user_role == "SUPERVISOR" and current_user.scope_district:
+        query = query.where(Market.district == current_user.scope_district)
+    elif user_role == "FUNCIONARIO" and current_user.scope_province:
+        query = query.where(Market.province == current_user.scope_province)
+    
+    filename = f"taxas_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    rows = iter_rows_keyset(query, MerchantFeePayment.payment_date, MerchantFeePayment.id)
+    
+    if export_format != "csv":
+        return columnar_response(rows, FEE_PAYMENT_EXPORT_COLUMNS, filename, export_format)
+    
+    header = [
+        "ID", "Data/Hora", "Valor (MZN)", "Método Pagamento", "ID Comerciante",
+        "Comerciante", "Mercado", "Província", "Distrito", "Registado por", "Observações"
+    ]
+    
+    def format_row(row):
+        return [
+            row.id,
+            row.payment_date.isoformat() if row.payment_date else "",
+            f"{row.amount:.2f}",
+            row.payment_method or "",
+            row.merchant_id,
+            row.merchant_name or "",
+            row.market_name or "",
+            row.market_province or "",
+            row.market_district or "",
+            row.paid_by_name or "",
+            row.notes or ""
+        ]
+    
+    return csv_response(rows, header, format_row, f"{filename}.csv")
+
+
 @router.get("/{merchant_id}/history", response_model=List[FeePaymentResponse])
 async def get_fee_history(
     merchant_id: int,
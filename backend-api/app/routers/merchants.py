@@ -87,23 +87,17 @@ async def list_merchants(
     result = await db.execute(query.offset(skip).limit(limit))
     merchants = result.scalars().all()
     
-    # Real-time Fee Validation
-    from app.services.fee_service import validate_merchant_payment_status
-    validated_merchants = []
-    for m in merchants:
-        # Validate effectively updates the object status if needed
-        # We await it sequentially (or gather)
-        # Sequential is safer for DB connection limit with many items, 
-        # though slower. For page size 100 it might be noticeable.
-        # But for correctness requested by user, we do it.
-        try:
-            val_m = await validate_merchant_payment_status(m, db)
-            validated_merchants.append(val_m)
-        except Exception:
-            # Fallback to existing if calc fails (shouldn't happen)
-            validated_merchants.append(m)
+    # Real-time Fee Validation (batched: one grouped query per source table
+    # for the whole page, status changes written in a single flush)
+    from app.services.fee_service import validate_merchants_payment_status
+    try:
+        if await validate_merchants_payment_status(merchants, db):
+            await db.commit()
+    except Exception:
+        # Fallback to existing status if calc fails (shouldn't happen)
+        pass
             
-    return validated_merchants
+    return merchants
 
 @router.post("/", response_model=Merchant, status_code=status.HTTP_201_CREATED)
 async def create_merchant(
@@ -1,17 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, inspect
 from typing import Optional
 from decimal import Decimal
 from pydantic import BaseModel, Field
-from datetime import datetime
+from datetime import datetime, timedelta
 
+from app.config import settings
 from app.database import get_db
 from app.routers.auth import get_current_user
 from app.models import User as UserModel, Merchant, POSDevice, Market, Transaction, TransactionStatus, PaymentMethod
 from app.services.payment_service import PaymentService
 from app.services.audit_service import AuditService
 from app.models.audit_log import EventType, Severity
+import asyncio
 import uuid
 import logging
 
@@ -32,12 +35,11 @@ class PaymentRequest(BaseModel):
     offline_transaction_uuid: Optional[str] = Field(default=None, description="UUID generated on POS device")
     offline_payment_reference: Optional[str] = Field(default=None, description="Reference generated on POS device (PS-YYYYMMDD-XXXXXX)")
 
-@router.post("/", status_code=status.HTTP_201_CREATED)
-async def initiate_payment(
-    payment: PaymentRequest,
-    db: AsyncSession = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
-):
+async def _create_pending_transaction(payment: PaymentRequest, db: AsyncSession, current_user):
+    """
+    Validate role, merchant, jurisdiction and POS, then record the PENDING
+    transaction (committed). Shared by the sync and async payment endpoints.
+    """
     # 1. Security & Role Check
     allowed_roles = ["FUNCIONARIO", "AGENTE"]
     if current_user.role.value not in allowed_roles:
@@ -45,7 +47,8 @@ async def initiate_payment(
             db, current_user, "PAYMENT_UNAUTHORIZED", "PAYMENT",
             f"Unauthorized payment attempt by {current_user.role}",
             severity=Severity.HIGH,
-            event_type=EventType.SECURITY
+            event_type=EventType.SECURITY,
+            deferred=True
         )
         raise HTTPException(status_code=403, detail="Only FUNCIONARIO or AGENTE can perform payments")
     
@@ -61,7 +64,8 @@ async def initiate_payment(
             db, current_user, "PAYMENT_BLOCKED", "PAYMENT",
             f"Payment blocked for {merchant.status} merchant {merchant.id}",
             severity=Severity.HIGH,
-            event_type=EventType.SECURITY
+            event_type=EventType.SECURITY,
+            deferred=True
         )
          raise HTTPException(status_code=403, detail=f"Merchant is {merchant.status}")
     
@@ -80,7 +84,8 @@ async def initiate_payment(
                     db, current_user, "PAYMENT_JURISDICTION_FAIL", "PAYMENT",
                     f"Agent attempted to charge merchant {merchant.id} in market {merchant.market_id} (Agent market: {current_user.scope_market_id})",
                     severity=Severity.HIGH,
-                    event_type=EventType.SECURITY
+                    event_type=EventType.SECURITY,
+                    deferred=True
                 )
                 raise HTTPException(status_code=403, detail="Merchant outside your assigned market")
         else:
@@ -94,7 +99,8 @@ async def initiate_payment(
                 db, current_user, "PAYMENT_JURISDICTION_FAIL", "PAYMENT",
                 f"Attempt to charge merchant {merchant.id} in {market.province} (User scope: {current_user.scope_province})",
                 severity=Severity.HIGH,
-                event_type=EventType.SECURITY
+                event_type=EventType.SECURITY,
+                deferred=True
             )
              raise HTTPException(status_code=403, detail="Merchant outside your jurisdiction")
         
@@ -119,12 +125,10 @@ async def initiate_payment(
     await AuditService.log_audit(
         db, current_user, "PAYMENT_ATTEMPT", "TRANSACTION",
         f"Initiating {payment.payment_method} for Merchant {merchant.full_name} ({payment.amount} MZN)",
-        before_data=payment.model_dump(mode='json')
+        before_data=payment.model_dump(mode='json'),
+        deferred=True
     )
     
-    # 5. Call Payment Service
-    service = PaymentService()
-    
     # Parse offline created_at if provided
     tx_created_at = None
     if payment.offline_created_at:
@@ -148,7 +152,8 @@ async def initiate_payment(
         status=TransactionStatus.PENDING,
         payment_reference=reference, # Our reference
         mpesa_reference=None, # Filled later
-        province=market.province, # Snapshot location
+        market_id=merchant.market_id, # Snapshot location
+        province=market.province,
         district=market.district,
         # Offline Audit Fields - preserve client-generated values
         offline_transaction_uuid=payment.offline_transaction_uuid,
@@ -160,63 +165,118 @@ async def initiate_payment(
     if tx_created_at:
         transaction.created_at = tx_created_at
     db.add(transaction)
+    await db.flush()
+    from app.services.revenue_rollup_service import record_transactions
+    await record_transactions(db, [transaction.id])
     await db.commit() # Commit to get ID and ensure ID is reserved
     
-    try:
-        # EXECUTE PAYMENT
-        # Determine strategy based on method
-        if payment.payment_method == PaymentMethod.MPESA:
-            result = service.process_c2b_payment(
-                amount=float(payment.amount),
-                reference=reference,
-                customer_msisdn=payment.mpesa_number,
-                third_party_reference=reference
-            )
-        elif payment.payment_method == PaymentMethod.DINHEIRO:
-            # Cash Payment - Immediate Success, No SDK
-            result = {
-                "success": True,
-                "body": {
-                    "output_TransactionID": "CASH-" + tx_uuid[:8].upper(),
-                    "output_ResponseDesc": "Pagamento em Dinheiro Registado"
-                }
-            }
-        elif payment.payment_method in [PaymentMethod.EMOLA, PaymentMethod.MKESH]:
-             # Placeholder for other mobile wallets
-             # For now, let's Fail safely telling it's not integrated yet (or Mock if user wants, but request was specific to Cash)
-             result = {"success": False, "error": f"{payment.payment_method} integration not active"}
-        else:
-             result = {"success": False, "error": "Invalid Payment Method"}
+    return transaction, merchant, reference
+
 
+async def _apply_payment_result(db: AsyncSession, transaction: Transaction, merchant: Merchant, result: dict, current_user):
+    """Apply a gateway (or cash) result to the transaction, fee ledger and audit log. Caller commits."""
+    from app.services.revenue_rollup_service import record_transactions, retract_transactions
+    reference = transaction.payment_reference
+    # Move the transaction out of its PENDING rollup bucket (re-added with the final status below)
+    await retract_transactions(db, [transaction.id])
+    
+    # Update Transaction with Response
+    transaction.response_payload = result
+    
+    if result.get("success"):
+        transaction.status = TransactionStatus.SUCESSO
+        # Extract M-Pesa ConversationID or TransactionID if available in body
+        body = result.get("body", {})
+        mpesa_ref = body.get("output_TransactionID") or body.get("input_TransactionReference")
+        transaction.mpesa_reference = mpesa_ref
         
-        # Update Transaction with Response
-        transaction.response_payload = result
+        # Update fee ledger (and persisted fee status) for the merchant
+        from app.services.fee_service import apply_fee_ledger_delta
+        await apply_fee_ledger_delta(db, merchant.id, transaction.amount, merchant)
         
-        if result.get("success"):
-            transaction.status = TransactionStatus.SUCESSO
-            # Extract M-Pesa ConversationID or TransactionID if available in body
-            body = result.get("body", {})
-            mpesa_ref = body.get("output_TransactionID") or body.get("input_TransactionReference")
-            transaction.mpesa_reference = mpesa_ref
-            
-            # Update Balances (Implementation pending Balance model)
-            
-            # Log Success
-            await AuditService.log_audit(
-                db, current_user, "PAYMENT_SUCCESS", "TRANSACTION",
-                f"Payment successful: {reference} - {payment.amount} MZN",
-                entity_id=transaction.id,
-                severity=Severity.INFO
-            )
-            
-        else:
-            transaction.status = TransactionStatus.FALHOU
-            await AuditService.log_audit(
-                db, current_user, "PAYMENT_FAILED", "TRANSACTION",
-                f"Payment failed: {result.get('error')}",
-                entity_id=transaction.id,
-                severity=Severity.MEDIUM
-            )
+        # Hourly chart (applied on commit), bucketed by created_at like the
+        # resync and the reconciliation job. created_at is a server default:
+        # load it if the INSERT did not return it.
+        if "created_at" in inspect(transaction).unloaded:
+            await db.refresh(transaction, attribute_names=["created_at"])
+        from app.services.hourly_histogram import queue_hourly_change
+        queue_hourly_change(db, transaction.created_at, transaction.province, transaction.district)
+        
+        # Update Balances (Implementation pending Balance model)
+        
+        # Log Success
+        await AuditService.log_audit(
+            db, current_user, "PAYMENT_SUCCESS", "TRANSACTION",
+            f"Payment successful: {reference} - {transaction.amount} MZN",
+            entity_id=transaction.id,
+            severity=Severity.INFO,
+            deferred=True
+        )
+        
+    elif result.get("timeout"):
+        # Gateway did not answer in time: the payment may still complete,
+        # keep it distinguishable from a definite failure
+        transaction.status = TransactionStatus.TIMEOUT
+        await AuditService.log_audit(
+            db, current_user, "PAYMENT_TIMEOUT", "TRANSACTION",
+            f"Payment gateway timeout: {reference}",
+            entity_id=transaction.id,
+            severity=Severity.MEDIUM,
+            deferred=True
+        )
+        
+    else:
+        transaction.status = TransactionStatus.FALHOU
+        await AuditService.log_audit(
+            db, current_user, "PAYMENT_FAILED", "TRANSACTION",
+            f"Payment failed: {result.get('error')}",
+            entity_id=transaction.id,
+            severity=Severity.MEDIUM,
+            deferred=True
+        )
+    
+    await record_transactions(db, [transaction.id])
+
+
+async def _execute_payment(payment: PaymentRequest, transaction: Transaction) -> dict:
+    """Run the payment for its method: M-Pesa gateway call, cash, or not integrated."""
+    # Determine strategy based on method
+    if payment.payment_method == PaymentMethod.MPESA:
+        return await PaymentService().process_c2b_payment_async(
+            amount=float(payment.amount),
+            reference=transaction.payment_reference,
+            customer_msisdn=payment.mpesa_number,
+            third_party_reference=transaction.payment_reference
+        )
+    elif payment.payment_method == PaymentMethod.DINHEIRO:
+        # Cash Payment - Immediate Success, No SDK
+        return {
+            "success": True,
+            "body": {
+                "output_TransactionID": "CASH-" + transaction.transaction_uuid[:8].upper(),
+                "output_ResponseDesc": "Pagamento em Dinheiro Registado"
+            }
+        }
+    elif payment.payment_method in [PaymentMethod.EMOLA, PaymentMethod.MKESH]:
+         # Placeholder for other mobile wallets
+         # For now, let's Fail safely telling it's not integrated yet (or Mock if user wants, but request was specific to Cash)
+         return {"success": False, "error": f"{payment.payment_method} integration not active"}
+    else:
+         return {"success": False, "error": "Invalid Payment Method"}
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED)
+async def initiate_payment(
+    payment: PaymentRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserModel = Depends(get_current_user)
+):
+    transaction, merchant, reference = await _create_pending_transaction(payment, db, current_user)
+    
+    try:
+        # EXECUTE PAYMENT
+        result = await _execute_payment(payment, transaction)
+        await _apply_payment_result(db, transaction, merchant, result, current_user)
 
         await db.commit()
         await db.refresh(transaction)
@@ -225,6 +285,172 @@ async def initiate_payment(
 
     except Exception as e:
         await db.rollback() # Rollback if DB error, but transaction might have happened at gateway!
-        # This is a critical edge case. Optimally we check status.
+        # Left PENDING: the reconciliation job queries the gateway for its final status.
         logger.error(f"Critical System Error during payment: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal System Error during payment processing")
+
+
+# ============================================================
+# ASYNC (TWO-PHASE) PAYMENTS
+# ============================================================
+# Gateway calls run in background tasks on this worker; at most this many at once
+PAYMENT_WORKER_CONCURRENCY = 20
+_payment_slots = asyncio.Semaphore(PAYMENT_WORKER_CONCURRENCY)
+
+# Long-poll: maximum wait and DB re-check interval
+STATUS_MAX_WAIT_SECONDS = 30
+STATUS_POLL_INTERVAL_SECONDS = 1.0
+
+
+async def _run_payment_task(transaction_id: int, payment: PaymentRequest, current_user):
+    """
+    Background phase of an async payment: call the gateway and record the
+    outcome. No DB connection is held while waiting on the gateway. If this
+    task dies, the row stays PENDING and the reconciliation job resolves it.
+    
+    The reconciliation job also settles PENDING M-Pesa rows older than
+    RECONCILE_MIN_AGE_MINUTES: a task that waited that long for a slot leaves
+    the row to it, and the result is applied only after re-reading the row
+    under the same FOR UPDATE lock the job takes, so it is never applied twice.
+    """
+    from app.database import SessionLocal
+    from app.services.reconciliation_service import RECONCILE_MIN_AGE_MINUTES
+    
+    async with _payment_slots:
+        async with SessionLocal() as db:
+            try:
+                transaction = await db.get(Transaction, transaction_id)
+                if not transaction or transaction.status != TransactionStatus.PENDING:
+                    return
+                if (
+                    transaction.payment_method == PaymentMethod.MPESA
+                    and transaction.created_at < datetime.now() - timedelta(minutes=RECONCILE_MIN_AGE_MINUTES)
+                ):
+                    # Queued too long: the reconciliation job owns the row now
+                    logger.warning(f"Async payment task skipped for transaction {transaction_id}: left to reconciliation")
+                    return
+                merchant = await db.get(Merchant, transaction.merchant_id)
+                await db.commit()  # Release the connection before the gateway call
+                
+                result = await _execute_payment(payment, transaction)
+                
+                # Lock the row (as the reconciliation job does) and re-check
+                transaction = (await db.execute(
+                    select(Transaction)
+                    .where(Transaction.id == transaction_id)
+                    .with_for_update()
+                    .execution_options(populate_existing=True)
+                )).scalar_one()
+                if transaction.status != TransactionStatus.PENDING:
+                    # Settled meanwhile (reconciliation job, manual update); do not overwrite
+                    await db.commit()
+                    return
+                
+                await _apply_payment_result(db, transaction, merchant, result, current_user)
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Async payment task failed for transaction {transaction_id}: {str(e)}")
+
+
+def _payment_status_body(transaction: Transaction) -> dict:
+    response = transaction.response_payload or {}
+    return {
+        "transaction_uuid": transaction.transaction_uuid,
+        "status": transaction.status.value if transaction.status else None,
+        "amount": float(transaction.amount),
+        "payment_method": transaction.payment_method.value if transaction.payment_method else None,
+        "payment_reference": transaction.payment_reference,
+        "mpesa_reference": transaction.mpesa_reference,
+        "error": response.get("error") if isinstance(response, dict) else None,
+        "created_at": transaction.created_at.isoformat() if transaction.created_at else None,
+        "updated_at": transaction.updated_at.isoformat() if transaction.updated_at else None,
+    }
+
+
+def _payment_etag(transaction: Transaction) -> str:
+    return f'"{transaction.transaction_uuid}-{transaction.status.value if transaction.status else ""}"'
+
+
+@router.post("/async", status_code=status.HTTP_202_ACCEPTED)
+async def initiate_payment_async(
+    payment: PaymentRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """
+    Two-phase payment: records the PENDING transaction and returns 202 with
+    its transaction_uuid right away; the gateway call runs in the background.
+    Poll GET /payments/{transaction_uuid}/status for the outcome.
+    """
+    transaction, merchant, reference = await _create_pending_transaction(payment, db, current_user)
+    
+    background_tasks.add_task(_run_payment_task, transaction.id, payment, current_user)
+    
+    body = _payment_status_body(transaction)
+    body["status_url"] = f"{settings.API_V1_STR}{router.prefix}/{transaction.transaction_uuid}/status"
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=body,
+        headers={"ETag": _payment_etag(transaction), "Location": body["status_url"]}
+    )
+
+
+@router.get("/{transaction_uuid}/status")
+async def get_payment_status(
+    transaction_uuid: str,
+    wait: int = Query(0, ge=0, le=STATUS_MAX_WAIT_SECONDS, description="Long-poll: seconds to wait while PENDING or unchanged"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """
+    Payment outcome for POS terminals and the web portal.
+    
+    - Returns as soon as the status differs from the client's ETag (If-None-Match),
+      or the transaction is no longer PENDING when no ETag is sent.
+    - Otherwise waits up to `wait` seconds, then answers 304 (ETag unchanged)
+      or the current (still PENDING) status.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    
+    while True:
+        result = await db.execute(select(Transaction).where(Transaction.transaction_uuid == transaction_uuid))
+        transaction = result.scalar_one_or_none()
+        # Release the connection between polls
+        await db.commit()
+        
+        if not transaction or not _can_view_payment(transaction, current_user):
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        
+        etag = _payment_etag(transaction)
+        if if_none_match:
+            changed = if_none_match != etag
+        else:
+            changed = transaction.status != TransactionStatus.PENDING
+        
+        if changed or loop.time() >= deadline:
+            break
+        await asyncio.sleep(min(STATUS_POLL_INTERVAL_SECONDS, max(deadline - loop.time(), 0)))
+        db.expunge(transaction)
+    
+    if if_none_match and if_none_match == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return JSONResponse(content=_payment_status_body(transaction), headers={"ETag": etag})
+
+
+def _can_view_payment(transaction: Transaction, current_user) -> bool:
+    role = current_user.role.value
+    if role in ["ADMIN", "AUDITOR"]:
+        return True
+    if role == "AGENTE":
+        return transaction.agent_id == current_user.id
+    if role in ["FUNCIONARIO", "SUPERVISOR"]:
+        if transaction.funcionario_id == current_user.id:
+            return True
+        if not current_user.scope_province or transaction.province != current_user.scope_province:
+            return False
+        return not current_user.scope_district or transaction.district == current_user.scope_district
+    return False
@@ -14,6 +14,7 @@ router = APIRouter(prefix="/pos-devices", tags=["POS Devices"])
 from app.routers.auth import get_current_user
 from app.models.user import User as UserModel
 from app.models import Agent as AgentModel, Market as MarketModel
+from app.utils.date_range import date_range, on_day
 
 @router.get("/", response_model=List[POSDevice])
 async def list_pos_devices(
@@ -203,7 +204,7 @@ async def get_pos_device(
         select(func.sum(Transaction.amount))
         .where(and_(
             Transaction.pos_id == pos_id,
-            func.date(Transaction.created_at) == today,
+            *on_day(Transaction.created_at, today),
             Transaction.status == 'SUCESSO'
         ))
     )
@@ -212,7 +213,7 @@ async def get_pos_device(
         select(func.count(Transaction.id))
         .where(and_(
             Transaction.pos_id == pos_id,
-            func.date(Transaction.created_at) == today,
+            *on_day(Transaction.created_at, today),
             Transaction.status == 'SUCESSO'
         ))
     )
@@ -221,7 +222,7 @@ async def get_pos_device(
         select(func.sum(Transaction.amount))
         .where(and_(
             Transaction.pos_id == pos_id,
-            func.date(Transaction.created_at) >= month_start,
+            *date_range(Transaction.created_at, month_start),
             Transaction.status == 'SUCESSO'
         ))
     )
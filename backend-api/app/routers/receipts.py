@@ -1,20 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select
 from sqlalchemy.orm import joinedload
-from typing import List
+from typing import List, Optional, Tuple
 from datetime import datetime
 
 from app.database import get_db
-from app.models import Receipt as ReceiptModel, Transaction as TransactionModel, Merchant, Agent, POSDevice, Market
+from app.models import Receipt as ReceiptModel, Transaction as TransactionModel
 from app.schemas import Receipt, ReceiptCreate, ReceiptReprint, ReceiptLookup
 
 router = APIRouter(prefix="/receipts", tags=["Receipts"])
 
-def generate_receipt_code(market_id: int, sequence: int) -> str:
-    """Generate receipt code: MKT{market_id}-{year}-{month}-{sequence:06d}"""
-    now = datetime.now()
-    return f"MKT{market_id:02d}-{now.year}-{now.month:02d}-{sequence:06d}"
+async def generate_receipt_code(market_id: int) -> str:
+    """Generate receipt code: MKT{market_id}-{year}-{month}-{sequence:06d} (sequence per market and month)"""
+    from app.services.receipt_sequence import receipt_sequences
+    return await receipt_sequences.next_code(market_id)
 
 @router.get("/", response_model=List[Receipt])
 async def list_receipts(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
@@ -25,12 +25,8 @@ async def list_receipts(skip: int = 0, limit: int = 100, db: AsyncSession = Depe
 
 @router.post("/", response_model=Receipt, status_code=status.HTTP_201_CREATED)
 async def create_receipt(receipt: ReceiptCreate, db: AsyncSession = Depends(get_db)):
-    # Get count for sequence
-    result = await db.execute(select(func.count(ReceiptModel.id)))
-    count = result.scalar() or 0
-    
     data = receipt.model_dump()
-    data["receipt_code"] = generate_receipt_code(receipt.market_id or 1, count + 1)
+    data["receipt_code"] = await generate_receipt_code(receipt.market_id or 1)
     
     db_receipt = ReceiptModel(**data)
     db.add(db_receipt)
@@ -40,59 +36,15 @@ async def create_receipt(receipt: ReceiptCreate, db: AsyncSession = Depends(get_
 
 @router.get("/lookup/{receipt_code}", response_model=ReceiptLookup)
 async def lookup_receipt(receipt_code: str, db: AsyncSession = Depends(get_db)):
-    """Lookup receipt by code with full details for auditing"""
-    result = await db.execute(
-        select(ReceiptModel).where(ReceiptModel.receipt_code == receipt_code)
-    )
-    receipt = result.scalar_one_or_none()
+    """Lookup receipt by code with full details for auditing (one joined query, cached)"""
+    from app.services.receipt_lookup import get_receipt_view
     
-    if not receipt:
+    # TXN-{uuid} codes are transactions, not receipts: see /verify
+    view = None if receipt_code.startswith("TXN-") else await get_receipt_view(db, receipt_code)
+    if not view:
         raise HTTPException(status_code=404, detail="Receipt not found")
     
-    # Get related data
-    merchant_name = None
-    merchant_type = None
-    agent_name = None
-    market_name = None
-    pos_serial = None
-    
-    if receipt.merchant_id:
-        m_result = await db.execute(select(Merchant).where(Merchant.id == receipt.merchant_id))
-        merchant = m_result.scalar_one_or_none()
-        if merchant:
-            merchant_name = merchant.full_name
-            merchant_type = merchant.merchant_type.value if merchant.merchant_type else None
-    
-    if receipt.agent_id:
-        a_result = await db.execute(select(Agent).where(Agent.id == receipt.agent_id))
-        agent = a_result.scalar_one_or_none()
-        if agent:
-            agent_name = agent.full_name
-    
-    if receipt.market_id:
-        mk_result = await db.execute(select(Market).where(Market.id == receipt.market_id))
-        market = mk_result.scalar_one_or_none()
-        if market:
-            market_name = market.name
-    
-    if receipt.pos_id:
-        p_result = await db.execute(select(POSDevice).where(POSDevice.id == receipt.pos_id))
-        pos = p_result.scalar_one_or_none()
-        if pos:
-            pos_serial = pos.serial_number
-    
-    return ReceiptLookup(
-        receipt_code=receipt.receipt_code,
-        amount=receipt.amount,
-        currency=receipt.currency,
-        issued_at=receipt.issued_at,
-        reprint_count=receipt.reprint_count,
-        merchant_name=merchant_name,
-        merchant_type=merchant_type,
-        agent_name=agent_name,
-        market_name=market_name,
-        pos_serial=pos_serial,
-    )
+    return ReceiptLookup(**view)
 
 @router.post("/reprint", response_model=Receipt)
 async def reprint_receipt(data: ReceiptReprint, db: AsyncSession = Depends(get_db)):
@@ -198,36 +150,25 @@ async def debug_signature(code: str):
     }
 
 
-from app.schemas import ReceiptVerification
+from app.schemas import ReceiptVerification, ReceiptVerificationBatch, QrTokenBatchRequest, QrTokenResult
+import logging
 
-@router.get("/verify/{token}", response_model=ReceiptVerification)
-async def verify_receipt_qr(token: str, db: AsyncSession = Depends(get_db)):
+logger = logging.getLogger(__name__)
+
+
+def _check_qr_token(token: str) -> Tuple[Optional[str], Optional[ReceiptVerification]]:
     """
-    Verify receipt from QR code token.
-    Token format: {receipt_code}|{signature}
-    Supports both MKT format (receipt_code) and TXN-{uuid} format (transaction)
+    Parse a QR token ({receipt_code}|{signature}) and verify its HMAC in-process.
+    Returns (receipt_code, None) when authentic, else (None, failed verification).
     """
-    # Parse token
     if "|" not in token:
-        return ReceiptVerification(
+        return None, ReceiptVerification(
             is_valid=False,
             status="INVALID_FORMAT",
             message="Formato de QR Code inválido"
         )
     
-    parts = token.split("|", 1)
-    if len(parts) != 2:
-        return ReceiptVerification(
-            is_valid=False,
-            status="INVALID_FORMAT",
-            message="Formato de QR Code inválido"
-        )
-    
-    receipt_code, signature = parts
-    
-    # Debug logging
-    import logging
-    logger = logging.getLogger(__name__)
+    receipt_code, signature = token.split("|", 1)
     logger.info(f"QR Verify: code={receipt_code}, sig={signature}")
     
     # Verify signature (HMAC-SHA256)
@@ -240,133 +181,110 @@ async def verify_receipt_qr(token: str, db: AsyncSession = Depends(get_db)):
         ).hexdigest()[:16]
         logger.error(f"Signature mismatch! Got: {signature}, Expected: {expected}")
         
-        return ReceiptVerification(
+        return None, ReceiptVerification(
             is_valid=False,
             status="INVALID_SIGNATURE",
             message=f"⚠️ QR Code ADULTERADO! Este recibo pode ser fraudulento."
         )
-    
-    # Handle TXN-{uuid} format (from POS terminal)
-    if receipt_code.startswith("TXN-"):
-        transaction_uuid = receipt_code[4:]  # Remove "TXN-" prefix
-        
-        from app.models import Transaction as TransactionModel
-        from sqlalchemy import or_
-        
-        # Search by BOTH transaction_uuid AND offline_transaction_uuid
-        # This ensures offline payments remain verifiable after sync
-        result = await db.execute(
-            select(TransactionModel).where(
-                or_(
-                    TransactionModel.transaction_uuid == transaction_uuid,
-                    TransactionModel.offline_transaction_uuid == transaction_uuid
-                )
-            )
-        )
-        transaction = result.scalar_one_or_none()
-        
-        if not transaction:
-            logger.warning(f"Transaction not found: uuid={transaction_uuid}")
+    return receipt_code, None
+
+
+def _verification_from_view(receipt_code: str, view: Optional[dict]) -> ReceiptVerification:
+    """Verification result for an authentic token, given its receipt view (None = not in the DB)."""
+    if not view:
+        if receipt_code.startswith("TXN-"):
+            logger.warning(f"Transaction not found: uuid={receipt_code[4:]}")
             return ReceiptVerification(
                 is_valid=False,
                 status="NOT_FOUND",
                 message="Transação não encontrada no sistema"
             )
-        
-        # Get related data from transaction
-        merchant_name = None
-        agent_name = None
-        market_name = None
-        
-        if transaction.merchant_id:
-            m_result = await db.execute(select(Merchant).where(Merchant.id == transaction.merchant_id))
-            merchant = m_result.scalar_one_or_none()
-            if merchant:
-                merchant_name = merchant.full_name
-                # Get market through merchant
-                if merchant.market_id:
-                    mk_result = await db.execute(select(Market).where(Market.id == merchant.market_id))
-                    market = mk_result.scalar_one_or_none()
-                    if market:
-                        market_name = market.name
-        
-        if transaction.agent_id:
-            a_result = await db.execute(select(Agent).where(Agent.id == transaction.agent_id))
-            agent = a_result.scalar_one_or_none()
-            if agent:
-                agent_name = agent.full_name
-        
-        return ReceiptVerification(
-            is_valid=True,
-            status="VALID",
-            message="✅ Recibo VÁLIDO e autêntico",
-            receipt_code=receipt_code,
-            amount=transaction.amount,
-            currency=transaction.currency,
-            issued_at=transaction.created_at,
-            reprint_count=0,
-            merchant_name=merchant_name,
-            agent_name=agent_name,
-            market_name=market_name,
-            warning=None
-        )
-    
-    # Handle MKT format (standard receipt code)
-    result = await db.execute(
-        select(ReceiptModel).where(ReceiptModel.receipt_code == receipt_code)
-    )
-    receipt = result.scalar_one_or_none()
-    
-    if not receipt:
         return ReceiptVerification(
             is_valid=False,
             status="NOT_FOUND",
             message="Recibo não encontrado no sistema"
         )
     
-    # Get related data
-    merchant_name = None
-    agent_name = None
-    market_name = None
-    
-    if receipt.merchant_id:
-        m_result = await db.execute(select(Merchant).where(Merchant.id == receipt.merchant_id))
-        merchant = m_result.scalar_one_or_none()
-        if merchant:
-            merchant_name = merchant.full_name
-    
-    if receipt.agent_id:
-        a_result = await db.execute(select(Agent).where(Agent.id == receipt.agent_id))
-        agent = a_result.scalar_one_or_none()
-        if agent:
-            agent_name = agent.full_name
-    
-    if receipt.market_id:
-        mk_result = await db.execute(select(Market).where(Market.id == receipt.market_id))
-        market = mk_result.scalar_one_or_none()
-        if market:
-            market_name = market.name
-    
     # Check for suspicious reprints
     warning = None
     status = "VALID"
-    if receipt.reprint_count > 2:
-        warning = f"⚠️ Este recibo foi reimpresso {receipt.reprint_count} vezes"
+    if view["reprint_count"] > 2:
+        warning = f"⚠️ Este recibo foi reimpresso {view['reprint_count']} vezes"
         status = "SUSPICIOUS"
     
     return ReceiptVerification(
         is_valid=True,
         status=status,
         message="✅ Recibo VÁLIDO e autêntico",
-        receipt_code=receipt.receipt_code,
-        amount=receipt.amount,
-        currency=receipt.currency,
-        issued_at=receipt.issued_at,
-        reprint_count=receipt.reprint_count,
-        merchant_name=merchant_name,
-        agent_name=agent_name,
-        market_name=market_name,
+        receipt_code=view["receipt_code"],
+        amount=view["amount"],
+        currency=view["currency"],
+        issued_at=view["issued_at"],
+        reprint_count=view["reprint_count"],
+        merchant_name=view["merchant_name"],
+        agent_name=view["agent_name"],
+        market_name=view["market_name"],
         warning=warning
     )
 
 
+@router.get("/verify/{token}", response_model=ReceiptVerification)
+async def verify_receipt_qr(token: str, db: AsyncSession = Depends(get_db)):
+    """
+    Verify receipt from QR code token.
+    Token format: {receipt_code}|{signature}
+    Supports both MKT format (receipt_code) and TXN-{uuid} format (transaction)
+    """
+    receipt_code, failed = _check_qr_token(token)
+    if failed:
+        return failed
+    
+    # Receipt view: MKT format (receipt table) or TXN-{uuid} format (from POS
+    # terminal, looked up by transaction_uuid or offline_transaction_uuid).
+    # One joined query, cached per worker.
+    from app.services.receipt_lookup import get_receipt_view
+    
+    view = await get_receipt_view(db, receipt_code)
+    return _verification_from_view(receipt_code, view)
+
+
+@router.post("/verify/batch", response_model=List[ReceiptVerification])
+async def verify_receipt_qr_batch(data: ReceiptVerificationBatch, db: AsyncSession = Depends(get_db)):
+    """
+    Verify many QR tokens at once (inspector scanning a row of receipts).
+    Signatures are checked in-process; authentic codes are resolved together
+    (cached views, then one IN query per code format). Results are in the
+    same order as the tokens.
+    """
+    from app.services.receipt_lookup import get_receipt_views
+    
+    checked = [_check_qr_token(token) for token in data.tokens]
+    views = await get_receipt_views(db, {code for code, _ in checked if code})
+    return [
+        failed or _verification_from_view(code, views.get(code))
+        for code, failed in checked
+    ]
+
+
+@router.post("/qr-token-by-uuid/batch", response_model=List[QrTokenResult])
+async def get_qr_tokens_by_uuid(data: QrTokenBatchRequest, db: AsyncSession = Depends(get_db)):
+    """Generate QR tokens for many transaction UUIDs (one IN query), in request order"""
+    result = await db.execute(
+        select(TransactionModel.transaction_uuid)
+        .where(TransactionModel.transaction_uuid.in_(set(data.transaction_uuids)))
+    )
+    existing = set(result.scalars().all())
+    
+    tokens = []
+    for transaction_uuid in data.transaction_uuids:
+        if transaction_uuid not in existing:
+            tokens.append(QrTokenResult(transaction_uuid=transaction_uuid, found=False))
+            continue
+        receipt_code = f"TXN-{transaction_uuid}"
+        tokens.append(QrTokenResult(
+            transaction_uuid=transaction_uuid,
+            found=True,
+            receipt_code=receipt_code,
+            qr_token=generate_qr_token(receipt_code)
+        ))
+    return tokens
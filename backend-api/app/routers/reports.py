@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, desc, and_, case
 from typing import List, Optional
@@ -11,9 +11,14 @@ from app.models import (
     Agent as AgentModel,
     POSDevice as POSDeviceModel,
     Market as MarketModel,
-    User as UserModel
+    User as UserModel,
+    DailyRevenueRollup as RollupModel
 )
 from app.routers.auth import get_current_user
+from app.config import settings
+from app.utils.ttl_cache import TTLCache
+from app.services.hourly_histogram import hourly_histogram, seed_hourly_histogram
+from app.utils.date_range import date_range, on_day
 
 router = APIRouter(prefix="/reports", tags=["Reports"])
 
@@ -34,101 +39,86 @@ def apply_jurisdiction_filter(query, user: UserModel, market_model=MarketModel):
         
     return query
 
+# Dashboard KPIs per jurisdiction scope (polled by every open dashboard)
+dashboard_cache = TTLCache(ttl_seconds=settings.DASHBOARD_CACHE_TTL_SECONDS, max_size=512)
+
+
+def _dashboard_scope_key(user: UserModel):
+    # Everything the jurisdiction filters below depend on
+    return (user.scope_province or None, user.scope_district or None)
+
+
 @router.get("/dashboard")
 async def get_dashboard_stats(
     db: AsyncSession = Depends(get_db),
     current_user: UserModel = Depends(get_current_user)
 ):
     today = datetime.now().date()
+    cache_key = (today, _dashboard_scope_key(current_user))
+    cached = dashboard_cache.get(cache_key)
+    if cached is not None:
+        return cached
     
-    # Base joins for Transaction queries to enable filtering
-    tx_base_query = (
-        select(TransactionModel)
-        .join(MerchantModel, TransactionModel.merchant_id == MerchantModel.id)
-        .join(MarketModel, MerchantModel.market_id == MarketModel.id)
-    )
-    
-    # Revenue Today
-    revenue_query = apply_jurisdiction_filter(
-        select(func.sum(TransactionModel.amount))
-        .join(MerchantModel, TransactionModel.merchant_id == MerchantModel.id)
-        .join(MarketModel, MerchantModel.market_id == MarketModel.id)
-        .where(
-            func.date(TransactionModel.created_at) == today,
-            TransactionModel.status == 'SUCESSO'
-        ),
-        current_user
-    )
-    revenue_today = await db.scalar(revenue_query) or 0.0
-
-    # Tx Today
+    # Today's transactions in one pass: revenue, count and paying merchants
+    is_success = TransactionModel.status == 'SUCESSO'
     tx_query = apply_jurisdiction_filter(
-        select(func.count(TransactionModel.id))
+        select(
+            func.sum(case((is_success, TransactionModel.amount), else_=0)).label("revenue"),
+            func.count(TransactionModel.id).label("tx_count"),
+            func.count(func.distinct(case((is_success, TransactionModel.merchant_id)))).label("paying_merchants")
+        )
         .join(MerchantModel, TransactionModel.merchant_id == MerchantModel.id)
         .join(MarketModel, MerchantModel.market_id == MarketModel.id)
-        .where(func.date(TransactionModel.created_at) == today),
+        .where(*on_day(TransactionModel.created_at, today)),
         current_user
     )
-    tx_today = await db.scalar(tx_query) or 0
+    tx_row = (await db.execute(tx_query)).one()
+    revenue_today = float(tx_row.revenue or 0.0)
+    tx_today = tx_row.tx_count or 0
 
     # Average Ticket
     avg_ticket = (revenue_today / tx_today) if tx_today > 0 else 0
 
-    # Paying Merchants Today
-    paying_merchants_query = apply_jurisdiction_filter(
-        select(func.count(func.distinct(TransactionModel.merchant_id)))
-        .join(MerchantModel, TransactionModel.merchant_id == MerchantModel.id)
-        .join(MarketModel, MerchantModel.market_id == MarketModel.id)
-        .where(
-            func.date(TransactionModel.created_at) == today,
-            TransactionModel.status == 'SUCESSO'
-        ),
-        current_user
-    )
-    paying_merchants = await db.scalar(paying_merchants_query) or 0
-
-    # Actives - AGENTS
-    # Join with Market to filter
+    # Active agents / POS / merchants as scalar subqueries of a single SELECT
     active_agents_query = apply_jurisdiction_filter(
         select(func.count(AgentModel.id))
         .join(MarketModel, AgentModel.assigned_market_id == MarketModel.id, isouter=True) # Use outer to include agents without market BUT if fitler applied they will be excluded unless scope is None
         .where(AgentModel.status == 'ATIVO'),
         current_user
     )
-    active_agents = await db.scalar(active_agents_query) or 0
 
-    # Actives - POS
-    # Count POS devices based on their own status, using their own province/district
-    # for jurisdiction filtering (not agent assignment)
-    active_pos_base = select(func.count(POSDeviceModel.id)).where(POSDeviceModel.status == 'ATIVO')
-    
-    # Apply jurisdiction filter based on POS device's own location
+    # POS devices are filtered by their own province/district (not agent assignment)
+    active_pos_query = select(func.count(POSDeviceModel.id)).where(POSDeviceModel.status == 'ATIVO')
     if current_user.role.value != "ADMIN" or current_user.scope_province:
         if current_user.scope_province:
-            active_pos_base = active_pos_base.where(POSDeviceModel.province == current_user.scope_province)
+            active_pos_query = active_pos_query.where(POSDeviceModel.province == current_user.scope_province)
         if current_user.scope_district:
-            active_pos_base = active_pos_base.where(POSDeviceModel.district == current_user.scope_district)
-    
-    active_pos = await db.scalar(active_pos_base) or 0
+            active_pos_query = active_pos_query.where(POSDeviceModel.district == current_user.scope_district)
 
-    # Actives - MERCHANTS
     active_merchants_query = apply_jurisdiction_filter(
         select(func.count(MerchantModel.id))
         .join(MarketModel, MerchantModel.market_id == MarketModel.id)
         .where(MerchantModel.status == 'ATIVO'),
         current_user
     )
-    active_merchants = await db.scalar(active_merchants_query) or 0
 
-    return {
+    counts = (await db.execute(select(
+        active_agents_query.scalar_subquery().label("agents"),
+        active_pos_query.scalar_subquery().label("pos"),
+        active_merchants_query.scalar_subquery().label("merchants")
+    ))).one()
+
+    stats = {
         "revenue_today": revenue_today,
         "tx_count_today": tx_today,
         "avg_ticket": avg_ticket,
-        "paying_merchants_today": paying_merchants,
-        "active_agents": active_agents,
-        "active_pos": active_pos,
-        "active_merchants": active_merchants
+        "paying_merchants_today": tx_row.paying_merchants or 0,
+        "active_agents": counts.agents or 0,
+        "active_pos": counts.pos or 0,
+        "active_merchants": counts.merchants or 0
     }
+    dashboard_cache.set(cache_key, stats)
+    return stats
 
 @router.get("/markets")
 async def get_market_reports(
@@ -139,27 +129,40 @@ async def get_market_reports(
     """
     Returns revenue and stats grouped by Market.
     Optional: Filter by last X days (default 30).
+    Revenue comes from daily_revenue_rollup.
     """
-    filters = [TransactionModel.status == 'SUCESSO']
+    filters = [RollupModel.status == 'SUCESSO']
     if days:
         start_date = datetime.now().date() - timedelta(days=days)
-        filters.append(func.date(TransactionModel.created_at) >= start_date)
+        filters.append(RollupModel.day >= start_date)
+
+    revenue = (
+        select(
+            RollupModel.market_id,
+            func.sum(RollupModel.tx_count).label("tx_count"),
+            func.sum(RollupModel.total_amount).label("total_revenue")
+        )
+        .where(*filters)
+        .group_by(RollupModel.market_id)
+        .subquery()
+    )
+    merchants = (
+        select(MerchantModel.market_id, func.count(MerchantModel.id).label("merchants_count"))
+        .group_by(MerchantModel.market_id)
+        .subquery()
+    )
 
     stmt = (
         select(
             MarketModel.name,
             MarketModel.province,
-            func.count(func.distinct(MerchantModel.id)).label("merchants_count"),
-            func.count(TransactionModel.id).label("tx_count"),
-            func.sum(TransactionModel.amount).label("total_revenue")
+            merchants.c.merchants_count,
+            revenue.c.tx_count,
+            revenue.c.total_revenue
         )
-        .join(MerchantModel, MerchantModel.market_id == MarketModel.id, isouter=True)
-        .join(TransactionModel, and_(
-            TransactionModel.merchant_id == MerchantModel.id,
-            *filters
-        ), isouter=True)
-        .group_by(MarketModel.id, MarketModel.name, MarketModel.province)
-        .order_by(desc("total_revenue"))
+        .outerjoin(merchants, merchants.c.market_id == MarketModel.id)
+        .outerjoin(revenue, revenue.c.market_id == MarketModel.id)
+        .order_by(desc(revenue.c.total_revenue))
     )
     
     stmt = apply_jurisdiction_filter(stmt, current_user, MarketModel)
@@ -171,8 +174,8 @@ async def get_market_reports(
         {
             "market": row.name,
             "province": row.province,
-            "merchants_count": row.merchants_count,
-            "tx_count": row.tx_count,
+            "merchants_count": row.merchants_count or 0,
+            "tx_count": int(row.tx_count or 0),
             "total_revenue": row.total_revenue or 0
         }
         for row in rows
@@ -187,12 +190,30 @@ async def get_agent_reports(
     """
     Returns KPIs per Agent: Revenue, Tx Count, Active POS.
     Optional: Filter by last X days.
+    Revenue comes from daily_revenue_rollup.
     """
     try:
-        filters = [TransactionModel.status == 'SUCESSO']
+        filters = [RollupModel.status == 'SUCESSO']
         if days:
             start_date = datetime.now().date() - timedelta(days=days)
-            filters.append(func.date(TransactionModel.created_at) >= start_date)
+            filters.append(RollupModel.day >= start_date)
+
+        revenue = (
+            select(
+                RollupModel.agent_id,
+                func.sum(RollupModel.tx_count).label("tx_count"),
+                func.sum(RollupModel.total_amount).label("total_revenue")
+            )
+            .where(*filters)
+            .group_by(RollupModel.agent_id)
+            .subquery()
+        )
+        active_pos = (
+            select(POSDeviceModel.assigned_agent_id, func.count(POSDeviceModel.id).label("pos_count"))
+            .where(POSDeviceModel.status == 'ATIVO')
+            .group_by(POSDeviceModel.assigned_agent_id)
+            .subquery()
+        )
 
         stmt = (
             select(
@@ -201,17 +222,13 @@ async def get_agent_reports(
                 AgentModel.status,
                 MarketModel.name.label("market_name"),
                 AgentModel.assigned_region,
-                func.count(func.distinct(POSDeviceModel.id)).label("pos_count"),
-                func.count(TransactionModel.id).label("tx_count"),
-                func.coalesce(func.sum(TransactionModel.amount), 0).label("total_revenue")
+                active_pos.c.pos_count,
+                revenue.c.tx_count,
+                func.coalesce(revenue.c.total_revenue, 0).label("total_revenue")
             )
             .join(MarketModel, AgentModel.assigned_market_id == MarketModel.id, isouter=True)
-            .join(POSDeviceModel, and_(POSDeviceModel.assigned_agent_id == AgentModel.id, POSDeviceModel.status == 'ATIVO'), isouter=True)
-            .join(TransactionModel, and_(
-                TransactionModel.agent_id == AgentModel.id,
-                *filters
-            ), isouter=True)
-            .group_by(AgentModel.id, AgentModel.agent_code, AgentModel.full_name, AgentModel.status, MarketModel.name, AgentModel.assigned_region)
+            .outerjoin(active_pos, active_pos.c.assigned_agent_id == AgentModel.id)
+            .outerjoin(revenue, revenue.c.agent_id == AgentModel.id)
             .order_by(desc("total_revenue"))
         )
         
@@ -226,7 +243,7 @@ async def get_agent_reports(
                 "market_name": row.market_name or "N/A",
                 "region": row.assigned_region,
                 "pos_count": row.pos_count or 0,
-                "tx_count": row.tx_count or 0,
+                "tx_count": int(row.tx_count or 0),
                 "total_revenue": float(row.total_revenue or 0)
             }
             for row in rows
@@ -251,7 +268,7 @@ async def get_pos_reports(
     filters = []
     if days:
         start_date = datetime.now().date() - timedelta(days=days)
-        filters.append(func.date(TransactionModel.created_at) >= start_date)
+        filters.extend(date_range(TransactionModel.created_at, start_date))
 
     stmt = (
         select(
@@ -300,7 +317,7 @@ async def get_revenue_chart(
     current_user: UserModel = Depends(get_current_user)
 ):
     """
-    Returns daily revenue for the last X days
+    Returns daily revenue for the last X days (from daily_revenue_rollup)
     """
     start_date = datetime.now().date() - timedelta(days=days)
     
@@ -311,17 +328,16 @@ async def get_revenue_chart(
 
     stmt = (
         select(
-            func.date(TransactionModel.created_at).label("date"),
-            func.sum(TransactionModel.amount).label("revenue")
+            RollupModel.day.label("date"),
+            func.sum(RollupModel.total_amount).label("revenue")
         )
-        .join(MerchantModel, TransactionModel.merchant_id == MerchantModel.id)
-        .join(MarketModel, MerchantModel.market_id == MarketModel.id)
+        .join(MarketModel, RollupModel.market_id == MarketModel.id)
         .where(
-            func.date(TransactionModel.created_at) >= start_date,
-            TransactionModel.status == 'SUCESSO'
+            RollupModel.day >= start_date,
+            RollupModel.status == 'SUCESSO'
         )
-        .group_by(func.date(TransactionModel.created_at))
-        .order_by("date")
+        .group_by(RollupModel.day)
+        .order_by(RollupModel.day)
     )
     
     stmt = apply_jurisdiction_filter(stmt, current_user, MarketModel)
@@ -343,52 +359,38 @@ async def get_revenue_chart(
 
 @router.get("/chart/hourly")
 async def get_hourly_chart(
+    start_hour: Optional[int] = Query(None, ge=0, le=23, description="First hour (default HOURLY_CHART_START_HOUR)"),
+    end_hour: Optional[int] = Query(None, ge=1, le=24, description="Last hour, exclusive (default HOURLY_CHART_END_HOUR)"),
     db: AsyncSession = Depends(get_db),
     current_user: UserModel = Depends(get_current_user)
 ):
     """
-    Returns transaction count grouped by hour for today
+    Returns successful transaction count grouped by hour for today,
+    served from the in-memory hourly histogram
     """
-    today = datetime.now().date()
+    start_hour = settings.HOURLY_CHART_START_HOUR if start_hour is None else start_hour
+    end_hour = settings.HOURLY_CHART_END_HOUR if end_hour is None else end_hour
+    if start_hour >= end_hour:
+        raise HTTPException(status_code=400, detail="start_hour must be before end_hour")
     
-    try:
-        # Use extract for better compatibility across databases
-        from sqlalchemy import extract
-        
-        stmt = (
-            select(
-                extract('hour', TransactionModel.created_at).label("hour"),
-                func.count(TransactionModel.id).label("count")
-            )
-            .join(MerchantModel, TransactionModel.merchant_id == MerchantModel.id)
-            .join(MarketModel, MerchantModel.market_id == MarketModel.id)
-            .where(
-                func.date(TransactionModel.created_at) == today,
-                TransactionModel.status == 'SUCESSO'
-            )
-            .group_by(extract('hour', TransactionModel.created_at))
-            .order_by("hour")
-        )
-        
-        stmt = apply_jurisdiction_filter(stmt, current_user, MarketModel)
-        
-        result = await db.execute(stmt)
-        rows = result.all()
-        
-        # Fill missing hours
-        data = {int(row.hour): row.count for row in rows}
-        return [
-            {"hour": f"{h:02d}:00", "count": data.get(h, 0)}
-            for h in range(6, 22)  # Show from 06:00 to 22:00
-        ]
-    except Exception as e:
-        import logging
-        logging.getLogger(__name__).error(f"Hourly chart error: {e}")
-        # Return empty chart on error
-        return [
-            {"hour": f"{h:02d}:00", "count": 0}
-            for h in range(6, 22)
-        ]
+    if hourly_histogram.needs_resync():
+        try:
+            await seed_hourly_histogram(db)
+        except Exception as e:
+            # Keep serving the in-memory counts; retried on the next request
+            import logging
+            logging.getLogger(__name__).error(f"Hourly histogram resync error: {e}")
+    
+    # Same scoping as apply_jurisdiction_filter
+    if current_user.role.value == "ADMIN" and not current_user.scope_province:
+        counts = hourly_histogram.counts()
+    else:
+        counts = hourly_histogram.counts(current_user.scope_province, current_user.scope_district)
+    
+    return [
+        {"hour": f"{h:02d}:00", "count": counts[h]}
+        for h in range(start_hour, end_hour)
+    ]
 
 @router.get("/chart/methods")
 async def get_payment_methods_chart(
@@ -407,7 +409,7 @@ async def get_payment_methods_chart(
         )
         .join(MerchantModel, TransactionModel.merchant_id == MerchantModel.id)
         .join(MarketModel, MerchantModel.market_id == MarketModel.id)
-        .where(func.date(TransactionModel.created_at) == today)
+        .where(*on_day(TransactionModel.created_at, today))
         .group_by(TransactionModel.payment_method)
     )
     
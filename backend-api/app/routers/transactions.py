@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, and_, func, or_
+from sqlalchemy import select, desc, and_, func, or_, inspect
 from typing import List, Optional
 import uuid
 from datetime import datetime, date, timedelta
@@ -13,6 +13,8 @@ from sqlalchemy.orm import selectinload
 from app.routers.auth import get_current_user
 from app.models.user import User as UserSchema
 from app.models import Market as MarketModel
+from app.utils.pagination import apply_keyset, set_next_cursor
+from app.utils.date_range import date_range, on_day
 
 router = APIRouter(prefix="/transactions", tags=["Transactions"])
 
@@ -20,8 +22,10 @@ router = APIRouter(prefix="/transactions", tags=["Transactions"])
 
 @router.get("/", response_model=List[Transaction])
 async def list_transactions(
+    response: Response,
     skip: int = 0, 
     limit: int = 100,
+    cursor: Optional[str] = Query(None, description="Keyset cursor (X-Next-Cursor of the previous page); replaces skip"),
     search: Optional[str] = None,
     status: Optional[str] = None,
     payment_method: Optional[str] = None,
@@ -33,6 +37,7 @@ async def list_transactions(
     end_date: Optional[date] = None,
     province: Optional[str] = None,
     district: Optional[str] = None,
+    needs_review: bool = Query(False, description="Only M-Pesa payments flagged by reconciliation for manual review"),
     db: AsyncSession = Depends(get_db),
     current_user: UserSchema = Depends(get_current_user) # Using UserSchema or plain dict? get_current_user returns User model.
 ):
@@ -96,14 +101,18 @@ async def list_transactions(
     if pos_id:
         filters.append(TransactionModel.pos_id == pos_id)
         
+    if needs_review:
+        filters.append(TransactionModel.reconcile_review_at.is_not(None))
+        filters.append(TransactionModel.status.in_(["PENDING", "TIMEOUT"]))
+        
     if market_id:
         filters.append(Merchant.market_id == market_id)
         
     if start_date:
-        filters.append(func.date(TransactionModel.created_at) >= start_date)
+        filters.extend(date_range(TransactionModel.created_at, start_date))
         
     if end_date:
-        filters.append(func.date(TransactionModel.created_at) <= end_date)
+        filters.extend(date_range(TransactionModel.created_at, end=end_date))
         
     if search:
         filters.append(or_(
@@ -115,10 +124,15 @@ async def list_transactions(
     if filters:
         query = query.where(and_(*filters))
         
-    query = query.order_by(desc(TransactionModel.created_at)).offset(skip).limit(limit)
+    # Keyset on (created_at, id); skip/offset kept for older clients
+    query = apply_keyset(query, TransactionModel.created_at, TransactionModel.id, cursor)
+    if not cursor and skip:
+        query = query.offset(skip)
+    query = query.limit(limit)
     
     result = await db.execute(query)
     transactions = result.scalars().all()
+    set_next_cursor(response, transactions, limit)
     
     # Enrich merchant data with market information
     for tx in transactions:
@@ -191,24 +205,24 @@ async def get_transaction_stats(
     
     # 1. Total Collected Today
     total_today = await get_sum([
-        func.date(TransactionModel.created_at) == today,
+        *on_day(TransactionModel.created_at, today),
         TransactionModel.status == 'SUCESSO'
     ])
     
     # 2. Total Collected Month
     total_month = await get_sum([
-        func.date(TransactionModel.created_at) >= month_start,
+        *date_range(TransactionModel.created_at, month_start),
         TransactionModel.status == 'SUCESSO'
     ])
     
     # 3. Tx Count Today
     count_today = await get_count([
-        func.date(TransactionModel.created_at) == today
+        *on_day(TransactionModel.created_at, today)
     ])
     
     # 4. Ticket Average (Month)
     count_month_success = await get_count([
-         func.date(TransactionModel.created_at) >= month_start,
+         *date_range(TransactionModel.created_at, month_start),
          TransactionModel.status == 'SUCESSO'
     ])
     ticket_avg = total_month / count_month_success if count_month_success > 0 else 0.0
@@ -222,9 +236,13 @@ async def get_transaction_stats(
 
 
 
-import csv
-import io
 from fastapi.responses import StreamingResponse
+from app.utils.csv_stream import csv_response, iter_rows
+from app.utils.columnar_stream import columnar_response
+from app.services.export_service import (
+    TRANSACTION_EXPORT_ROLES, TRANSACTION_EXPORT_HEADER, TRANSACTION_EXPORT_COLUMNS,
+    transaction_export_query, format_transaction_row, transaction_export_filename
+)
 
 @router.get("/export", response_class=StreamingResponse)
 async def export_transactions(
@@ -234,114 +252,45 @@ async def export_transactions(
     payment_method: Optional[str] = None,
     province: Optional[str] = None,
     district: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, description="Maximum rows (default: no limit)"),
+    export_format: str = Query("csv", alias="format", pattern="^(csv|parquet|arrow)$"),
     db: AsyncSession = Depends(get_db),
     current_user: UserSchema = Depends(get_current_user)
 ):
-    """Export transactions to CSV with date period filter"""
+    """
+    Export transactions to CSV (or Parquet / Arrow IPC) with date period filter (streamed).
+    For very large exports use POST /exports/transactions (background job).
+    """
     
-    # RBAC: Only ADMIN, AUDITOR, SUPERVISOR can export
+    # RBAC: Only ADMIN, AUDITOR, SUPERVISOR, FUNCIONARIO can export
     user_role = getattr(getattr(current_user, 'role', None), 'value', None)
-    allowed_roles = ["ADMIN", "AUDITOR", "SUPERVISOR", "FUNCIONARIO"]
-    if user_role not in allowed_roles:
+    if user_role not in TRANSACTION_EXPORT_ROLES:
         raise HTTPException(
             status_code=403,
             detail="Access denied. Only authorized users can export transactions."
         )
     
-    # Build query
-    query = select(TransactionModel).options(
-        selectinload(TransactionModel.merchant).selectinload(Merchant.market),
-        selectinload(TransactionModel.agent),
-        selectinload(TransactionModel.funcionario),
-        selectinload(TransactionModel.pos_device)
-    ).join(Merchant, TransactionModel.merchant_id == Merchant.id).join(MarketModel, Merchant.market_id == MarketModel.id)
-    
-    # Apply location scoping based on role
-    if user_role == "SUPERVISOR":
-        if hasattr(current_user, 'scope_district') and current_user.scope_district:
-            query = query.where(MarketModel.district == current_user.scope_district)
-    elif user_role == "FUNCIONARIO":
-        if hasattr(current_user, 'scope_province') and current_user.scope_province:
-            query = query.where(MarketModel.province == current_user.scope_province)
-    
-    # Apply filters
-    filters = []
-    if start_date:
-        filters.append(func.date(TransactionModel.created_at) >= start_date)
-    if end_date:
-        filters.append(func.date(TransactionModel.created_at) <= end_date)
-    if tx_status and tx_status != "ALL":
-        filters.append(TransactionModel.status == tx_status)
-    if payment_method and payment_method != "ALL":
-        filters.append(TransactionModel.payment_method == payment_method)
-    if province and province != "ALL":
-        filters.append(MarketModel.province == province)
-    if district:
-        filters.append(MarketModel.district.ilike(f"%{district}%"))
-    
-    if filters:
-        query = query.where(and_(*filters))
-    
-    query = query.order_by(desc(TransactionModel.created_at)).limit(50000)  # Safety limit
-    
-    result = await db.execute(query)
-    transactions = result.scalars().all()
+    # Flat projection, scoped by role and filtered (shared with export jobs)
+    query = transaction_export_query(
+        user_role,
+        scope_province=getattr(current_user, 'scope_province', None),
+        scope_district=getattr(current_user, 'scope_district', None),
+        start_date=start_date,
+        end_date=end_date,
+        tx_status=tx_status,
+        payment_method=payment_method,
+        province=province,
+        district=district,
+    )
+    query = query.order_by(desc(TransactionModel.created_at), desc(TransactionModel.id))
+    if limit:
+        query = query.limit(limit)
     
-    # Generate CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
+    filename = transaction_export_filename(start_date, end_date)
     
-    # Headers
-    writer.writerow([
-        "UUID", "Data/Hora", "Valor (MZN)", "Status", "Método Pagamento",
-        "Comerciante", "Doc. ID", "Mercado", "Província", "Distrito",
-        "Agente/Funcionário", "POS", "Referência"
-    ])
-    
-    for tx in transactions:
-        merchant_name = tx.merchant.full_name if tx.merchant else ""
-        merchant_doc_id = tx.merchant.id_document_number if tx.merchant else ""
-        market_name = tx.merchant.market.name if tx.merchant and tx.merchant.market else ""
-        market_province = tx.merchant.market.province if tx.merchant and tx.merchant.market else ""
-        market_district = tx.merchant.market.district if tx.merchant and tx.merchant.market else ""
-        agent_name = tx.agent.agent_code if tx.agent else (tx.funcionario.full_name if tx.funcionario else "")
-        pos_serial = tx.pos_device.serial_number if tx.pos_device else ""
-        
-        writer.writerow([
-            tx.transaction_uuid,
-            tx.created_at.isoformat() if tx.created_at else "",
-            f"{tx.amount:.2f}",
-            tx.status.value if hasattr(tx.status, 'value') else tx.status,
-            tx.payment_method.value if hasattr(tx.payment_method, 'value') else tx.payment_method,
-            merchant_name,
-            merchant_doc_id,
-            market_name,
-            market_province,
-            market_district,
-            agent_name,
-            pos_serial,
-            tx.payment_reference or ""
-        ])
-    
-    output.seek(0)
-    
-    # Filename with date range
-    date_suffix = ""
-    if start_date and end_date:
-        date_suffix = f"_{start_date.isoformat()}_to_{end_date.isoformat()}"
-    elif start_date:
-        date_suffix = f"_from_{start_date.isoformat()}"
-    elif end_date:
-        date_suffix = f"_until_{end_date.isoformat()}"
-    
-    filename = f"transacoes{date_suffix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    
-    response = StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv"
-    )
-    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
-    return response
+    if export_format != "csv":
+        return columnar_response(iter_rows(query), TRANSACTION_EXPORT_COLUMNS, filename, export_format)
+    return csv_response(iter_rows(query), TRANSACTION_EXPORT_HEADER, format_transaction_row, f"{filename}.csv")
 
 @router.post("/", response_model=Transaction, status_code=status.HTTP_201_CREATED)
 async def create_transaction(transaction: TransactionCreate, db: AsyncSession = Depends(get_db)):
@@ -364,8 +313,17 @@ async def create_transaction(transaction: TransactionCreate, db: AsyncSession =
     data.pop('nfc_uid', None)
     data.pop('client_transaction_uuid', None)  # Remove before creating model
     
+    # Snapshot the merchant's current market (revenue rollup key)
+    merchant = await db.get(Merchant, transaction.merchant_id)
+    if not merchant:
+        raise HTTPException(status_code=404, detail="Merchant not found")
+    data["market_id"] = merchant.market_id
+    
     db_tx = TransactionModel(**data)
     db.add(db_tx)
+    await db.flush()
+    from app.services.revenue_rollup_service import record_transactions
+    await record_transactions(db, [db_tx.id])
     
     # Update merchant balance if transaction is successful
     if transaction.status.value == "SUCESSO":
@@ -386,6 +344,17 @@ async def create_transaction(transaction: TransactionCreate, db: AsyncSession =
                 last_transaction_at=datetime.now()
             )
             db.add(new_balance)
+        
+        # Update fee ledger
+        from app.services.fee_service import apply_fee_ledger_delta
+        await apply_fee_ledger_delta(db, transaction.merchant_id, transaction.amount)
+        
+        # Hourly chart (applied on commit), bucketed by created_at like the resync
+        from app.services.hourly_histogram import queue_hourly_change, transaction_scope
+        province, district = await transaction_scope(db, transaction.merchant_id, transaction.province, transaction.district)
+        if "created_at" in inspect(db_tx).unloaded:
+            await db.refresh(db_tx, attribute_names=["created_at"])
+        queue_hourly_change(db, db_tx.created_at, province, district)
     
     await db.commit()
     
@@ -450,12 +419,22 @@ async def get_transaction_by_uuid(
     return tx
 
 @router.get("/merchant/{merchant_id}", response_model=List[Transaction])
-async def get_merchant_transactions(merchant_id: int, skip: int = 0, limit: int = 50, db: AsyncSession = Depends(get_db)):
+async def get_merchant_transactions(
+    merchant_id: int,
+    response: Response,
+    skip: int = 0,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    query = apply_keyset(
+        select(TransactionModel).where(TransactionModel.merchant_id == merchant_id),
+        TransactionModel.created_at, TransactionModel.id, cursor
+    )
+    if not cursor and skip:
+        query = query.offset(skip)
     result = await db.execute(
-        select(TransactionModel)
-        .where(TransactionModel.merchant_id == merchant_id)
-        .order_by(TransactionModel.created_at.desc())
-        .offset(skip).limit(limit)
+        query.limit(limit)
         .options(
             selectinload(TransactionModel.merchant),
             selectinload(TransactionModel.agent).selectinload(Agent.pos_devices),
@@ -463,15 +442,27 @@ async def get_merchant_transactions(merchant_id: int, skip: int = 0, limit: int
             selectinload(TransactionModel.funcionario)
         )
     )
-    return result.scalars().all()
+    transactions = result.scalars().all()
+    set_next_cursor(response, transactions, limit)
+    return transactions
 
 @router.get("/agent/{agent_id}", response_model=List[Transaction])
-async def get_agent_transactions(agent_id: int, skip: int = 0, limit: int = 50, db: AsyncSession = Depends(get_db)):
+async def get_agent_transactions(
+    agent_id: int,
+    response: Response,
+    skip: int = 0,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    query = apply_keyset(
+        select(TransactionModel).where(TransactionModel.agent_id == agent_id),
+        TransactionModel.created_at, TransactionModel.id, cursor
+    )
+    if not cursor and skip:
+        query = query.offset(skip)
     result = await db.execute(
-        select(TransactionModel)
-        .where(TransactionModel.agent_id == agent_id)
-        .order_by(TransactionModel.created_at.desc())
-        .offset(skip).limit(limit)
+        query.limit(limit)
         .options(
              selectinload(TransactionModel.merchant),
              selectinload(TransactionModel.agent).selectinload(Agent.pos_devices),
@@ -479,8 +470,9 @@ async def get_agent_transactions(agent_id: int, skip: int = 0, limit: int = 50,
              selectinload(TransactionModel.funcionario)
         )
     )
-
-    return result.scalars().all()
+    transactions = result.scalars().all()
+    set_next_cursor(response, transactions, limit)
+    return transactions
 
 @router.put("/{transaction_id}", response_model=Transaction)
 async def update_transaction(transaction_id: int, tx_update: TransactionUpdate, db: AsyncSession = Depends(get_db)):
@@ -489,9 +481,25 @@ async def update_transaction(transaction_id: int, tx_update: TransactionUpdate,
     if not tx:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
+    was_success = tx.status == "SUCESSO"
+    
+    from app.services.revenue_rollup_service import record_transactions, retract_transactions
+    await retract_transactions(db, [tx.id])
+    
     for key, value in tx_update.model_dump(exclude_unset=True).items():
         setattr(tx, key, value)
     
+    await record_transactions(db, [tx.id])
+    
+    # Keep fee ledger in sync when the transaction enters/leaves SUCESSO
+    is_success = tx.status == "SUCESSO"
+    if was_success != is_success:
+        from app.services.fee_service import apply_fee_ledger_delta
+        await apply_fee_ledger_delta(db, tx.merchant_id, tx.amount if is_success else -tx.amount)
+        from app.services.hourly_histogram import queue_hourly_change, transaction_scope
+        province, district = await transaction_scope(db, tx.merchant_id, tx.province, tx.district)
+        queue_hourly_change(db, tx.created_at, province, district, 1 if is_success else -1)
+    
     await db.commit()
     
     # Reload with relationships to avoid lazy loading in async context
@@ -126,8 +126,11 @@ async def change_my_password(
     """
     from app.services.auth_service import AuthService
     
+    # current_user may be a cached (detached, shared) instance: re-load it to modify
+    user = await db.get(type(current_user), current_user.id)
+    
     # Verify current password
-    if not AuthService.verify_password(current_password, current_user.password_hash):
+    if not AuthService.verify_password(current_password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, 
             detail="Senha actual incorrecta"
@@ -141,7 +144,7 @@ async def change_my_password(
         )
     
     # Update password
-    current_user.password_hash = get_password_hash(new_password)
+    user.password_hash = get_password_hash(new_password)
     await db.commit()
     
     # Audit log
@@ -3,7 +3,10 @@ from .merchant import Merchant, MerchantCreate, MerchantUpdate, MerchantType, Me
 from .agent import Agent, AgentCreate, AgentUpdate, AgentLogin, AgentStatus
 from .pos_device import POSDevice, POSDeviceCreate, POSDeviceUpdate, POSStatus
 from .transaction import Transaction, TransactionCreate, TransactionUpdate, PaymentMethod, TransactionStatus
-from .receipt import Receipt, ReceiptCreate, ReceiptReprint, ReceiptLookup, ReceiptVerification
+from .receipt import (
+    Receipt, ReceiptCreate, ReceiptReprint, ReceiptLookup, ReceiptVerification,
+    ReceiptVerificationBatch, QrTokenBatchRequest, QrTokenResult
+)
 from .balance import Balance, BalanceCreate, BalanceUpdate
 from .user import User, UserCreate, UserUpdate, UserRole, UserStatus, Token, TokenData
 from .audit_log import AuditLog, AuditLogCreate, ActorType
@@ -28,6 +31,7 @@ __all__ = [
     "Transaction", "TransactionCreate", "TransactionUpdate", "PaymentMethod", "TransactionStatus",
     # Receipt
     "Receipt", "ReceiptCreate", "ReceiptReprint", "ReceiptLookup", "ReceiptVerification",
+    "ReceiptVerificationBatch", "QrTokenBatchRequest", "QrTokenResult",
     # Balance
     "Balance", "BalanceCreate", "BalanceUpdate",
     # User
@@ -0,0 +1,34 @@
+from pydantic import BaseModel, computed_field
+from typing import Optional, Any, Dict
+from datetime import datetime
+from app.models.export_job import ExportKind, ExportJobStatus
+
+class ExportJob(BaseModel):
+    job_uuid: str
+    kind: ExportKind
+    export_format: str
+    gzip: bool
+    params: Optional[Dict[str, Any]] = None
+    status: ExportJobStatus
+    rows_total: Optional[int] = None
+    rows_written: int = 0
+    bytes_written: int = 0
+    error: Optional[str] = None
+    file_name: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+
+    @computed_field
+    @property
+    def progress(self) -> Optional[float]:
+        """Percentage of rows written (None until the row count is known)."""
+        if self.status == ExportJobStatus.DONE:
+            return 100.0
+        if not self.rows_total:
+            return None
+        return round(min(100.0, 100.0 * self.rows_written / self.rows_total), 1)
+
+    class Config:
+        from_attributes = True
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, Any
+from pydantic import BaseModel, Field
+from typing import Optional, Any, List
 from datetime import datetime
 from decimal import Decimal
 
@@ -57,3 +57,23 @@ class ReceiptVerification(BaseModel):
     market_name: Optional[str] = None
     warning: Optional[str] = None  # e.g., "Reimpresso 3 vezes"
 
+
+# Batch QR (inspector scans / POS pulling many tokens over slow mobile data)
+QR_BATCH_MAX_SIZE = 200
+
+
+class ReceiptVerificationBatch(BaseModel):
+    """QR tokens ({receipt_code}|{signature}) to verify in one request"""
+    tokens: List[str] = Field(..., min_length=1, max_length=QR_BATCH_MAX_SIZE)
+
+
+class QrTokenBatchRequest(BaseModel):
+    """Transaction UUIDs to issue QR tokens for in one request"""
+    transaction_uuids: List[str] = Field(..., min_length=1, max_length=QR_BATCH_MAX_SIZE)
+
+
+class QrTokenResult(BaseModel):
+    transaction_uuid: str
+    found: bool
+    receipt_code: Optional[str] = None
+    qr_token: Optional[str] = None
@@ -63,6 +63,9 @@ class Transaction(TransactionBase):
     offline_payment_reference: Optional[str] = None
     offline_created_at: Optional[datetime] = None
     
+    # Flagged by reconciliation (no final gateway status): settle manually
+    reconcile_review_at: Optional[datetime] = None
+    
     # Relationships
     merchant: Optional[Merchant] = None
     agent: Optional[Agent] = None
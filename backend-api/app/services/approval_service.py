@@ -0,0 +1,114 @@
+"""
+Approval queue helpers (jurisdiction change requests).
+
+- enrich_requests: fills requested_by_name / entity_name for a list of
+  requests with one IN (...) query for the requesters and one per entity type,
+  instead of two queries per request.
+- get_pending_count: PENDENTE count for the /approvals/count badge, cached per
+  worker. Any commit that creates or changes a JurisdictionChangeRequest
+  (create, approve, reject, cancel - from any router) drops the cached value;
+  other workers see the change after APPROVALS_COUNT_CACHE_TTL_SECONDS.
+"""
+from collections import defaultdict
+from typing import Dict, Optional, Sequence
+
+from sqlalchemy import event, select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import (
+    JurisdictionChangeRequest as JCRModel,
+    Market, Merchant, Agent, POSDevice,
+    ApprovalStatus, EntityType
+)
+from app.models.user import User as UserModel
+from app.utils.ttl_cache import TTLCache
+
+# entity_type -> (model, display name column)
+ENTITY_NAME_COLUMNS = {
+    EntityType.MARKET: (Market, Market.name),
+    EntityType.MERCHANT: (Merchant, Merchant.full_name),
+    EntityType.AGENT: (Agent, Agent.full_name),
+    EntityType.POS: (POSDevice, POSDevice.serial_number),
+}
+
+
+async def enrich_requests(
+    db: AsyncSession,
+    requests: Sequence[JCRModel],
+    requester_name: Optional[str] = None
+) -> Sequence[JCRModel]:
+    """
+    Set requested_by_name and entity_name on each request, batched.
+    Pass requester_name when all requests come from the same (known) user.
+    """
+    if not requests:
+        return requests
+
+    if requester_name is None:
+        user_ids = {req.requested_by_user_id for req in requests}
+        rows = await db.execute(
+            select(UserModel.id, UserModel.full_name).where(UserModel.id.in_(user_ids))
+        )
+        user_names: Dict[int, str] = dict(rows.all())
+
+    ids_by_type = defaultdict(set)
+    for req in requests:
+        ids_by_type[req.entity_type].add(req.entity_id)
+
+    entity_names = {}
+    for entity_type, ids in ids_by_type.items():
+        if entity_type not in ENTITY_NAME_COLUMNS:
+            continue
+        model, name_column = ENTITY_NAME_COLUMNS[entity_type]
+        rows = await db.execute(select(model.id, name_column).where(model.id.in_(ids)))
+        for entity_id, name in rows.all():
+            entity_names[(entity_type, entity_id)] = name
+
+    for req in requests:
+        if requester_name is None:
+            req.requested_by_name = user_names.get(req.requested_by_user_id) or "Unknown"
+        else:
+            req.requested_by_name = requester_name
+        req.entity_name = entity_names.get((req.entity_type, req.entity_id))
+    return requests
+
+
+# ============================================================
+# Pending count (badge)
+# ============================================================
+pending_count_cache = TTLCache(ttl_seconds=settings.APPROVALS_COUNT_CACHE_TTL_SECONDS, max_size=1)
+
+_PENDING_KEY = "approvals_count_dirty"
+
+
+async def get_pending_count(db: AsyncSession) -> int:
+    count = pending_count_cache.get("pending")
+    if count is None:
+        count = await db.scalar(
+            select(func.count(JCRModel.id))
+            .where(JCRModel.status == ApprovalStatus.PENDENTE)
+        ) or 0
+        pending_count_cache.set("pending", count)
+    return count
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_request_changes(session, flush_context):
+    # new / dirty / deleted still hold the pre-flush state here
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, JCRModel):
+            session.info[_PENDING_KEY] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _drop_pending_count(session):
+    if session.info.pop(_PENDING_KEY, False):
+        pending_count_cache.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_request_changes(session):
+    session.info.pop(_PENDING_KEY, None)
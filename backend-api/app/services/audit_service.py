@@ -4,6 +4,7 @@ from typing import Optional, Any, Dict, List
 from enum import Enum as PyEnum
 from fastapi import Request
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
 from app.models.audit_log import AuditLog, ActorType, Severity, EventType
 from app.models.user import User as UserModel
 import traceback
@@ -43,9 +44,15 @@ class AuditService:
         correlation_id: Optional[str] = None,
         actor_province: Optional[str] = None,
         actor_district: Optional[str] = None,
+        deferred: bool = False,
     ):
         """
         Centralized method to log audit events with full forensic context.
+        
+        By default the entry is added to the caller's session and commits (or
+        rolls back) with the caller's changes. deferred=True hands it to the
+        write-behind audit_sink instead (batched INSERT outside the request):
+        for hot paths where the audit row is not part of the transaction.
         """
         
         # 1. Determine Actor
@@ -132,7 +139,7 @@ class AuditService:
             req_path = get_request_path()
             
         # 3. Create Log Entry
-        log_entry = AuditLog(
+        values = dict(
             actor_type=actor_type,
             actor_id=actor_id,
             actor_name=actor_name,
@@ -159,7 +166,13 @@ class AuditService:
             correlation_id=correlation_id
         )
         
-        db.add(log_entry)
+        if deferred and settings.AUDIT_ASYNC_SINK:
+            from app.services.audit_sink import audit_sink
+            if audit_sink.running:
+                audit_sink.enqueue(values)
+                return
+        
+        db.add(AuditLog(**values))
         # Note: Caller is responsible for commit, or we can auto-commit if needed.
         # Ideally, audit should be part of the transaction.
         
@@ -175,7 +188,8 @@ class AuditService:
         entity_id: Optional[int] = None,
         entity_name: Optional[str] = None,
         actor_province: Optional[str] = None,
-        actor_district: Optional[str] = None
+        actor_district: Optional[str] = None,
+        deferred: bool = False
     ):
         """
         Shortcut for security events (Unauthorized access, etc)
@@ -192,5 +206,6 @@ class AuditService:
             request=request,
             actor_type_override=ActorType.SYSTEM if not actor else None,
             actor_province=actor_province,
-            actor_district=actor_district
+            actor_district=actor_district,
+            deferred=deferred
         )
@@ -0,0 +1,343 @@
+"""
+Write-behind audit sink (per worker).
+
+AuditService.log_audit(..., deferred=True) hands the entry to audit_sink
+instead of adding it to the caller's session: entries are queued in memory
+and written by a background task with one multi-row INSERT per batch, every
+AUDIT_SINK_BATCH_SIZE entries or AUDIT_SINK_FLUSH_MS milliseconds, whichever
+comes first. Used on the payment and login hot paths.
+
+- Producers never wait: enqueue() is an in-memory append, no DB or disk I/O.
+  Entries are never dropped.
+- Durable: when a write fails or takes longer than
+  AUDIT_SINK_WRITE_TIMEOUT_SECONDS (DB down or unreachable), the flusher
+  moves the failed batch and everything queued to a JSON lines spill file in
+  AUDIT_SPILL_DIR (one per worker process, written in a thread), keeps
+  spilling each tick without touching the DB for AUDIT_SPILL_RETRY_SECONDS,
+  and replays the file once the DB accepts writes again. A write that timed
+  out may still have committed: its entries can then appear twice.
+- Memory: once AUDIT_SINK_MAX_QUEUE entries are queued (the DB is not keeping
+  up) the flusher is woken and moves the whole queue to the spill file
+  instead of the DB. The queue only grows past it while a write is in
+  flight, i.e. for at most the write timeout. Spill files of workers that
+  are no longer running (the PID is in the file name) are replayed by any
+  worker.
+- Not transactional: a deferred entry is written even if the caller rolls
+  back. Events that must commit or roll back with the caller's changes use
+  the default (synchronous) mode of log_audit.
+
+Entries carry their own created_at (time of the event, not of the flush).
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+import re
+import sys
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from enum import Enum as PyEnum
+from typing import List, Optional
+
+from sqlalchemy import insert
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.audit_log import AuditLog, ActorType, Severity, EventType
+
+logger = logging.getLogger(__name__)
+
+SPILL_PREFIX = "audit-spill-"
+# audit-spill-<pid>.jsonl, or audit-spill-<pid>-replay-<hex>.jsonl while being replayed
+_SPILL_FILE_RE = re.compile(rf"^{SPILL_PREFIX}(\d+)(?:-replay-[0-9a-f]+)?\.jsonl$")
+
+_ENUM_COLUMNS = {"actor_type": ActorType, "severity": Severity, "event_type": EventType}
+
+
+def _to_spill_line(values: dict) -> str:
+    row = {}
+    for key, value in values.items():
+        if isinstance(value, PyEnum):
+            value = value.value
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        row[key] = value
+    return json.dumps(row, ensure_ascii=False, default=str)
+
+
+def _from_spill_line(line: str) -> dict:
+    values = json.loads(line)
+    for key, enum_type in _ENUM_COLUMNS.items():
+        if values.get(key) is not None:
+            values[key] = enum_type(values[key])
+    if values.get("created_at"):
+        values["created_at"] = datetime.fromisoformat(values["created_at"])
+    return values
+
+
+def _pid_alive(pid: int) -> bool:
+    """Whether a process with this PID is running (on this host)."""
+    if sys.platform == "win32":
+        # os.kill(pid, 0) would terminate the process on Windows
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return True
+            return code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _claim_spill_file(path: str, claimed: str) -> Optional[List[dict]]:
+    """Rename path to claimed and read its entries; None if another worker got it first. Blocking."""
+    try:
+        os.replace(path, claimed)
+    except OSError:
+        return None
+    rows = []
+    with open(claimed, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                rows.append(_from_spill_line(line))
+            except (ValueError, KeyError) as e:
+                logger.error(f"Skipping unreadable audit spill line in {path}: {e}")
+    return rows
+
+
+class AuditSink:
+    def __init__(
+        self,
+        batch_size: int = 200,
+        flush_ms: int = 500,
+        max_queue: int = 10000,
+        spill_dir: str = "audit_spill",
+        spill_retry_seconds: int = 30,
+        write_timeout_seconds: float = 5,
+    ):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(flush_ms, 1) / 1000
+        self.max_queue = max_queue
+        self.spill_dir = spill_dir
+        self.spill_retry_seconds = spill_retry_seconds
+        self.write_timeout = write_timeout_seconds
+        self._queue: deque = deque()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._next_replay = 0.0
+        self._db_retry_at = 0.0
+        self.written = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def spill_path(self) -> str:
+        return os.path.join(self.spill_dir, f"{SPILL_PREFIX}{os.getpid()}.jsonl")
+
+    # ------------------------------------------------------------
+    # Lifecycle (app lifespan)
+    # ------------------------------------------------------------
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._next_replay = 0.0  # Replay leftovers right away
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Audit sink started (batch={self.batch_size}, flush={self.flush_interval}s)")
+
+    async def stop(self) -> None:
+        """Write (or spill) everything still queued, then stop the flusher."""
+        if not self.running:
+            return
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        logger.info(f"Audit sink stopped ({self.written} written, {self.spilled} spilled)")
+
+    # ------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------
+    def enqueue(self, values: dict) -> None:
+        """Queue one audit_logs row (column -> value). O(1): no DB or disk I/O."""
+        values.setdefault("created_at", datetime.now())
+        self._queue.append(values)
+        # A full batch, or the high-water mark past which flush() spills the queue
+        if (len(self._queue) >= self.batch_size or len(self._queue) >= self.max_queue) and self._wake is not None:
+            self._wake.set()
+
+    # ------------------------------------------------------------
+    # Flusher
+    # ------------------------------------------------------------
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                healthy = await self.flush()
+                if healthy and time.monotonic() >= self._next_replay:
+                    self._next_replay = time.monotonic() + self.spill_retry_seconds
+                    await self.replay_spill()
+            except Exception as e:
+                # Keep the flusher alive whatever happens
+                logger.error(f"Audit sink loop error: {e}")
+        await self.flush()
+
+    async def _insert(self, rows: List[dict]) -> None:
+        # Bounded: a hung connect must not keep the flusher from spilling
+        await asyncio.wait_for(self._insert_rows(rows), timeout=self.write_timeout)
+
+    async def _insert_rows(self, rows: List[dict]) -> None:
+        # A multi-row VALUES needs the same columns in every row
+        columns = set().union(*rows)
+        rows = [{column: values.get(column) for column in columns} for values in rows]
+        async with SessionLocal() as db:
+            await db.execute(insert(AuditLog.__table__).values(rows))
+            await db.commit()
+
+    async def flush(self) -> bool:
+        """
+        Write queued entries in batches. On a DB error (or timeout) the failed
+        batch and everything still queued go to the spill file, and the DB is
+        left alone for spill_retry_seconds (entries queued meanwhile are
+        spilled directly). A queue past max_queue is spilled as well.
+        Returns False if the DB was not written.
+        """
+        if self._queue and time.monotonic() < self._db_retry_at:
+            await self._spill(self._take(len(self._queue)))
+            return False
+        while self._queue:
+            if len(self._queue) >= self.max_queue:
+                logger.warning(f"Audit sink queue at {len(self._queue)} entries, spilling to disk")
+                await self._spill(self._take(len(self._queue)))
+                return False
+            batch = self._take(self.batch_size)
+            try:
+                await self._insert(batch)
+                self.written += len(batch)
+            except Exception as e:
+                self.failures += 1
+                self._db_retry_at = time.monotonic() + self.spill_retry_seconds
+                rows = batch + self._take(len(self._queue))
+                logger.error(f"Audit sink write failed, spilling {len(rows)} entries: {e!r}")
+                await self._spill(rows)
+                return False
+        return True
+
+    def _take(self, count: int) -> List[dict]:
+        return [self._queue.popleft() for _ in range(min(count, len(self._queue)))]
+
+    # ------------------------------------------------------------
+    # Spill file
+    # ------------------------------------------------------------
+    def _write_spill(self, rows: List[dict]) -> None:
+        # Blocking (fsync): called through asyncio.to_thread
+        if not rows:
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        # Opened per write: a replaying worker can rename the file at any time
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            f.write("".join(_to_spill_line(values) + "\n" for values in rows))
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def _spill(self, rows: List[dict]) -> None:
+        await asyncio.to_thread(self._write_spill, rows)
+        self.spilled += len(rows)
+
+    def _replayable_files(self) -> List[str]:
+        """
+        This worker's own files, plus those of workers that are gone. Files
+        of live workers are never touched: they may still be appending to
+        them, or replaying them.
+        """
+        me = os.getpid()
+        files = []
+        for path in glob.glob(os.path.join(self.spill_dir, f"{SPILL_PREFIX}*.jsonl")):
+            match = _SPILL_FILE_RE.match(os.path.basename(path))
+            if not match:
+                continue
+            pid = int(match.group(1))
+            if pid == me:
+                # Our own -replay- file is the one being replayed right now
+                if "-replay-" not in path:
+                    files.append(path)
+            elif not _pid_alive(pid):
+                files.append(path)
+        return files
+
+    async def replay_spill(self) -> int:
+        """Insert spilled entries (own file and orphaned ones). Returns how many were written."""
+        replayed = 0
+        for path in self._replayable_files():
+            # Claim the file (rename is atomic): one worker replays it
+            claimed = os.path.join(self.spill_dir, f"{SPILL_PREFIX}{os.getpid()}-replay-{uuid.uuid4().hex}.jsonl")
+            rows = await asyncio.to_thread(_claim_spill_file, path, claimed)
+            if rows is None:
+                continue
+
+            done, failed = 0, False
+            try:
+                while done < len(rows):
+                    batch = rows[done:done + self.batch_size]
+                    await self._insert(batch)
+                    done += len(batch)
+            except Exception as e:
+                logger.error(f"Audit spill replay failed ({len(rows) - done} entries kept): {e!r}")
+                self._db_retry_at = time.monotonic() + self.spill_retry_seconds
+                # Back into this worker's spill file, retried later
+                await asyncio.to_thread(self._write_spill, rows[done:])
+                failed = True
+            await asyncio.to_thread(os.remove, claimed)
+            replayed += done
+            self.replayed += done
+            if failed:
+                break
+            logger.info(f"Replayed {done} audit entries from {path}")
+        return replayed
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": len(self._queue),
+            "written": self.written,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "failures": self.failures,
+        }
+
+
+audit_sink = AuditSink(
+    batch_size=settings.AUDIT_SINK_BATCH_SIZE,
+    flush_ms=settings.AUDIT_SINK_FLUSH_MS,
+    max_queue=settings.AUDIT_SINK_MAX_QUEUE,
+    spill_dir=settings.AUDIT_SPILL_DIR,
+    spill_retry_seconds=settings.AUDIT_SPILL_RETRY_SECONDS,
+    write_timeout_seconds=settings.AUDIT_SINK_WRITE_TIMEOUT_SECONDS,
+)
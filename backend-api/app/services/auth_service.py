@@ -31,3 +31,59 @@ class AuthService:
         to_encode.update({"exp": expire})
         encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
         return encoded_jwt
+
+    @staticmethod
+    def create_principal_token(
+        principal_type: str,
+        principal,
+        role: str,
+        subject: str,
+        scope: Optional[dict] = None,
+        expires_delta: Optional[timedelta] = None,
+        extra_claims: Optional[dict] = None
+    ):
+        """
+        Token with typed principal claims, resolved by get_current_user with a
+        single primary-key lookup instead of probing users/merchants/agents:
+        - typ: "user" | "merchant" | "agent"
+        - pid: primary key of the principal
+        - ver: principal.token_version at issue time (revocation counter)
+        - scope: province / district / market_id at issue time
+        `sub` and `role` are kept so older clients keep reading the token.
+        """
+        data = {
+            "sub": subject,
+            "role": role,
+            "typ": principal_type,
+            "pid": principal.id,
+            "ver": principal.token_version or 0,
+            "scope": scope or {},
+        }
+        if extra_claims:
+            data.update(extra_claims)
+        return AuthService.create_access_token(data, expires_delta=expires_delta)
+
+
+# ============================================================
+# Token revocation: bump token_version on security-relevant changes
+# ============================================================
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+# Changing any of these invalidates the principal's issued tokens
+TOKEN_VERSION_FIELDS = {
+    "User": ("status", "role", "scope_province", "scope_district", "password_hash", "username", "email"),
+    "Agent": ("status", "assigned_market_id", "pin_hash", "agent_code"),
+    "Merchant": ("status", "market_id", "password_hash", "nfc_uid"),
+}
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_token_versions(session, flush_context, instances):
+    for obj in session.dirty:
+        fields = TOKEN_VERSION_FIELDS.get(type(obj).__name__)
+        if not fields:
+            continue
+        attrs = inspect(obj).attrs
+        if any(attrs[field].history.has_changes() for field in fields):
+            obj.token_version = (obj.token_version or 0) + 1
@@ -0,0 +1,328 @@
+"""
+Background export jobs.
+
+POST /exports/... only records an ExportJob (QUEUED). A worker -
+scripts/export_worker.py, or the API scheduler leader if
+EXPORT_JOBS_IN_SCHEDULER is enabled - claims queued jobs one at a time and writes the file to EXPORT_DIR in
+keyset chunks (same queries and encoders as the streaming exports), so a
+large export never runs inside an API request or its timeout. Progress
+(rows / bytes written) is saved on the job while it runs; finished files are
+served with Range support by /exports/{job_uuid}/download and deleted after
+EXPORT_JOB_RETENTION_HOURS.
+"""
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Optional, Sequence
+import logging
+import os
+import time
+import uuid
+
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Transaction, ExportJob, ExportKind, ExportJobStatus
+from app.models.audit_log import AuditLog, Severity, EventType, ActorType
+from app.services.export_service import (
+    TRANSACTION_EXPORT_HEADER, TRANSACTION_EXPORT_COLUMNS,
+    transaction_export_query, format_transaction_row, transaction_export_filename,
+    AUDIT_EXPORT_HEADER, AUDIT_EXPORT_COLUMNS, audit_export_query, format_audit_row,
+    export_encoder
+)
+from app.utils.csv_stream import iter_rows_keyset
+
+logger = logging.getLogger(__name__)
+
+# Minimum interval between progress writes of a running job
+PROGRESS_INTERVAL_SECONDS = 2.0
+
+# format -> file extension
+EXPORT_EXTENSIONS = {"csv": "csv", "parquet": "parquet", "arrow": "arrows"}
+
+
+def _json_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if hasattr(value, "value"):
+        return value.value
+    return value
+
+
+def requester_type(principal) -> str:
+    """User, Agent or Merchant: get_current_user may return any of them, each with its own ids."""
+    return type(principal).__name__
+
+
+async def create_export_job(
+    db: AsyncSession,
+    kind: ExportKind,
+    params: dict,
+    current_user,
+    export_format: str = "csv",
+    gzip: bool = False
+) -> ExportJob:
+    """Queue an export of `kind` with the endpoint filters `params` for `current_user`."""
+    job = ExportJob(
+        job_uuid=str(uuid.uuid4()),
+        kind=kind,
+        export_format=export_format,
+        gzip=gzip and export_format == "csv",
+        params={k: _json_value(v) for k, v in params.items() if v is not None},
+        requested_by_type=requester_type(current_user),
+        requested_by_user_id=current_user.id,
+        user_role=current_user.role.value if current_user.role else None,
+        scope_province=getattr(current_user, "scope_province", None),
+        scope_district=getattr(current_user, "scope_district", None),
+        status=ExportJobStatus.QUEUED,
+        rows_written=0,
+        bytes_written=0,
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    logger.info(f"📦 Export job {job.job_uuid} queued: {kind.value} ({export_format}) by user {current_user.id}")
+    return job
+
+
+# ============================================================
+# Job -> query / encoding
+# ============================================================
+def _as_date(value: Optional[str]) -> Optional[date]:
+    return date.fromisoformat(value) if value else None
+
+
+def _as_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _job_plan(job: ExportJob):
+    """(query, created_col, id_col, header, format_row, columns, file name without extension)."""
+    params = job.params or {}
+    if job.kind == ExportKind.TRANSACTIONS:
+        start_date, end_date = _as_date(params.get("start_date")), _as_date(params.get("end_date"))
+        query = transaction_export_query(
+            job.user_role,
+            scope_province=job.scope_province,
+            scope_district=job.scope_district,
+            start_date=start_date,
+            end_date=end_date,
+            tx_status=params.get("status"),
+            payment_method=params.get("payment_method"),
+            province=params.get("province"),
+            district=params.get("district"),
+        )
+        return (
+            query, Transaction.created_at, Transaction.id,
+            TRANSACTION_EXPORT_HEADER, format_transaction_row, TRANSACTION_EXPORT_COLUMNS,
+            transaction_export_filename(start_date, end_date)
+        )
+
+    query = audit_export_query(
+        search=params.get("search"),
+        severity=Severity(params["severity"]) if params.get("severity") else None,
+        event_type=EventType(params["event_type"]) if params.get("event_type") else None,
+        actor_type=ActorType(params["actor_type"]) if params.get("actor_type") else None,
+        action=params.get("action"),
+        entity=params.get("entity"),
+        start_date=_as_datetime(params.get("start_date")),
+        end_date=_as_datetime(params.get("end_date")),
+        actor_id=params.get("actor_id"),
+    )
+    return (
+        query, AuditLog.created_at, AuditLog.id,
+        AUDIT_EXPORT_HEADER, format_audit_row, AUDIT_EXPORT_COLUMNS,
+        f"audit_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    )
+
+
+class _Progress:
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+
+
+async def _counted(rows: AsyncIterator[Sequence], progress: _Progress, limit: Optional[int]) -> AsyncIterator[Sequence]:
+    """Pass chunks through, counting rows and stopping after `limit` rows."""
+    try:
+        async for chunk in rows:
+            if limit is not None:
+                chunk = chunk[:limit - progress.rows]
+            progress.rows += len(chunk)
+            if chunk:
+                yield chunk
+            if limit is not None and progress.rows >= limit:
+                return
+    finally:
+        await rows.aclose()
+
+
+async def _save_progress(db: AsyncSession, job_id: int, **values) -> None:
+    await db.execute(update(ExportJob).where(ExportJob.id == job_id).values(**values))
+    await db.commit()
+
+
+def _encode_to(f, step, *args) -> int:
+    """Run one encoder step and append its bytes to f (called in a worker thread)."""
+    data = step(*args)
+    f.write(data)
+    return len(data)
+
+
+def _remove(path: Optional[str]) -> None:
+    for candidate in (path, f"{path}.part") if path else ():
+        try:
+            os.remove(candidate)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove export file {candidate}: {e}")
+
+
+# ============================================================
+# Worker
+# ============================================================
+async def _claim(db: AsyncSession, job_id: int) -> bool:
+    """QUEUED -> RUNNING, atomically: False if another worker got it first."""
+    now = datetime.now()
+    result = await db.execute(
+        update(ExportJob)
+        .where(ExportJob.id == job_id, ExportJob.status == ExportJobStatus.QUEUED)
+        .values(status=ExportJobStatus.RUNNING, started_at=now, heartbeat_at=now)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def run_export_job(db: AsyncSession, job: ExportJob) -> None:
+    """Write the file of a claimed (RUNNING) job; ends DONE or FAILED."""
+    query, created_col, id_col, header, format_row, columns, base_name = _job_plan(job)
+    limit = (job.params or {}).get("limit")
+
+    os.makedirs(settings.EXPORT_DIR, exist_ok=True)
+    extension = EXPORT_EXTENSIONS[job.export_format]
+    file_name = f"{base_name}.{extension}" + (".gz" if job.gzip else "")
+    file_path = os.path.join(settings.EXPORT_DIR, f"{job.job_uuid}.{extension}" + (".gz" if job.gzip else ""))
+    part_path = f"{file_path}.part"
+
+    progress = _Progress()
+    started = time.monotonic()
+    try:
+        rows_total = (await db.execute(select(func.count()).select_from(query.subquery()))).scalar() or 0
+        if limit is not None:
+            rows_total = min(rows_total, limit)
+        await _save_progress(db, job.id, rows_total=rows_total, file_path=file_path, file_name=file_name)
+
+        rows = _counted(iter_rows_keyset(query, created_col, id_col), progress, limit)
+        encoder = export_encoder(header, format_row, columns, job.export_format, job.gzip)
+        last_saved = time.monotonic()
+        # Encoding (CSV/gzip/Parquet) and file writes run in a thread: when the
+        # jobs run in the API scheduler they must not block its event loop
+        try:
+            with open(part_path, "wb") as f:
+                progress.bytes += await asyncio.to_thread(_encode_to, f, encoder.start)
+                async for chunk in rows:
+                    progress.bytes += await asyncio.to_thread(_encode_to, f, encoder.encode, chunk)
+                    if time.monotonic() - last_saved >= PROGRESS_INTERVAL_SECONDS:
+                        await _save_progress(
+                            db, job.id,
+                            rows_written=progress.rows, bytes_written=progress.bytes, heartbeat_at=datetime.now()
+                        )
+                        last_saved = time.monotonic()
+                progress.bytes += await asyncio.to_thread(_encode_to, f, encoder.finish)
+        finally:
+            encoder.close()
+        os.replace(part_path, file_path)
+
+        now = datetime.now()
+        await _save_progress(
+            db, job.id,
+            status=ExportJobStatus.DONE,
+            rows_written=progress.rows,
+            bytes_written=progress.bytes,
+            heartbeat_at=now,
+            finished_at=now,
+            expires_at=now + timedelta(hours=settings.EXPORT_JOB_RETENTION_HOURS),
+        )
+        logger.info(
+            f"📦 Export job {job.job_uuid} done: {progress.rows} rows, {progress.bytes} bytes "
+            f"in {int((time.monotonic() - started) * 1000)} ms"
+        )
+    except Exception as e:
+        logger.error(f"❌ Export job {job.job_uuid} failed: {e}")
+        await db.rollback()
+        _remove(file_path)
+        await _save_progress(
+            db, job.id,
+            status=ExportJobStatus.FAILED,
+            error=str(getattr(e, "detail", None) or e)[:1000],
+            rows_written=progress.rows,
+            bytes_written=progress.bytes,
+            finished_at=datetime.now(),
+        )
+
+
+async def run_pending_export_jobs(db: AsyncSession, max_jobs: Optional[int] = None) -> int:
+    """Claim and run QUEUED jobs, oldest first, one at a time. Returns jobs run."""
+    done = 0
+    while max_jobs is None or done < max_jobs:
+        job_id = (await db.execute(
+            select(ExportJob.id)
+            .where(ExportJob.status == ExportJobStatus.QUEUED)
+            .order_by(ExportJob.id)
+            .limit(1)
+        )).scalar()
+        await db.rollback()
+        if job_id is None:
+            break
+        if not await _claim(db, job_id):
+            continue
+        job = await db.get(ExportJob, job_id, populate_existing=True)
+        await run_export_job(db, job)
+        done += 1
+    return done
+
+
+async def cleanup_export_jobs(db: AsyncSession) -> dict:
+    """
+    Fail RUNNING jobs whose worker stopped reporting (EXPORT_JOB_STALE_SECONDS)
+    and delete the files of DONE jobs past expires_at (-> EXPIRED).
+    """
+    now = datetime.now()
+    stale = (await db.execute(
+        select(ExportJob.id, ExportJob.file_path)
+        .where(
+            ExportJob.status == ExportJobStatus.RUNNING,
+            ExportJob.heartbeat_at < now - timedelta(seconds=settings.EXPORT_JOB_STALE_SECONDS)
+        )
+    )).all()
+    expired = (await db.execute(
+        select(ExportJob.id, ExportJob.file_path)
+        .where(ExportJob.status == ExportJobStatus.DONE, ExportJob.expires_at < now)
+    )).all()
+
+    for _, path in stale + expired:
+        _remove(path)
+    if stale:
+        await db.execute(
+            update(ExportJob)
+            .where(ExportJob.id.in_([row.id for row in stale]), ExportJob.status == ExportJobStatus.RUNNING)
+            .values(status=ExportJobStatus.FAILED, error="Export worker stopped", finished_at=now)
+        )
+    if expired:
+        await db.execute(
+            update(ExportJob)
+            .where(ExportJob.id.in_([row.id for row in expired]))
+            .values(status=ExportJobStatus.EXPIRED, file_path=None)
+        )
+    await db.commit()
+    return {"failed_stale": len(stale), "expired": len(expired)}
+
+
+async def process_export_jobs(max_jobs: Optional[int] = None) -> dict:
+    """One worker pass: cleanup, then run queued jobs."""
+    async with SessionLocal() as db:
+        summary = await cleanup_export_jobs(db)
+        summary["ran"] = await run_pending_export_jobs(db, max_jobs=max_jobs)
+        return summary
@@ -0,0 +1,276 @@
+"""
+Export definitions shared by the streaming export endpoints and the
+background export jobs: the filtered flat query, CSV header / row format
+and typed columns (Parquet / Arrow) of each exportable dataset.
+
+Queries are returned unordered; callers either order + stream them
+(iter_rows) or hand them to iter_rows_keyset, which orders by
+(created_at, id) itself. Every query selects `id` and the time column.
+"""
+from datetime import date, datetime
+from typing import AsyncIterator, Optional, Sequence
+
+from sqlalchemy import select, and_, or_
+
+from app.models import Transaction, Merchant, Market, Agent, POSDevice, User
+from app.models.audit_log import AuditLog
+
+EXPORT_FORMATS = ("csv", "parquet", "arrow")
+# Roles allowed to export each dataset
+TRANSACTION_EXPORT_ROLES = ["ADMIN", "AUDITOR", "SUPERVISOR", "FUNCIONARIO"]
+AUDIT_EXPORT_ROLES = ["ADMIN", "AUDITOR"]
+
+
+# ============================================================
+# Transactions
+# ============================================================
+TRANSACTION_EXPORT_HEADER = [
+    "UUID", "Data/Hora", "Valor (MZN)", "Status", "Método Pagamento",
+    "Comerciante", "Doc. ID", "Mercado", "Província", "Distrito",
+    "Agente/Funcionário", "POS", "Referência"
+]
+
+# Typed columns for Parquet / Arrow exports: (column, type, query label)
+TRANSACTION_EXPORT_COLUMNS = [
+    ("transaction_uuid", "string", "transaction_uuid"),
+    ("created_at", "timestamp", "created_at"),
+    ("amount", "decimal", "amount"),
+    ("status", "string", "status"),
+    ("payment_method", "string", "payment_method"),
+    ("merchant_name", "string", "merchant_name"),
+    ("merchant_id_document", "string", "id_document_number"),
+    ("market", "string", "market_name"),
+    ("province", "string", "market_province"),
+    ("district", "string", "market_district"),
+    ("agent_code", "string", "agent_code"),
+    ("funcionario", "string", "funcionario_name"),
+    ("pos_serial", "string", "serial_number"),
+    ("payment_reference", "string", "payment_reference"),
+]
+
+
+def transaction_export_query(
+    user_role: Optional[str],
+    scope_province: Optional[str] = None,
+    scope_district: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    tx_status: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    province: Optional[str] = None,
+    district: Optional[str] = None,
+):
+    """Flat projection of the transactions visible to the role/scope, filtered."""
+    from app.utils.date_range import date_range
+
+    query = (
+        select(
+            Transaction.id,
+            Transaction.transaction_uuid,
+            Transaction.created_at,
+            Transaction.amount,
+            Transaction.status,
+            Transaction.payment_method,
+            Merchant.full_name.label("merchant_name"),
+            Merchant.id_document_number,
+            Market.name.label("market_name"),
+            Market.province.label("market_province"),
+            Market.district.label("market_district"),
+            Agent.agent_code,
+            User.full_name.label("funcionario_name"),
+            POSDevice.serial_number,
+            Transaction.payment_reference,
+        )
+        .join(Merchant, Transaction.merchant_id == Merchant.id)
+        .join(Market, Merchant.market_id == Market.id)
+        .outerjoin(Agent, Transaction.agent_id == Agent.id)
+        .outerjoin(User, Transaction.funcionario_id == User.id)
+        .outerjoin(POSDevice, Transaction.pos_id == POSDevice.id)
+    )
+
+    # Location scoping based on role
+    if user_role == "SUPERVISOR" and scope_district:
+        query = query.where(Market.district == scope_district)
+    elif user_role == "FUNCIONARIO" and scope_province:
+        query = query.where(Market.province == scope_province)
+
+    filters = []
+    if start_date:
+        filters.extend(date_range(Transaction.created_at, start_date))
+    if end_date:
+        filters.extend(date_range(Transaction.created_at, end=end_date))
+    if tx_status and tx_status != "ALL":
+        filters.append(Transaction.status == tx_status)
+    if payment_method and payment_method != "ALL":
+        filters.append(Transaction.payment_method == payment_method)
+    if province and province != "ALL":
+        filters.append(Market.province == province)
+    if district:
+        filters.append(Market.district.ilike(f"%{district}%"))
+
+    if filters:
+        query = query.where(and_(*filters))
+    return query
+
+
+def format_transaction_row(row) -> list:
+    return [
+        row.transaction_uuid,
+        row.created_at.isoformat() if row.created_at else "",
+        f"{row.amount:.2f}",
+        row.status.value if hasattr(row.status, 'value') else row.status,
+        row.payment_method.value if hasattr(row.payment_method, 'value') else row.payment_method,
+        row.merchant_name or "",
+        row.id_document_number or "",
+        row.market_name or "",
+        row.market_province or "",
+        row.market_district or "",
+        row.agent_code or row.funcionario_name or "",
+        row.serial_number or "",
+        row.payment_reference or ""
+    ]
+
+
+def transaction_export_filename(start_date: Optional[date] = None, end_date: Optional[date] = None) -> str:
+    """File name without extension, e.g. transacoes_2026-01-01_to_2026-01-31_20260201_101500."""
+    date_suffix = ""
+    if start_date and end_date:
+        date_suffix = f"_{start_date.isoformat()}_to_{end_date.isoformat()}"
+    elif start_date:
+        date_suffix = f"_from_{start_date.isoformat()}"
+    elif end_date:
+        date_suffix = f"_until_{end_date.isoformat()}"
+    return f"transacoes{date_suffix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+
+# ============================================================
+# Audit logs
+# ============================================================
+AUDIT_EXPORT_HEADER = [
+    "ID", "Data/Hora", "Severidade", "Tipo Evento",
+    "Tipo Ator", "ID Ator", "Nome Ator", "Role Ator", "Jurisdição Ator",
+    "Ação", "Entidade", "ID Entidade", "Descrição", "IP", "User Agent"
+]
+
+# Typed columns for Parquet / Arrow exports: (column, type, query label)
+AUDIT_EXPORT_COLUMNS = [
+    ("id", "int64", "id"),
+    ("created_at", "timestamp", "created_at"),
+    ("severity", "string", "severity"),
+    ("event_type", "string", "event_type"),
+    ("actor_type", "string", "actor_type"),
+    ("actor_id", "int64", "actor_id"),
+    ("actor_name", "string", "actor_name"),
+    ("actor_role", "string", "actor_role"),
+    ("actor_province", "string", "actor_province"),
+    ("actor_district", "string", "actor_district"),
+    ("action", "string", "action"),
+    ("entity", "string", "entity"),
+    ("entity_id", "int64", "entity_id"),
+    ("description", "string", "description"),
+    ("ip_address", "string", "ip_address"),
+    ("user_agent", "string", "user_agent"),
+]
+
+
+def audit_export_query(
+    search: Optional[str] = None,
+    severity=None,
+    event_type=None,
+    actor_type=None,
+    action: Optional[str] = None,
+    entity: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    actor_id: Optional[int] = None,
+):
+    """Flat projection of audit_logs (no before/after JSON), filtered."""
+    query = select(
+        AuditLog.id,
+        AuditLog.created_at,
+        AuditLog.severity,
+        AuditLog.event_type,
+        AuditLog.actor_type,
+        AuditLog.actor_id,
+        AuditLog.actor_name,
+        AuditLog.actor_role,
+        AuditLog.actor_province,
+        AuditLog.actor_district,
+        AuditLog.action,
+        AuditLog.entity,
+        AuditLog.entity_id,
+        AuditLog.description,
+        AuditLog.ip_address,
+        AuditLog.user_agent,
+    )
+
+    if search:
+        search_filter = f"%{search}%"
+        query = query.where(
+            or_(
+                AuditLog.description.ilike(search_filter),
+                AuditLog.actor_name.ilike(search_filter),
+                AuditLog.entity.ilike(search_filter),
+                AuditLog.action.ilike(search_filter)
+            )
+        )
+    if severity: query = query.where(AuditLog.severity == severity)
+    if event_type: query = query.where(AuditLog.event_type == event_type)
+    if actor_type: query = query.where(AuditLog.actor_type == actor_type)
+    if actor_id: query = query.where(AuditLog.actor_id == actor_id)
+    if action: query = query.where(AuditLog.action.ilike(f"%{action}%"))
+    if entity: query = query.where(AuditLog.entity.ilike(f"%{entity}%"))
+    if start_date: query = query.where(AuditLog.created_at >= start_date)
+    if end_date: query = query.where(AuditLog.created_at <= end_date)
+    return query
+
+
+def format_audit_row(log) -> list:
+    return [
+        log.id,
+        log.created_at.isoformat() if log.created_at else "",
+        log.severity.value if log.severity else "",
+        log.event_type.value if log.event_type else "",
+        log.actor_type.value if log.actor_type else "",
+        log.actor_id,
+        log.actor_name,
+        log.actor_role,
+        f"{log.actor_province}/{log.actor_district}" if log.actor_province else "",
+        log.action,
+        log.entity,
+        log.entity_id,
+        log.description,
+        log.ip_address,
+        log.user_agent
+    ]
+
+
+# ============================================================
+# Encoding
+# ============================================================
+def export_encoder(header: Sequence[str], format_row, columns, export_format: str, gzip: bool = False):
+    """Synchronous encoder (start / encode(chunk) / finish) for the requested format."""
+    from app.utils.csv_stream import CsvEncoder
+    from app.utils.columnar_stream import ColumnarEncoder
+
+    if export_format != "csv":
+        return ColumnarEncoder(columns, export_format)
+    return CsvEncoder(header, format_row, gzip=gzip)
+
+
+def encode_export(
+    rows: AsyncIterator[Sequence],
+    header: Sequence[str],
+    format_row,
+    columns,
+    export_format: str,
+    gzip: bool = False
+) -> AsyncIterator[bytes]:
+    """Byte stream of `rows` in the requested format (gzip applies to CSV only)."""
+    from app.utils.csv_stream import iter_csv, gzip_stream
+    from app.utils.columnar_stream import iter_columnar
+
+    if export_format != "csv":
+        return iter_columnar(rows, columns, export_format)
+    body = iter_csv(rows, header, format_row)
+    return gzip_stream(body) if gzip else body
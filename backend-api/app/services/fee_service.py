@@ -1,69 +1,54 @@
-from datetime import date
+from datetime import date, datetime
+from typing import Dict, List, Optional
+import logging
 import math
+import time
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, func, update
 
 from app.models import Merchant, PaymentStatus, MerchantFeePayment, Transaction, TransactionStatus
 from app.tasks.scheduled_tasks import DAILY_FEE_AMOUNT, FEE_START_DATE
 
-async def validate_merchant_payment_status(merchant: Merchant, db: AsyncSession) -> Merchant:
+logger = logging.getLogger(__name__)
+
+# Rows per bulk UPDATE (and per commit) in the nightly reconciliation
+RECONCILE_CHUNK_SIZE = 1000
+
+
+def calculate_expected_amount(
+    billing_start_date: Optional[date],
+    registered_at: Optional[datetime],
+    today: date
+) -> float:
     """
-    Real-time validation of merchant payment status.
-    Calculates expected fees vs total paid (Direct Fees + Sales Transactions).
-    
-    Logic: Total Paid = Sum(FeePayments) + Sum(Transactions where status=SUCESSO)
+    Expected fee total from the billing start date up to (and including) today.
+    Priority: Admin Override (billing_start_date) > Registration Date.
     """
-    
-    today = date.today()
-    
-    # 1. Determine effective billing start date
-    reg_date = merchant.registered_at.date() if merchant.registered_at else today
-    
-    # Priority: Admin Override > Reg Date
-    billing_start_date = merchant.billing_start_date or reg_date
-    
+    reg_date = registered_at.date() if registered_at else today
+    start = billing_start_date or reg_date
+
     # If billing start date is in future, no fees yet
-    if billing_start_date > today:
-        days_billed = 0
-    else:
-        # Inclusive of today (Dia 01 a Dia 03 = 3 dias = 30 MT)
-        days_billed = (today - billing_start_date).days + 1
-    
-    # Safety
-    if days_billed < 0:
-        days_billed = 0
-            
-    expected_amount = round(days_billed * DAILY_FEE_AMOUNT, 2)
-    
-    # 2. Get total paid (Direct Fees)
-    fee_result = await db.execute(
-        select(func.sum(MerchantFeePayment.amount))
-        .where(MerchantFeePayment.merchant_id == merchant.id)
-    )
-    direct_fees = float(fee_result.scalar() or 0.0)
-    
-    # 3. Get total collected via Transactions (M-Pesa, etc)
-    # User clarification: 'Transactions' table represents Fee Payments to the municipality.
-    # It is NOT merchant sales revenue.
-    tx_result = await db.execute(
-        select(func.sum(Transaction.amount))
-        .where(
-            Transaction.merchant_id == merchant.id,
-            Transaction.status == TransactionStatus.SUCESSO
-        )
+    if start > today:
+        return 0.0
+
+    # Inclusive of today (Dia 01 a Dia 03 = 3 dias = 30 MT)
+    days_billed = (today - start).days + 1
+    return round(days_billed * DAILY_FEE_AMOUNT, 2)
+
+
+def apply_fee_status(merchant: Merchant, total_paid: float, today: Optional[date] = None) -> bool:
+    """
+    Apply REGULAR/IRREGULAR status, overdue and credit balances to the merchant
+    (in memory only) from a known total paid. Returns True if anything changed.
+    """
+    today = today or date.today()
+    expected_amount = calculate_expected_amount(
+        merchant.billing_start_date, merchant.registered_at, today
     )
-    transaction_payments = float(tx_result.scalar() or 0.0)
-    
-    total_paid = round(direct_fees + transaction_payments, 2)
     
-    # 4. Compare with epsilon for float safety
-    balance = total_paid - expected_amount
+    # Compare with epsilon for float safety
+    balance = round(total_paid, 2) - expected_amount
     
-    status_changed = False
-    
-    # Debug log (optional, remove later if spammy)
-    # print(f"DEBUG: Merchant {merchant.id} | Days: {days_billed} | Exp: {expected_amount} | Paid: {total_paid} | Balance: {balance}")
-
     if balance >= -0.01: # Allow 0.01 float error margin
         # REGULAR (Possivelmente com crédito)
         credit_amount = balance if balance > 0 else 0.00
@@ -76,7 +61,7 @@ async def validate_merchant_payment_status(merchant: Merchant, db: AsyncSession)
             merchant.days_overdue = 0
             merchant.overdue_balance = 0.00
             merchant.credit_balance = credit_amount
-            status_changed = True
+            return True
     else:
         # IRREGULAR
         overdue_amount = abs(balance)
@@ -90,12 +75,344 @@ async def validate_merchant_payment_status(merchant: Merchant, db: AsyncSession)
             merchant.days_overdue = new_days_overdue
             merchant.overdue_balance = overdue_amount
             merchant.credit_balance = 0.00
-            status_changed = True
-            
-    # If status changed, commit it so subsequent reads are fast
-    if status_changed:
-        db.add(merchant)
-        await db.commit()
-        await db.refresh(merchant)
-        
+            return True
+    
+    return False
+
+
+async def _sum_paid_from_history(db: AsyncSession, merchant_id: int) -> float:
+    """Total paid recomputed from history (fallback when the ledger is not built yet)."""
+    # Direct Fees
+    fee_result = await db.execute(
+        select(func.sum(MerchantFeePayment.amount))
+        .where(MerchantFeePayment.merchant_id == merchant_id)
+    )
+    direct_fees = float(fee_result.scalar() or 0.0)
+    
+    # Transactions (M-Pesa, etc)
+    # User clarification: 'Transactions' table represents Fee Payments to the municipality.
+    # It is NOT merchant sales revenue.
+    tx_result = await db.execute(
+        select(func.sum(Transaction.amount))
+        .where(
+            Transaction.merchant_id == merchant_id,
+            Transaction.status == TransactionStatus.SUCESSO
+        )
+    )
+    transaction_payments = float(tx_result.scalar() or 0.0)
+    
+    return round(direct_fees + transaction_payments, 2)
+
+
+async def _sum_paid_from_history_bulk(db: AsyncSession, merchant_ids: List[int]) -> Dict[int, float]:
+    """
+    Batch version of _sum_paid_from_history: one grouped query per source
+    table for all the given merchants. Merchants with no payments map to 0.0.
+    """
+    totals = {merchant_id: 0.0 for merchant_id in merchant_ids}
+    if not merchant_ids:
+        return totals
+
+    fee_result = await db.execute(
+        select(MerchantFeePayment.merchant_id, func.sum(MerchantFeePayment.amount))
+        .where(MerchantFeePayment.merchant_id.in_(merchant_ids))
+        .group_by(MerchantFeePayment.merchant_id)
+    )
+    for merchant_id, total in fee_result:
+        totals[merchant_id] += float(total or 0.0)
+
+    tx_result = await db.execute(
+        select(Transaction.merchant_id, func.sum(Transaction.amount))
+        .where(
+            Transaction.merchant_id.in_(merchant_ids),
+            Transaction.status == TransactionStatus.SUCESSO
+        )
+        .group_by(Transaction.merchant_id)
+    )
+    for merchant_id, total in tx_result:
+        totals[merchant_id] += float(total or 0.0)
+
+    return {merchant_id: round(total, 2) for merchant_id, total in totals.items()}
+
+
+async def validate_merchant_payment_status(merchant: Merchant, db: AsyncSession) -> Merchant:
+    """
+    Real-time validation of merchant payment status.
+    Calculates expected fees vs total paid (Direct Fees + Sales Transactions).
+    
+    Logic: Total Paid = Sum(FeePayments) + Sum(Transactions where status=SUCESSO)
+    
+    Total paid comes from the incremental ledger (merchant.fee_total_paid), so
+    this is an in-memory calculation with no queries. Only merchants whose
+    ledger was never built fall back to summing history. Nothing is committed
+    here: persisted status is kept by the write paths and the nightly check.
+    """
+    if merchant.fee_total_paid is not None:
+        total_paid = float(merchant.fee_total_paid)
+    else:
+        total_paid = await _sum_paid_from_history(db, merchant.id)
+    
+    apply_fee_status(merchant, total_paid)
     return merchant
+
+
+async def validate_merchants_payment_status(merchants: List[Merchant], db: AsyncSession) -> int:
+    """
+    Batch version of validate_merchant_payment_status for list pages.
+
+    Merchants with a built ledger are validated in memory; the rest have their
+    totals resolved together (one grouped query per source table, not two
+    queries per merchant). Status changes are written with a single flush;
+    the caller decides whether to commit.
+
+    Returns the number of merchants whose status changed.
+    """
+    if not merchants:
+        return 0
+
+    today = date.today()
+    missing_ids = [m.id for m in merchants if m.fee_total_paid is None]
+    history_totals = await _sum_paid_from_history_bulk(db, missing_ids)
+
+    changed = 0
+    for merchant in merchants:
+        if merchant.fee_total_paid is not None:
+            total_paid = float(merchant.fee_total_paid)
+        else:
+            total_paid = history_totals.get(merchant.id, 0.0)
+        if apply_fee_status(merchant, total_paid, today):
+            changed += 1
+
+    if changed:
+        await db.flush()
+    return changed
+
+
+async def apply_fee_ledger_delta(
+    db: AsyncSession,
+    merchant_id: int,
+    amount,
+    merchant: Optional[Merchant] = None
+) -> None:
+    """
+    Add `amount` (negative to reverse) to the merchant's fee ledger.
+    Call when a Transaction turns SUCESSO (or leaves it) or a MerchantFeePayment
+    is recorded, inside the same DB transaction as that write.
+    
+    The increment is done in SQL so concurrent payments never lose updates.
+    A NULL ledger (never built) stays NULL until rebuild_fee_ledger runs.
+    If the merchant instance is given, its ledger value and fee status are
+    refreshed in memory so the caller's commit persists the new status too.
+    """
+    if not amount:
+        return
+    
+    await db.execute(
+        update(Merchant)
+        .where(Merchant.id == merchant_id)
+        .values(fee_total_paid=Merchant.fee_total_paid + amount)
+        .execution_options(synchronize_session=False)
+    )
+    
+    if merchant is not None:
+        await db.refresh(merchant, attribute_names=["fee_total_paid"])
+        if merchant.fee_total_paid is not None:
+            apply_fee_status(merchant, float(merchant.fee_total_paid))
+
+
+async def rebuild_fee_ledger(db: AsyncSession, check_only: bool = False, today: Optional[date] = None) -> dict:
+    """
+    Recompute every merchant's fee ledger from history (grouped aggregates)
+    and compare it with the stored value.
+    
+    - check_only=True: only report drift, nothing is written
+    - otherwise: write corrected totals for drifted merchants and stamp
+      fee_ledger_reconciled_date on all of them, in chunks
+    
+    Safe to run with live traffic: the totals written are not the ones from
+    the drift scan but recomputed per chunk after locking the chunk's merchant
+    rows (SELECT ... FOR UPDATE). A payment committed before the lock is in
+    the recomputed sum; one still in flight waits on the lock for its ledger
+    increment (apply_fee_ledger_delta) and applies it on top of the corrected
+    total, NULL ledgers included.
+    
+    Returns a summary with the drifted merchants (id, stored, actual).
+    """
+    started = time.perf_counter()
+    today = today or date.today()
+    
+    fee_totals = (
+        select(
+            MerchantFeePayment.merchant_id.label("merchant_id"),
+            func.sum(MerchantFeePayment.amount).label("total")
+        )
+        .group_by(MerchantFeePayment.merchant_id)
+        .subquery()
+    )
+    tx_totals = (
+        select(
+            Transaction.merchant_id.label("merchant_id"),
+            func.sum(Transaction.amount).label("total")
+        )
+        .where(Transaction.status == TransactionStatus.SUCESSO)
+        .group_by(Transaction.merchant_id)
+        .subquery()
+    )
+    
+    result = await db.execute(
+        select(
+            Merchant.id,
+            Merchant.fee_total_paid,
+            func.coalesce(fee_totals.c.total, 0).label("direct_fees"),
+            func.coalesce(tx_totals.c.total, 0).label("transaction_payments"),
+        )
+        .outerjoin(fee_totals, fee_totals.c.merchant_id == Merchant.id)
+        .outerjoin(tx_totals, tx_totals.c.merchant_id == Merchant.id)
+    )
+    
+    checked = 0
+    drift = []
+    in_sync_ids = []
+    
+    for row in result:
+        checked += 1
+        actual = round(float(row.direct_fees) + float(row.transaction_payments), 2)
+        stored = float(row.fee_total_paid) if row.fee_total_paid is not None else None
+        
+        if stored is None or abs(stored - actual) > 0.005:
+            drift.append({"merchant_id": row.id, "stored": stored, "actual": actual})
+        else:
+            in_sync_ids.append(row.id)
+    
+    await db.commit()
+    
+    if not check_only:
+        # Only drifted rows get their total rewritten; in-sync rows just get stamped.
+        for i in range(0, len(drift), RECONCILE_CHUNK_SIZE):
+            chunk = drift[i:i + RECONCILE_CHUNK_SIZE]
+            ids = [d["merchant_id"] for d in chunk]
+            # Lock first, then sum (the read snapshot starts after the lock)
+            await db.execute(select(Merchant.id).where(Merchant.id.in_(ids)).with_for_update())
+            totals = await _sum_paid_from_history_bulk(db, ids)
+            for d in chunk:
+                d["actual"] = totals[d["merchant_id"]]
+            await db.execute(
+                update(Merchant),
+                [{"id": merchant_id, "fee_total_paid": totals[merchant_id], "fee_ledger_reconciled_date": today}
+                 for merchant_id in ids]
+            )
+            await db.commit()
+        
+        for i in range(0, len(in_sync_ids), RECONCILE_CHUNK_SIZE):
+            await db.execute(
+                update(Merchant)
+                .where(Merchant.id.in_(in_sync_ids[i:i + RECONCILE_CHUNK_SIZE]))
+                .values(fee_ledger_reconciled_date=today)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+    
+    summary = {
+        "checked": checked,
+        "drifted": len(drift),
+        "drift": drift,
+        "written": 0 if check_only else len(drift),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+    logger.info(f"Fee ledger {'check' if check_only else 'rebuild'} finished: checked={checked} drifted={len(drift)}")
+    return summary
+
+
+async def reconcile_all_merchants(db: AsyncSession, today: Optional[date] = None) -> dict:
+    """
+    Set-based version of the daily fee check for every ATIVO merchant.
+
+    Instead of two SUM queries per merchant, totals come from ONE statement:
+    merchants LEFT JOIN (fees GROUP BY merchant) LEFT JOIN (successful
+    transactions GROUP BY merchant). Status changes are written with bulk
+    UPDATEs by primary key in chunks of RECONCILE_CHUNK_SIZE, committing after
+    each chunk so row locks are not held for the whole run.
+
+    Decision rules are the same as the per-merchant check:
+    - balance >= -0.01 -> REGULAR (days_overdue reset only when status changes)
+    - otherwise        -> IRREGULAR, days_overdue = ceil(overdue / DAILY_FEE_AMOUNT)
+
+    Returns a summary dict with counters and duration_ms.
+    """
+    started = time.perf_counter()
+    today = today or date.today()
+
+    fee_totals = (
+        select(
+            MerchantFeePayment.merchant_id.label("merchant_id"),
+            func.sum(MerchantFeePayment.amount).label("total")
+        )
+        .group_by(MerchantFeePayment.merchant_id)
+        .subquery()
+    )
+    tx_totals = (
+        select(
+            Transaction.merchant_id.label("merchant_id"),
+            func.sum(Transaction.amount).label("total")
+        )
+        .where(Transaction.status == TransactionStatus.SUCESSO)
+        .group_by(Transaction.merchant_id)
+        .subquery()
+    )
+
+    result = await db.execute(
+        select(
+            Merchant.id,
+            Merchant.billing_start_date,
+            Merchant.registered_at,
+            Merchant.payment_status,
+            Merchant.days_overdue,
+            func.coalesce(fee_totals.c.total, 0).label("direct_fees"),
+            func.coalesce(tx_totals.c.total, 0).label("transaction_payments"),
+        )
+        .outerjoin(fee_totals, fee_totals.c.merchant_id == Merchant.id)
+        .outerjoin(tx_totals, tx_totals.c.merchant_id == Merchant.id)
+        .where(Merchant.status == "ATIVO")
+    )
+
+    checked = 0
+    regular_count = 0
+    irregular_count = 0
+    changes = []
+
+    for row in result:
+        checked += 1
+        expected_amount = calculate_expected_amount(row.billing_start_date, row.registered_at, today)
+        total_paid = round(float(row.direct_fees) + float(row.transaction_payments), 2)
+        balance = total_paid - expected_amount
+
+        if balance >= -0.01:
+            # REGULAR (Paid enough or in advance)
+            regular_count += 1
+            if row.payment_status != PaymentStatus.REGULAR:
+                changes.append({"id": row.id, "payment_status": PaymentStatus.REGULAR, "days_overdue": 0})
+        else:
+            # IRREGULAR (Owes money)
+            irregular_count += 1
+            days_overdue = math.ceil(abs(balance) / DAILY_FEE_AMOUNT)
+            if row.payment_status != PaymentStatus.IRREGULAR or row.days_overdue != days_overdue:
+                changes.append({"id": row.id, "payment_status": PaymentStatus.IRREGULAR, "days_overdue": days_overdue})
+
+    # Release the read transaction before writing
+    await db.commit()
+
+    for i in range(0, len(changes), RECONCILE_CHUNK_SIZE):
+        chunk = changes[i:i + RECONCILE_CHUNK_SIZE]
+        await db.execute(update(Merchant), chunk)
+        await db.commit()
+
+    summary = {
+        "date": today.isoformat(),
+        "checked": checked,
+        "regular": regular_count,
+        "irregular": irregular_count,
+        "updated": len(changes),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+    logger.info(f"Fee reconciliation finished: {summary}")
+    return summary
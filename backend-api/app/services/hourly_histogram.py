@@ -0,0 +1,155 @@
+"""
+Histograma horário de transações SUCESSO de hoje (por worker, em memória).
+
+Serves /reports/chart/hourly without querying transactions: counts per
+(province, district) x hour of today, where province/district is the
+transaction's location snapshot, falling back to its merchant's market.
+
+- Seeded from the DB at startup (seed_hourly_histogram).
+- Incremented when a transaction becomes SUCESSO (and decremented when it
+  leaves SUCESSO) through queue_hourly_change(db, ...); the change is
+  applied only after the session commits (dropped on rollback).
+- Each worker only sees its own increments, so the chart resyncs from the
+  DB at most every HOURLY_HISTOGRAM_RESYNC_SECONDS (one grouped query),
+  which also absorbs writes made by other workers or by SQL.
+"""
+import logging
+import time
+from datetime import date, datetime
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, extract, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.utils.date_range import on_day
+
+logger = logging.getLogger(__name__)
+
+ScopeKey = Tuple[Optional[str], Optional[str]]
+
+
+class HourlyHistogram:
+    def __init__(self, resync_seconds: int = 60):
+        self.resync_seconds = resync_seconds
+        self._day: Optional[date] = None
+        self._counts: Dict[ScopeKey, List[int]] = {}
+        self._synced_at: Optional[float] = None
+        self._lock = Lock()
+
+    def _roll_day(self, today: date) -> None:
+        # Caller holds the lock
+        if self._day != today:
+            self._day = today
+            self._counts = {}
+            self._synced_at = None
+
+    def needs_resync(self) -> bool:
+        with self._lock:
+            return (
+                self._synced_at is None
+                or self._day != date.today()
+                or time.monotonic() - self._synced_at >= self.resync_seconds
+            )
+
+    def replace(self, day: date, counts: Dict[ScopeKey, List[int]]) -> None:
+        with self._lock:
+            self._day = day
+            self._counts = counts
+            self._synced_at = time.monotonic()
+
+    def add(self, when: datetime, province: Optional[str], district: Optional[str], delta: int = 1) -> None:
+        with self._lock:
+            self._roll_day(date.today())
+            if when.date() != self._day:
+                return
+            hours = self._counts.setdefault((province, district), [0] * 24)
+            hours[when.hour] = max(0, hours[when.hour] + delta)
+
+    def counts(self, province: Optional[str] = None, district: Optional[str] = None) -> List[int]:
+        """Counts per hour (0-23) for today, summed over the matching scopes."""
+        with self._lock:
+            self._roll_day(date.today())
+            total = [0] * 24
+            for (p, d), hours in self._counts.items():
+                if province and p != province:
+                    continue
+                if district and d != district:
+                    continue
+                total = [a + b for a, b in zip(total, hours)]
+            return total
+
+
+hourly_histogram = HourlyHistogram(resync_seconds=settings.HOURLY_HISTOGRAM_RESYNC_SECONDS)
+
+
+async def seed_hourly_histogram(db: AsyncSession) -> None:
+    """Load today's SUCESSO counts per scope and hour from the DB."""
+    from app.models import Transaction, TransactionStatus, Merchant, Market
+
+    today = date.today()
+    province = func.coalesce(Transaction.province, Market.province)
+    district = func.coalesce(Transaction.district, Market.district)
+    hour = extract('hour', Transaction.created_at)
+    rows = (await db.execute(
+        select(province, district, hour, func.count(Transaction.id))
+        .join(Merchant, Transaction.merchant_id == Merchant.id)
+        .join(Market, Merchant.market_id == Market.id)
+        .where(Transaction.status == TransactionStatus.SUCESSO, *on_day(Transaction.created_at, today))
+        .group_by(province, district, hour)
+    )).all()
+
+    counts: Dict[ScopeKey, List[int]] = {}
+    for p, d, h, n in rows:
+        counts.setdefault((p, d), [0] * 24)[int(h)] += n
+    hourly_histogram.replace(today, counts)
+
+
+# ============================================================
+# Changes applied on commit
+# ============================================================
+_PENDING_KEY = "hourly_histogram_pending"
+
+
+def queue_hourly_change(
+    db: AsyncSession,
+    when: Optional[datetime],
+    province: Optional[str],
+    district: Optional[str],
+    delta: int = 1
+) -> None:
+    """Count (delta=1) or uncount (delta=-1) a SUCESSO transaction once `db` commits."""
+    db.info.setdefault(_PENDING_KEY, []).append((when or datetime.now(), province, district, delta))
+
+
+async def transaction_scope(
+    db: AsyncSession,
+    merchant_id: int,
+    province: Optional[str],
+    district: Optional[str]
+) -> ScopeKey:
+    """(province, district) of a transaction: its snapshot, else its merchant's market."""
+    if province and district:
+        return province, district
+    from app.models import Merchant, Market
+    market = (await db.execute(
+        select(Market.province, Market.district)
+        .join(Merchant, Merchant.market_id == Market.id)
+        .where(Merchant.id == merchant_id)
+    )).first()
+    if market is None:
+        return province, district
+    return province or market.province, district or market.district
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_hourly_changes(session):
+    for when, province, district, delta in session.info.pop(_PENDING_KEY, ()):
+        hourly_histogram.add(when, province, district, delta)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_hourly_changes(session):
+    session.info.pop(_PENDING_KEY, None)
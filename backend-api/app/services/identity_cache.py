@@ -0,0 +1,211 @@
+"""
+Cache de identidades resolvidas por get_current_user (por worker).
+
+Each gunicorn worker keeps its own TTL/LRU map of JWT (sub, role) -> resolved
+principal (User, or Merchant/Agent duck-typed as a user), so the common
+authenticated request costs a JWT decode and no queries.
+
+Cached principals are detached from any session and shared between requests:
+treat them as read-only and re-load by id before modifying them.
+
+Invalidation: commits that change or delete a User, Agent or Merchant drop
+that principal, whether through the ORM or a bulk update()/delete()
+statement (by id when the statement targets ids, otherwise every cached
+principal of that type); changes to a Market drop everything (agent/merchant
+scope comes from the market). Other workers only see the change after the TTL, so
+keep IDENTITY_CACHE_TTL_SECONDS short.
+"""
+import logging
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, Optional[str]]
+
+
+class IdentityCache:
+    def __init__(self, max_size: int = 5000, ttl_seconds: int = 60):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[CacheKey, tuple]" = OrderedDict()
+        # (principal type, id) -> keys, so writes can find the cached entries
+        self._index: dict = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def principal_ref(principal: Any) -> Tuple[str, Any]:
+        return (type(principal).__name__, getattr(principal, "id", None))
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        if self.ttl_seconds <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: CacheKey, principal: Any) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        ref = self.principal_ref(principal)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, principal, ref)
+            self._index.setdefault(ref, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, principal_type: str, principal_id: Any) -> None:
+        with self._lock:
+            keys = self._index.pop((principal_type, principal_id), ())
+            for key in list(keys):
+                self._remove(key)
+            if keys:
+                self.invalidations += 1
+
+    def invalidate_type(self, principal_type: str) -> None:
+        with self._lock:
+            refs = [ref for ref in self._index if ref[0] == principal_type]
+            for ref in refs:
+                for key in list(self._index.get(ref, ())):
+                    self._remove(key)
+            if refs:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._index.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._index.get(entry[2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._index[entry[2]]
+
+
+identity_cache = IdentityCache(
+    max_size=settings.IDENTITY_CACHE_MAX_SIZE,
+    ttl_seconds=settings.IDENTITY_CACHE_TTL_SECONDS,
+)
+
+
+# ============================================================
+# Invalidation on commit (covers every router, approvals included)
+# ============================================================
+_PRINCIPAL_TYPES = ("User", "Agent", "Merchant")
+_PENDING_KEY = "identity_cache_pending"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_principal_changes(session, flush_context):
+    pending = session.info.setdefault(_PENDING_KEY, set())
+    for obj in list(session.dirty) + list(session.deleted):
+        name = type(obj).__name__
+        if name in _PRINCIPAL_TYPES:
+            pending.add((name, getattr(obj, "id", None)))
+        elif name == "Market":
+            pending.add(("Market", None))
+
+
+def _bulk_target_ids(orm_execute_state, mapper) -> Optional[List[Any]]:
+    """
+    Ids hit by a bulk update/delete: the "id" of each parameter set
+    (update(Model), [{"id": ..., ...}, ...]) or a `Model.id == x` /
+    `Model.id.in_(...)` WHERE clause. None when they cannot be told.
+    """
+    params = orm_execute_state.parameters
+    if isinstance(params, list) and params and all("id" in p for p in params):
+        return [p["id"] for p in params]
+    
+    clause = orm_execute_state.statement.whereclause
+    id_column = mapper.columns.get("id")
+    if (
+        isinstance(clause, BinaryExpression)
+        and id_column is not None
+        and clause.left.compare(id_column)
+        and isinstance(clause.right, BindParameter)
+    ):
+        if clause.operator is operators.eq:
+            return [clause.right.value]
+        if clause.operator is operators.in_op:
+            return list(clause.right.value)
+    return None
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_principal_changes(orm_execute_state):
+    # Core-style update(Merchant)... statements never show up in session.dirty
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    name = mapper.class_.__name__ if mapper is not None else None
+    if name not in _PRINCIPAL_TYPES and name != "Market":
+        return
+    
+    pending = orm_execute_state.session.info.setdefault(_PENDING_KEY, set())
+    if name == "Market":
+        pending.add(("Market", None))
+        return
+    ids = _bulk_target_ids(orm_execute_state, mapper)
+    if ids is None:
+        pending.add((name, None))  # Every cached principal of this type
+    else:
+        pending.update((name, principal_id) for principal_id in ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_principal_changes(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    if ("Market", None) in pending:
+        identity_cache.clear()
+        return
+    for principal_type, principal_id in pending:
+        if principal_id is None:
+            identity_cache.invalidate_type(principal_type)
+        else:
+            identity_cache.invalidate(principal_type, principal_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_principal_changes(session):
+    session.info.pop(_PENDING_KEY, None)
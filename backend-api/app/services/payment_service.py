@@ -1,11 +1,64 @@
 from app.config import settings
-from portalsdk.api import APIContext, APIRequest, APIMethodType
+from portalsdk.api import APIClient, APIContext, APIRequest, APIMethodType
+from typing import Optional
+import asyncio
 import json
 import logging
-from pprint import pprint
+
+import httpx
 
 logger = logging.getLogger(__name__)
 
+C2B_PATH = '/ipg/v1x/c2bPayment/singleStage/'
+QUERY_STATUS_PATH = '/ipg/v1x/queryTransactionStatus/'
+
+# Shared portalsdk client (keep-alive session, parsed key + bearer token cache)
+_sdk_client: Optional[APIClient] = None
+
+
+def get_sdk_client() -> APIClient:
+    global _sdk_client
+    if _sdk_client is None:
+        _sdk_client = APIClient(
+            pool_maxsize=settings.PORTAL_MAX_CONNECTIONS,
+            token_lifetime=settings.PORTAL_TOKEN_LIFETIME_SECONDS,
+            timeout=(settings.PORTAL_CONNECT_TIMEOUT_SECONDS, settings.PORTAL_TIMEOUT_SECONDS)
+        )
+    return _sdk_client
+
+
+# Shared async HTTP client (one connection pool per worker), created lazily
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_lock = asyncio.Lock()
+
+
+async def get_async_client() -> httpx.AsyncClient:
+    """Pooled keep-alive client for the payment gateway (per worker)."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        async with _async_client_lock:
+            if _async_client is None or _async_client.is_closed:
+                _async_client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(
+                        settings.PORTAL_TIMEOUT_SECONDS,
+                        connect=settings.PORTAL_CONNECT_TIMEOUT_SECONDS
+                    ),
+                    limits=httpx.Limits(
+                        max_connections=settings.PORTAL_MAX_CONNECTIONS,
+                        max_keepalive_connections=settings.PORTAL_MAX_CONNECTIONS
+                    ),
+                )
+    return _async_client
+
+
+async def close_async_client():
+    """Close the shared gateway client (application shutdown)."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
 class PaymentService:
     def __init__(self):
         self.api_key = settings.PORTAL_API_KEY
@@ -13,6 +66,7 @@ class PaymentService:
         self.address = settings.PORTAL_ADDRESS
         self.port = settings.PORTAL_PORT
         self.ssl = settings.PORTAL_SSL
+        self.shortcode = settings.PORTAL_SHORTCODE if hasattr(settings, 'PORTAL_SHORTCODE') else "171717"
 
     def _create_context(self, method_type: APIMethodType, path: str, parameters: dict) -> APIContext:
         return APIContext(
@@ -27,90 +81,93 @@ class PaymentService:
             parameters=parameters
         )
 
-    def process_c2b_payment(self, amount: float, reference: str, customer_msisdn: str, third_party_reference: str) -> dict:
-        """
-        Process a C2B payment request (Push USSD to customer)
-        Standard M-Pesa C2B Single Stage
-        """
-        payload = {
+    def _c2b_payload(self, amount: float, reference: str, customer_msisdn: str, third_party_reference: str) -> dict:
+        return {
             "input_Amount": f"{int(amount)}" if amount.is_integer() else f"{amount:.2f}",
             "input_CustomerMSISDN": f"258{customer_msisdn}" if not customer_msisdn.startswith("258") else customer_msisdn,
-            "input_ServiceProviderCode": settings.PORTAL_SHORTCODE if hasattr(settings, 'PORTAL_SHORTCODE') else "171717",
+            "input_ServiceProviderCode": self.shortcode,
             "input_TransactionReference": reference,
             "input_ThirdPartyReference": third_party_reference
         }
-        
-        # Determine path - typically /ipg/v1x/c2bPayment/singleStage/
-        # Adjust based on specific gateway documentation provided or assumed
-        path = '/ipg/v1x/c2bPayment/singleStage/' 
 
+    def _status_payload(self, transaction_ref: str, service_provider_code: str = None) -> dict:
+        return {
+             "input_QueryReference": transaction_ref,
+             "input_ServiceProviderCode": service_provider_code or self.shortcode,
+             "input_ThirdPartyReference": transaction_ref # Sometimes required
+        }
+
+    @staticmethod
+    def _normalize_c2b_response(status_code: int, body: dict) -> dict:
+        """
+        Normalise a gateway response to {status_code, body, success[, error]}.
+        M-Pesa reports logical failures in the body (output_ResponseCode != INS-0)
+        regardless of the HTTP status.
+        """
+        result = {
+            "status_code": status_code,
+            "body": body,
+            "success": 200 <= status_code < 300
+        }
+
+        # Extract detailed error from M-Pesa body regardless of HTTP status
+        if 'output_ResponseCode' in body:
+            response_code = body['output_ResponseCode']
+            response_desc = body.get('output_ResponseDesc', 'Unknown M-Pesa Error')
+
+            # If INS code is not 0, it's a failure (logic or system)
+            if response_code != 'INS-0':
+                 result['success'] = False
+                 result['error'] = response_desc
+        elif not result['success']:
+             # HTTP Error without M-Pesa body
+             result['error'] = f"Gateway Error {status_code}"
+
+        return result
+
+    def process_c2b_payment(self, amount: float, reference: str, customer_msisdn: str, third_party_reference: str) -> dict:
+        """
+        Process a C2B payment request (Push USSD to customer)
+        Standard M-Pesa C2B Single Stage
+
+        Blocking (portalsdk/requests): only for scripts and sync callers.
+        Request handlers must use process_c2b_payment_async.
+        """
         context = self._create_context(
             method_type=APIMethodType.POST,
-            path=path,
-            parameters=payload
+            path=C2B_PATH,
+            parameters=self._c2b_payload(amount, reference, customer_msisdn, third_party_reference)
         )
-        
-        request = APIRequest(context)
-        
+
+        request = APIRequest(context, get_sdk_client())
+
         try:
             response = request.execute()
-            
+
             if response:
-                print("\n--- DEBUG: PORTAL RESPONSE ---")
-                pprint(response.status_code)
-                pprint(response.headers)
-                pprint(response.body)
-                print("------------------------------\n")
-                
-                result = {
-                    "status_code": response.status_code,
-                    "body": response.body,
-                    "success": 200 <= response.status_code < 300 or response.status_code == 201
-                }
-                
-                # Extract detailed error from M-Pesa body regardless of HTTP status
-                if 'output_ResponseCode' in response.body:
-                    response_code = response.body['output_ResponseCode']
-                    response_desc = response.body.get('output_ResponseDesc', 'Unknown M-Pesa Error')
-                    
-                    # If INS code is not 0, it's a failure (logic or system)
-                    if response_code != 'INS-0':
-                         result['success'] = False
-                         result['error'] = response_desc
-                elif not result['success']:
-                     # HTTP Error without M-Pesa body
-                     result['error'] = f"Gateway Error {response.status_code}"
-                
-                return result
-            
+                logger.debug(f"Portal response {response.status_code}: {response.body}")
+                return self._normalize_c2b_response(response.status_code, response.body)
+
             return {"success": False, "error": "No response from Payment Gateway"}
-            
+
         except Exception as e:
             logger.error(f"Payment Processing Error: {str(e)}")
             return {"success": False, "error": f"Internal Error: {str(e)}"}
 
     def check_transaction_status(self, transaction_ref: str, service_provider_code: str = None) -> dict:
         """
-        Check status of a transaction
+        Check status of a transaction (blocking, see check_transaction_status_async)
         """
-        path = f'/ipg/v1x/queryTransactionStatus/'
-        
-        payload = {
-             "input_QueryReference": transaction_ref,
-             "input_ServiceProviderCode": service_provider_code or (settings.PORTAL_SHORTCODE if hasattr(settings, 'PORTAL_SHORTCODE') else "171717"),
-             "input_ThirdPartyReference": transaction_ref # Sometimes required
-        }
-
         context = self._create_context(
             method_type=APIMethodType.GET, # Or POST depending on API
-            path=path,
-            parameters=payload
+            path=QUERY_STATUS_PATH,
+            parameters=self._status_payload(transaction_ref, service_provider_code)
         )
-        
+
         try:
-            request = APIRequest(context)
+            request = APIRequest(context, get_sdk_client())
             response = request.execute()
-            
+
             if response:
                  return {
                     "status_code": response.status_code,
@@ -120,3 +177,84 @@ class PaymentService:
             return {"success": False, "error": "No response"}
         except Exception as e:
              return {"success": False, "error": str(e)}
+
+    # ============================================================
+    # ASYNC CLIENT (non-blocking, pooled connections)
+    # ============================================================
+
+    def _url(self, path: str) -> str:
+        scheme = "https" if self.ssl else "http"
+        return f"{scheme}://{self.address}:{self.port}{path}"
+
+    def _headers(self) -> dict:
+        # Bearer token = RSA(api_key) with the portal public key, cached by the SDK client
+        token = get_sdk_client().create_bearer_token(self.api_key, self.public_key)
+        return {
+            'Origin': '*',
+            'Authorization': f"Bearer {token.decode('utf-8')}",
+            'Content-Type': 'application/json',
+        }
+
+    async def _send(self, method: str, path: str, payload: dict, timeout: Optional[float] = None) -> httpx.Response:
+        client = await get_async_client()
+        kwargs = {"params": payload} if method == "GET" else {"json": payload}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        return await client.request(method, self._url(path), headers=self._headers(), **kwargs)
+
+    @staticmethod
+    def _json_body(response: httpx.Response) -> dict:
+        try:
+            body = response.json()
+        except (json.JSONDecodeError, ValueError):
+            return {}
+        return body if isinstance(body, dict) else {}
+
+    async def process_c2b_payment_async(
+        self,
+        amount: float,
+        reference: str,
+        customer_msisdn: str,
+        third_party_reference: str,
+        timeout: Optional[float] = None
+    ) -> dict:
+        """
+        Async C2B payment (Push USSD to customer). Same result shape as
+        process_c2b_payment, without blocking the event loop.
+        `timeout` overrides PORTAL_TIMEOUT_SECONDS for this call.
+        """
+        payload = self._c2b_payload(amount, reference, customer_msisdn, third_party_reference)
+        try:
+            response = await self._send("POST", C2B_PATH, payload, timeout)
+            body = self._json_body(response)
+            logger.debug(f"Portal response {response.status_code}: {body}")
+            return self._normalize_c2b_response(response.status_code, body)
+        except httpx.TimeoutException:
+            logger.error(f"Payment gateway timeout for {reference}")
+            return {"success": False, "timeout": True, "error": "Payment Gateway timeout"}
+        except httpx.HTTPError as e:
+            logger.error(f"Payment gateway connection error for {reference}: {str(e)}")
+            return {"success": False, "error": "No response from Payment Gateway"}
+        except Exception as e:
+            logger.error(f"Payment Processing Error: {str(e)}")
+            return {"success": False, "error": f"Internal Error: {str(e)}"}
+
+    async def check_transaction_status_async(
+        self,
+        transaction_ref: str,
+        service_provider_code: str = None,
+        timeout: Optional[float] = None
+    ) -> dict:
+        """Async version of check_transaction_status."""
+        payload = self._status_payload(transaction_ref, service_provider_code)
+        try:
+            response = await self._send("GET", QUERY_STATUS_PATH, payload, timeout)
+            return {
+                "status_code": response.status_code,
+                "body": self._json_body(response),
+                "success": 200 <= response.status_code < 300
+            }
+        except httpx.TimeoutException:
+            return {"success": False, "timeout": True, "error": "Payment Gateway timeout"}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
@@ -0,0 +1,159 @@
+"""
+Receipt views for lookup and QR verification.
+
+A receipt view is the receipt plus the names printed/checked at inspection
+(merchant, agent, market, POS), read with one joined projection query and
+kept in a per-worker LRU cache keyed by receipt_code. Receipts do not change
+after issuance except reprint_count: commits that modify a Receipt drop its
+view, so a reprint on this worker is seen at once (other workers within
+RECEIPT_CACHE_TTL_SECONDS).
+
+POS receipts (TXN-{uuid} codes) are views of the transaction itself, cached
+the same way. Unknown codes are not cached (offline receipts may sync later).
+"""
+from typing import Dict, Iterable, Optional, Sequence
+
+from sqlalchemy import event, select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Receipt, Transaction, Merchant, Agent, POSDevice, Market
+from app.utils.ttl_cache import TTLCache
+
+receipt_view_cache = TTLCache(
+    ttl_seconds=settings.RECEIPT_CACHE_TTL_SECONDS,
+    max_size=settings.RECEIPT_CACHE_MAX_SIZE
+)
+
+TXN_PREFIX = "TXN-"
+
+
+async def _load_receipt_views(db: AsyncSession, receipt_codes: Sequence[str]) -> Dict[str, dict]:
+    rows = (await db.execute(
+        select(
+            Receipt.receipt_code,
+            Receipt.amount,
+            Receipt.currency,
+            Receipt.issued_at,
+            Receipt.reprint_count,
+            Merchant.full_name.label("merchant_name"),
+            Merchant.merchant_type,
+            Agent.full_name.label("agent_name"),
+            Market.name.label("market_name"),
+            POSDevice.serial_number.label("pos_serial"),
+        )
+        .outerjoin(Merchant, Receipt.merchant_id == Merchant.id)
+        .outerjoin(Agent, Receipt.agent_id == Agent.id)
+        .outerjoin(Market, Receipt.market_id == Market.id)
+        .outerjoin(POSDevice, Receipt.pos_id == POSDevice.id)
+        .where(Receipt.receipt_code.in_(receipt_codes))
+    )).all()
+    views = {}
+    for row in rows:
+        view = dict(row._mapping)
+        view["merchant_type"] = row.merchant_type.value if row.merchant_type else None
+        views[row.receipt_code] = view
+    return views
+
+
+async def _load_transaction_views(db: AsyncSession, receipt_codes: Sequence[str]) -> Dict[str, dict]:
+    uuids = [code[len(TXN_PREFIX):] for code in receipt_codes]
+    # transaction_uuid OR offline_transaction_uuid: offline payments stay verifiable after sync
+    rows = (await db.execute(
+        select(
+            Transaction.transaction_uuid,
+            Transaction.offline_transaction_uuid,
+            Transaction.amount,
+            Transaction.currency,
+            Transaction.created_at,
+            Merchant.full_name.label("merchant_name"),
+            Merchant.merchant_type,
+            Agent.full_name.label("agent_name"),
+            Market.name.label("market_name"),
+            POSDevice.serial_number.label("pos_serial"),
+        )
+        .outerjoin(Merchant, Transaction.merchant_id == Merchant.id)
+        .outerjoin(Market, Merchant.market_id == Market.id)
+        .outerjoin(Agent, Transaction.agent_id == Agent.id)
+        .outerjoin(POSDevice, Transaction.pos_id == POSDevice.id)
+        .where(or_(
+            Transaction.transaction_uuid.in_(uuids),
+            Transaction.offline_transaction_uuid.in_(uuids)
+        ))
+    )).all()
+    views = {}
+    # Offline UUID matches first, so a transaction_uuid match wins
+    for row in sorted(rows, key=lambda r: r.offline_transaction_uuid in uuids, reverse=True):
+        view = {
+            "amount": row.amount,
+            "currency": row.currency,
+            "issued_at": row.created_at,
+            "reprint_count": 0,
+            "merchant_name": row.merchant_name,
+            "merchant_type": row.merchant_type.value if row.merchant_type else None,
+            "agent_name": row.agent_name,
+            "market_name": row.market_name,
+            "pos_serial": row.pos_serial,
+        }
+        for transaction_uuid in (row.offline_transaction_uuid, row.transaction_uuid):
+            if transaction_uuid in uuids:
+                code = f"{TXN_PREFIX}{transaction_uuid}"
+                views[code] = {"receipt_code": code, **view}
+    return views
+
+
+async def get_receipt_views(db: AsyncSession, receipt_codes: Iterable[str]) -> Dict[str, dict]:
+    """
+    Views of many receipts (MKT... and/or TXN-{uuid}) by code: cached ones
+    from memory, the rest with at most one query per format. Unknown codes
+    are absent from the result.
+    """
+    views, missing = {}, set()
+    for code in receipt_codes:
+        view = receipt_view_cache.get(code)
+        if view is None:
+            missing.add(code)
+        else:
+            views[code] = view
+
+    txn_codes = [code for code in missing if code.startswith(TXN_PREFIX)]
+    receipt_codes = [code for code in missing if not code.startswith(TXN_PREFIX)]
+    loaded = {}
+    if receipt_codes:
+        loaded.update(await _load_receipt_views(db, receipt_codes))
+    if txn_codes:
+        loaded.update(await _load_transaction_views(db, txn_codes))
+    for code, view in loaded.items():
+        receipt_view_cache.set(code, view)
+    views.update(loaded)
+    return views
+
+
+async def get_receipt_view(db: AsyncSession, receipt_code: str) -> Optional[dict]:
+    """Receipt (MKT... or TXN-{uuid}) with merchant/agent/market/POS names, or None."""
+    return (await get_receipt_views(db, [receipt_code])).get(receipt_code)
+
+
+# ============================================================
+# Invalidation on commit (reprints)
+# ============================================================
+_PENDING_KEY = "receipt_views_pending"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_receipt_changes(session, flush_context):
+    for obj in (*session.dirty, *session.deleted):
+        if isinstance(obj, Receipt) and obj.receipt_code:
+            session.info.setdefault(_PENDING_KEY, set()).add(obj.receipt_code)
+
+
+@event.listens_for(Session, "after_commit")
+def _drop_receipt_views(session):
+    for receipt_code in session.info.pop(_PENDING_KEY, ()):
+        receipt_view_cache.invalidate(receipt_code)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_receipt_changes(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,126 @@
+"""
+Receipt number allocator per (market, month).
+
+Receipt codes are MKT{market:02d}-{YYYY}-{MM}-{seq:06d}. The sequence lives
+in receipt_sequences (one row per market and month). Each worker reserves a
+block of RECEIPT_SEQUENCE_BLOCK_SIZE numbers at a time with one short
+transaction (UPDATE last_value = last_value + block, row-locked until
+commit), then hands them out from memory: issuing a receipt is O(1) and no
+two workers can get the same number.
+
+Numbers reserved by a worker that stops are never used (gaps in the
+sequence, never duplicates); RECEIPT_SEQUENCE_BLOCK_SIZE=1 avoids gaps at
+the cost of one allocation per receipt.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select, update, func
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Receipt, ReceiptSequence
+
+logger = logging.getLogger(__name__)
+
+SequenceKey = Tuple[int, str]  # (market_id, "YYYY-MM")
+
+
+def receipt_prefix(market_id: int, period: str) -> str:
+    """MKT12-2025-02- for market 12, period 2025-02."""
+    year, month = period.split("-")
+    return f"MKT{market_id:02d}-{year}-{month}-"
+
+
+def _insert_ignore(dialect_name: str, values: dict):
+    """INSERT that does nothing when the (market_id, period) row already exists."""
+    table = ReceiptSequence.__table__
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        return mysql_insert(table).values(**values).prefix_with("IGNORE")
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as upsert_insert
+    return upsert_insert(table).values(**values).on_conflict_do_nothing(
+        index_elements=["market_id", "period"]
+    )
+
+
+async def _highest_issued(db, market_id: int, period: str) -> int:
+    """Highest sequence already used in receipts for this market/month (codes issued before the table existed)."""
+    prefix = receipt_prefix(market_id, period)
+    code = await db.scalar(
+        select(func.max(Receipt.receipt_code)).where(Receipt.receipt_code.like(f"{prefix}%"))
+    )
+    if not code:
+        return 0
+    try:
+        return int(code[len(prefix):])
+    except ValueError:
+        return 0
+
+
+class ReceiptSequenceAllocator:
+    def __init__(self, block_size: int = 20):
+        self.block_size = max(1, block_size)
+        # key -> [next number to hand out, last number of the reserved block]
+        self._blocks: Dict[SequenceKey, list] = {}
+        self._locks: Dict[SequenceKey, asyncio.Lock] = {}
+        self.allocations = 0
+
+    async def _reserve_block(self, market_id: int, period: str) -> Tuple[int, int]:
+        """Reserve the next block in its own transaction: (first, last)."""
+        key_filter = (ReceiptSequence.market_id == market_id, ReceiptSequence.period == period)
+        async with SessionLocal() as db:
+            exists = await db.scalar(select(ReceiptSequence.id).where(*key_filter))
+            if exists is None:
+                start = await _highest_issued(db, market_id, period)
+                await db.execute(_insert_ignore(
+                    db.bind.dialect.name, {"market_id": market_id, "period": period, "last_value": start}
+                ))
+            await db.execute(
+                update(ReceiptSequence)
+                .where(*key_filter)
+                .values(last_value=ReceiptSequence.last_value + self.block_size)
+            )
+            last = await db.scalar(select(ReceiptSequence.last_value).where(*key_filter))
+            await db.commit()
+        self.allocations += 1
+        return last - self.block_size + 1, last
+
+    async def next_value(self, market_id: int, period: str) -> int:
+        key = (market_id, period)
+        block = self._blocks.get(key)
+        if block is None or block[0] > block[1]:
+            lock = self._locks.setdefault(key, asyncio.Lock())
+            async with lock:
+                block = self._blocks.get(key)
+                if block is None or block[0] > block[1]:
+                    # A new month starts new sequences: drop the old periods
+                    for old_key in [k for k in self._blocks if k[1] != period]:
+                        self._blocks.pop(old_key, None)
+                        self._locks.pop(old_key, None)
+                    block = list(await self._reserve_block(market_id, period))
+                    self._blocks[key] = block
+        value = block[0]
+        block[0] += 1
+        return value
+
+    async def next_code(self, market_id: int, now: Optional[datetime] = None) -> str:
+        """Next receipt code for the market in the current month."""
+        period = (now or datetime.now()).strftime("%Y-%m")
+        sequence = await self.next_value(market_id, period)
+        return f"{receipt_prefix(market_id, period)}{sequence:06d}"
+
+    def stats(self) -> dict:
+        return {
+            "block_size": self.block_size,
+            "sequences": len(self._blocks),
+            "allocations": self.allocations,
+        }
+
+
+receipt_sequences = ReceiptSequenceAllocator(block_size=settings.RECEIPT_SEQUENCE_BLOCK_SIZE)
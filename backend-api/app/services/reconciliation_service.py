@@ -0,0 +1,222 @@
+"""
+Payment status reconciliation.
+
+M-Pesa transactions left PENDING (request died before the gateway answered)
+or TIMEOUT (gateway did not answer in time) are resolved by asking the gateway
+for their final status. Runs from the scheduler (see scheduled_tasks).
+
+Only a final answer from the gateway changes the status. A row with no final
+answer after RECONCILE_GIVE_UP_HOURS (gateway unreachable, errors, unknown
+status) may still have been paid by the customer: it is flagged for manual
+review (reconcile_review_at) with the last gateway response, keeps its
+PENDING/TIMEOUT status and is no longer queried.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import time
+
+from sqlalchemy import select, update, and_, or_, bindparam, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Transaction, TransactionStatus, PaymentMethod
+
+logger = logging.getLogger(__name__)
+
+# Only rows older than this are reconciled (the originating request is done with them)
+RECONCILE_MIN_AGE_MINUTES = 10
+# Rows still unresolved after this long are flagged for manual review
+RECONCILE_GIVE_UP_HOURS = 48
+# Rows per batch (one keyset query + one bulk UPDATE per batch)
+RECONCILE_BATCH_SIZE = 200
+# Concurrent gateway status queries
+RECONCILE_CONCURRENCY = 5
+
+UNRESOLVED_STATUSES = (TransactionStatus.PENDING, TransactionStatus.TIMEOUT)
+
+# output_ResponseTransactionStatus (queryTransactionStatus) -> final status
+GATEWAY_FINAL_STATUSES = {
+    "Completed": TransactionStatus.SUCESSO,
+    "Failed": TransactionStatus.FALHOU,
+    "Expired": TransactionStatus.FALHOU,
+    "Rejected": TransactionStatus.FALHOU,
+    "Cancelled": TransactionStatus.CANCELADO,
+}
+
+
+def map_gateway_status(result: dict) -> Optional[TransactionStatus]:
+    """Final status from a status query result, or None if still unknown."""
+    if not result.get("success"):
+        return None
+    body = result.get("body") or {}
+    if body.get("output_ResponseCode") not in (None, "INS-0"):
+        return None
+    return GATEWAY_FINAL_STATUSES.get(body.get("output_ResponseTransactionStatus"))
+
+
+async def reconcile_unresolved_transactions(
+    db: AsyncSession,
+    service=None,
+    now: Optional[datetime] = None
+) -> dict:
+    """
+    Resolve PENDING/TIMEOUT M-Pesa transactions older than RECONCILE_MIN_AGE_MINUTES.
+
+    Batches are read oldest first with a (created_at, id) keyset over the
+    (status, created_at) index; each batch is queried at the gateway with at
+    most RECONCILE_CONCURRENCY calls in flight, then written with one bulk
+    UPDATE (status, mpesa_reference, response_payload). Rows that became
+    SUCESSO add their amount to the merchant fee ledger.
+
+    Returns a summary dict.
+    """
+    from app.services.payment_service import PaymentService
+    from app.services.fee_service import apply_fee_ledger_delta
+
+    started = time.perf_counter()
+    service = service or PaymentService()
+    now = now or datetime.now()
+    cutoff = now - timedelta(minutes=RECONCILE_MIN_AGE_MINUTES)
+    give_up_before = now - timedelta(hours=RECONCILE_GIVE_UP_HOURS)
+    semaphore = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+
+    summary = {"checked": 0, "resolved": 0, "success": 0, "failed": 0, "flagged_for_review": 0, "unresolved": 0}
+
+    async def query(tx_row):
+        async with semaphore:
+            return await service.check_transaction_status_async(tx_row.payment_reference)
+
+    last_key = None
+    while True:
+        stmt = (
+            select(
+                Transaction.id,
+                Transaction.created_at,
+                Transaction.merchant_id,
+                Transaction.amount,
+                Transaction.payment_reference,
+                Transaction.province,
+                Transaction.district,
+            )
+            .where(
+                Transaction.status.in_(UNRESOLVED_STATUSES),
+                Transaction.created_at < cutoff,
+                Transaction.payment_method == PaymentMethod.MPESA,
+                Transaction.reconcile_review_at.is_(None),
+            )
+            .order_by(Transaction.created_at, Transaction.id)
+            .limit(RECONCILE_BATCH_SIZE)
+        )
+        if last_key is not None:
+            stmt = stmt.where(or_(
+                Transaction.created_at > last_key[0],
+                and_(Transaction.created_at == last_key[0], Transaction.id > last_key[1])
+            ))
+
+        rows = (await db.execute(stmt)).all()
+        # Release the read snapshot before the (slow) gateway calls
+        await db.commit()
+        if not rows:
+            break
+        last_key = (rows[-1].created_at, rows[-1].id)
+        summary["checked"] += len(rows)
+
+        results = await asyncio.gather(*(query(row) for row in rows))
+
+        decided: Dict[int, dict] = {}
+        for row, result in zip(rows, results):
+            final_status = map_gateway_status(result)
+            if final_status is None and row.created_at >= give_up_before:
+                summary["unresolved"] += 1
+                continue
+
+            # final_status None here = no final answer in time: flag for review
+            body = result.get("body") or {}
+            decided[row.id] = {
+                "row": row,
+                "status": final_status,
+                "mpesa_reference": body.get("output_ResponseTransactionID") or body.get("output_TransactionID"),
+                "response_payload": result,
+            }
+
+        if decided:
+            await _write_batch(db, decided, summary, apply_fee_ledger_delta, now)
+
+    summary["duration_ms"] = int((time.perf_counter() - started) * 1000)
+    return summary
+
+
+async def _write_batch(
+    db: AsyncSession,
+    decided: Dict[int, dict],
+    summary: dict,
+    apply_fee_ledger_delta,
+    now: datetime
+) -> None:
+    from app.services.hourly_histogram import queue_hourly_change
+    
+    # Re-check (and lock) rows still unresolved: the request handler or an
+    # admin may have settled some while the gateway was being queried.
+    still_open = (await db.execute(
+        select(Transaction.id)
+        .where(Transaction.id.in_(list(decided)), Transaction.status.in_(UNRESOLVED_STATUSES))
+        .with_for_update()
+    )).scalars().all()
+
+    params: List[dict] = []
+    review: List[dict] = []
+    ledger: Dict[int, float] = {}
+    for tx_id in still_open:
+        item = decided[tx_id]
+        if item["status"] is None:
+            review.append({"_id": tx_id, "_response_payload": item["response_payload"]})
+            continue
+        params.append({
+            "_id": tx_id,
+            "_status": item["status"],
+            "_mpesa_reference": item["mpesa_reference"],
+            "_response_payload": item["response_payload"],
+        })
+        if item["status"] == TransactionStatus.SUCESSO:
+            merchant_id = item["row"].merchant_id
+            ledger[merchant_id] = ledger.get(merchant_id, 0) + item["row"].amount
+            queue_hourly_change(db, item["row"].created_at, item["row"].province, item["row"].district)
+            summary["success"] += 1
+        else:
+            summary["failed"] += 1
+
+    table = Transaction.__table__
+    if review:
+        await db.execute(
+            update(table)
+            .where(table.c.id == bindparam("_id"))
+            .values(reconcile_review_at=now, response_payload=bindparam("_response_payload")),
+            review
+        )
+        logger.warning(
+            f"⚠️ {len(review)} M-Pesa transactions without a final gateway status after "
+            f"{RECONCILE_GIVE_UP_HOURS}h flagged for manual review: ids={[item['_id'] for item in review]}"
+        )
+
+    if params:
+        from app.services.revenue_rollup_service import record_transactions, retract_transactions
+        settled_ids = [item["_id"] for item in params]
+        await retract_transactions(db, settled_ids)
+        await db.execute(
+            update(table)
+            .where(table.c.id == bindparam("_id"))
+            .values(
+                status=bindparam("_status"),
+                mpesa_reference=func.coalesce(bindparam("_mpesa_reference"), table.c.mpesa_reference),
+                response_payload=bindparam("_response_payload"),
+            ),
+            params
+        )
+        await record_transactions(db, settled_ids)
+        for merchant_id, amount in ledger.items():
+            await apply_fee_ledger_delta(db, merchant_id, amount)
+
+    await db.commit()
+    summary["resolved"] += len(params)
+    summary["flagged_for_review"] += len(review)
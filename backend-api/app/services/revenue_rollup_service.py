@@ -0,0 +1,137 @@
+"""
+Daily revenue rollup (daily_revenue_rollup).
+
+One row per (day, market, agent, POS, payment method, status) with the sum
+and count of the matching transactions (market = Transaction.market_id, the
+merchant's market when the transaction was created; a merchant moving to
+another market does not move its past revenue), so revenue reports cost O(days)
+instead of O(transactions).
+
+Maintenance is by deltas computed in SQL from the stored transaction rows
+(INSERT ... SELECT ... ON DUPLICATE KEY UPDATE), so callers only pass ids:
+
+    await retract_transactions(db, [tx.id])   # before changing status/amount/...
+    ... modify the transaction ...
+    await record_transactions(db, [tx.id])    # after (flushes first)
+
+New transactions only need record_transactions. Both run inside the
+caller's transaction (caller commits). rebuild_revenue_rollup recomputes
+the table (or the days from a given date) from transactions.
+"""
+from datetime import date, datetime
+from typing import Iterable, Optional
+import logging
+import time
+
+from sqlalchemy import select, delete, insert, func, literal_column
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Transaction, DailyRevenueRollup
+
+logger = logging.getLogger(__name__)
+
+KEY_COLUMNS = ("day", "market_id", "agent_id", "pos_id", "payment_method", "status")
+VALUE_COLUMNS = ("total_amount", "tx_count")
+
+
+def _rollup_select(*where, sign: int = 1):
+    """Transactions matching `where` grouped into rollup rows (values times `sign`)."""
+    day = func.date(Transaction.created_at)
+    return (
+        select(
+            day,
+            Transaction.market_id,
+            func.coalesce(Transaction.agent_id, literal_column("0")),
+            func.coalesce(Transaction.pos_id, literal_column("0")),
+            Transaction.payment_method,
+            Transaction.status,
+            func.sum(Transaction.amount) * literal_column(str(int(sign))),
+            func.count(Transaction.id) * literal_column(str(int(sign))),
+        )
+        .where(Transaction.status.isnot(None), *where)
+        # Raw columns (no bound params) so ONLY_FULL_GROUP_BY matches the select list
+        .group_by(day, Transaction.market_id, Transaction.agent_id, Transaction.pos_id,
+                  Transaction.payment_method, Transaction.status)
+    )
+
+
+def _upsert(dialect_name: str, rows_select):
+    """INSERT ... SELECT adding to existing keys (MySQL; SQLite/PostgreSQL for dev)."""
+    table = DailyRevenueRollup.__table__
+    columns = KEY_COLUMNS + VALUE_COLUMNS
+
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(table).from_select(columns, rows_select)
+        return stmt.on_duplicate_key_update(
+            total_amount=table.c.total_amount + stmt.inserted.total_amount,
+            tx_count=table.c.tx_count + stmt.inserted.tx_count,
+        )
+
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as upsert_insert
+    stmt = upsert_insert(table).from_select(columns, rows_select)
+    return stmt.on_conflict_do_update(
+        index_elements=list(KEY_COLUMNS),
+        set_={
+            "total_amount": table.c.total_amount + stmt.excluded.total_amount,
+            "tx_count": table.c.tx_count + stmt.excluded.tx_count,
+        }
+    )
+
+
+async def _apply(db: AsyncSession, transaction_ids: Iterable[int], sign: int) -> None:
+    ids = [tx_id for tx_id in transaction_ids if tx_id is not None]
+    if not ids:
+        return
+    stmt = _upsert(db.bind.dialect.name, _rollup_select(Transaction.id.in_(ids), sign=sign))
+    await db.execute(stmt)
+
+
+async def record_transactions(db: AsyncSession, transaction_ids: Iterable[int]) -> None:
+    """Add the stored state of these transactions to the rollup."""
+    await db.flush()
+    await _apply(db, transaction_ids, 1)
+
+
+async def retract_transactions(db: AsyncSession, transaction_ids: Iterable[int]) -> None:
+    """
+    Remove the stored state of these transactions from the rollup.
+    Call before modifying them (reads the rows as currently stored).
+    """
+    await _apply(db, transaction_ids, -1)
+
+
+async def rebuild_revenue_rollup(db: AsyncSession, since: Optional[date] = None) -> dict:
+    """
+    Recompute the rollup from transactions: all days, or days >= `since`.
+    Runs in one transaction (readers see the old rows until commit).
+    """
+    started = time.perf_counter()
+    table = DailyRevenueRollup.__table__
+
+    where = []
+    delete_stmt = delete(table)
+    if since is not None:
+        where.append(Transaction.created_at >= datetime.combine(since, datetime.min.time()))
+        delete_stmt = delete_stmt.where(table.c.day >= since)
+
+    deleted = (await db.execute(delete_stmt)).rowcount
+    await db.execute(
+        insert(table).from_select(KEY_COLUMNS + VALUE_COLUMNS, _rollup_select(*where))
+    )
+    rows = await db.scalar(
+        select(func.count(table.c.id)).where(*([table.c.day >= since] if since else []))
+    )
+    await db.commit()
+
+    summary = {
+        "since": since.isoformat() if since else None,
+        "deleted": deleted,
+        "rows": rows or 0,
+        "duration_ms": int((time.perf_counter() - started) * 1000),
+    }
+    logger.info(f"Revenue rollup rebuilt: {summary}")
+    return summary
@@ -4,14 +4,12 @@ Runs background jobs like daily fee checks
 """
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, func
-from datetime import date, datetime, timedelta
+from apscheduler.triggers.interval import IntervalTrigger
+from datetime import date
 import logging
-import math
 
+from app.config import settings
 from app.database import SessionLocal
-from app.models import Merchant, PaymentStatus, MerchantFeePayment, Transaction, TransactionStatus
 import socket
 import os
 
@@ -33,101 +31,87 @@ async def check_daily_payments():
     Scheduled job: Runs every midnight.
     Checks if merchants have paid their daily fee.
     Logic: Total Paid = Sum(FeePayments) + Sum(Transactions where status=SUCESSO)
+    
+    Uses the set-based reconciliation engine (grouped aggregates + chunked
+    bulk UPDATEs) instead of two SUM queries per merchant.
     """
+    from app.services.fee_service import reconcile_all_merchants
+    
     today = date.today()
     logger.info(f"⏰ Running daily payment check for {today}")
     
     async with SessionLocal() as db:
         try:
-            yesterday = today - timedelta(days=1)
+            summary = await reconcile_all_merchants(db, today)
             
-            # Get all active merchants
-            result = await db.execute(
-                select(Merchant).where(Merchant.status == "ATIVO")
-            )
-            merchants = result.scalars().all()
+            logger.info(f"✅ Daily payment check complete:")
+            logger.info(f"   - Total merchants checked: {summary['checked']}")
+            logger.info(f"   - Regular: {summary['regular']}")
+            logger.info(f"   - Irregular: {summary['irregular']}")
+            logger.info(f"   - Rows updated: {summary['updated']}")
+            logger.info(f"   - Duration: {summary['duration_ms']} ms")
             
-            regular_count = 0
-            irregular_count = 0
+            return summary
             
-            for merchant in merchants:
-                # 1. Calculate Expected Amount (Inclusive of TODAY)
-                # If registered_at is None, assume today (shouldn't happen for valid merchants)
-                reg_date = merchant.registered_at.date() if merchant.registered_at else today
-                
-                # determine billing start date
-                # Priority:
-                # 1. merchant.billing_start_date (Admin override / Migration default for old users)
-                # 2. merchant.registered_at
-                # User requested to allow OLD dates (e.g. 1994) for verification
-                billing_start_date = merchant.billing_start_date or reg_date
-                
-                # If billing start date is in future, no fees yet
-                if billing_start_date > today:
-                    days_billed = 0
-                else:
-                    days_billed = (today - billing_start_date).days + 1
-                
-                expected_amount = round(days_billed * DAILY_FEE_AMOUNT, 2)
-                
-                # 2. Calculate Total Paid (Direct Fees)
-                fee_result = await db.execute(
-                    select(func.sum(MerchantFeePayment.amount))
-                    .where(MerchantFeePayment.merchant_id == merchant.id)
-                )
-                direct_fees = float(fee_result.scalar() or 0.0)
-                
-                # 3. Calculate Total Collected (Transactions)
-                # 'Transactions' table represents Fee Payments to the municipality
-                tx_result = await db.execute(
-                    select(func.sum(Transaction.amount))
-                    .where(
-                        Transaction.merchant_id == merchant.id,
-                        Transaction.status == TransactionStatus.SUCESSO
-                    )
-                )
-                transaction_payments = float(tx_result.scalar() or 0.0)
-                
-                total_paid = round(direct_fees + transaction_payments, 2)
-                
-                # 4. Compare with epsilon for float safety
-                balance = total_paid - expected_amount
-                
-                if balance >= -0.01:
-                    # ✅ REGULAR (Paid enough or in advance)
-                    if merchant.payment_status != PaymentStatus.REGULAR:
-                        merchant.payment_status = PaymentStatus.REGULAR
-                        merchant.days_overdue = 0
-                        logger.info(f"Merchant {merchant.id} became REGULAR (Paid: {total_paid}, Exp: {expected_amount})")
-                    regular_count += 1
-                else:
-                    # ⚠️ IRREGULAR (Owes money)
-                    merchant.payment_status = PaymentStatus.IRREGULAR
-                    overdue_amount = abs(balance)
-                    # Calculate days overdue based on missing amount
-                    merchant.days_overdue = math.ceil(overdue_amount / DAILY_FEE_AMOUNT)
-                    
-                    logger.info(f"Merchant {merchant.id} marked IRREGULAR (Paid: {total_paid}, Exp: {expected_amount}, Overdue: {merchant.days_overdue} days)")
-                    irregular_count += 1
+        except Exception as e:
+            logger.error(f"❌ Error in daily payment check: {e}")
+            await db.rollback()
+            raise
+
+
+async def reconcile_pending_payments():
+    """
+    Scheduled job: Runs every 5 minutes.
+    Resolves M-Pesa transactions stuck in PENDING/TIMEOUT by querying the
+    gateway for their final status (bounded concurrency, bulk updates).
+    """
+    from app.services.reconciliation_service import reconcile_unresolved_transactions
+    
+    async with SessionLocal() as db:
+        try:
+            summary = await reconcile_unresolved_transactions(db)
             
-            await db.commit()
+            if summary["checked"]:
+                logger.info(
+                    f"🔄 Payment reconciliation: checked={summary['checked']} "
+                    f"resolved={summary['resolved']} (success={summary['success']}, failed={summary['failed']}, "
+                    f"flagged_for_review={summary['flagged_for_review']}) unresolved={summary['unresolved']} "
+                    f"in {summary['duration_ms']} ms"
+                )
             
-            logger.info(f"✅ Daily payment check complete:")
-            logger.info(f"   - Total merchants checked: {len(merchants)}")
-            logger.info(f"   - Regular: {regular_count}")
-            logger.info(f"   - Irregular: {irregular_count}")
+            return summary
             
         except Exception as e:
-            logger.error(f"❌ Error in daily payment check: {e}")
+            logger.error(f"❌ Error in payment reconciliation: {e}")
             await db.rollback()
             raise
 
 
+async def process_export_jobs():
+    """
+    Scheduled job: Runs every EXPORT_JOB_POLL_SECONDS (if EXPORT_JOBS_IN_SCHEDULER).
+    Writes queued background exports to EXPORT_DIR and deletes expired files.
+    """
+    from app.services.export_job_service import process_export_jobs as run_export_jobs
+    
+    try:
+        summary = await run_export_jobs()
+        if summary["ran"] or summary["failed_stale"] or summary["expired"]:
+            logger.info(
+                f"📦 Export jobs: ran={summary['ran']} failed_stale={summary['failed_stale']} "
+                f"expired={summary['expired']}"
+            )
+        return summary
+    except Exception as e:
+        logger.error(f"❌ Error processing export jobs: {e}")
+        raise
+
+
 async def run_payment_check_now():
     """
     Manual trigger for payment check (for testing or admin use).
     """
-    await check_daily_payments()
+    return await check_daily_payments()
 
 
 def start_scheduler():
@@ -149,6 +133,28 @@ def start_scheduler():
         misfire_grace_time=3600  # Allow up to 1 hour delay if server was down
     )
     
+    # Resolve PENDING/TIMEOUT M-Pesa transactions every 5 minutes
+    scheduler.add_job(
+        reconcile_pending_payments,
+        IntervalTrigger(minutes=5),
+        id="payment_reconciliation",
+        name="PENDING/TIMEOUT Payment Reconciliation",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    
+    # Background exports: normally run by scripts/export_worker.py, here only if enabled
+    if settings.EXPORT_JOBS_IN_SCHEDULER:
+        scheduler.add_job(
+            process_export_jobs,
+            IntervalTrigger(seconds=settings.EXPORT_JOB_POLL_SECONDS),
+            id="export_jobs",
+            name="Background Export Jobs",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
     
     # SINGLETON LOCK MECHANISM:
     # Try to bind to a specific port. If successful, we are the scheduler leader.
@@ -163,7 +169,7 @@ def start_scheduler():
         return
 
     scheduler.start()
-    logger.info("📅 Scheduler started (Leader) - Daily payment check scheduled for 00:00")
+    logger.info("📅 Scheduler started (Leader) - Daily payment check scheduled for 00:00, payment reconciliation every 5 min")
 
 
 
@@ -0,0 +1,40 @@
+"""
+Sargable date filters on DATETIME columns.
+
+`func.date(created_at) >= :d` wraps the column in a function, so MySQL cannot
+use an index on created_at (or (status, created_at)) and scans the table.
+The same filters expressed as half-open ranges on the raw column
+    created_at >= :start AND created_at < :end
+select exactly the same rows and are resolved with an index range scan.
+
+Dates are whole calendar days: `end` is inclusive (as in the API query
+params) and becomes `< end + 1 day`.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional, Union
+
+DateLike = Union[date, datetime]
+
+
+def start_of_day(day: DateLike) -> datetime:
+    if isinstance(day, datetime):
+        day = day.date()
+    return datetime.combine(day, time.min)
+
+
+def date_range(column, start: Optional[DateLike] = None, end: Optional[DateLike] = None) -> List:
+    """
+    Conditions for `start <= date(column) <= end` (either bound optional),
+    as a list to pass to .where(*...) / and_(*...) or extend a filter list.
+    """
+    conditions = []
+    if start is not None:
+        conditions.append(column >= start_of_day(start))
+    if end is not None:
+        conditions.append(column < start_of_day(end) + timedelta(days=1))
+    return conditions
+
+
+def on_day(column, day: DateLike) -> List:
+    """Conditions for `date(column) == day`."""
+    return date_range(column, day, day)
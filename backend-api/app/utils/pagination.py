@@ -0,0 +1,65 @@
+"""
+Keyset (cursor) pagination on (created_at, id).
+
+Instead of OFFSET (which scans and discards every skipped row), the next page
+starts right after the last row of the previous one:
+    WHERE (created_at, id) < (:last_created_at, :last_id)
+    ORDER BY created_at DESC, id DESC
+so page 1000 costs the same as page 1 when (created_at) / (<filter>, created_at)
+is indexed.
+
+The cursor is opaque to clients (urlsafe base64 of the last row's key) and is
+returned in the X-Next-Cursor header, so list endpoints keep their response body.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, or_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat() if created_at else None, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return (datetime.fromisoformat(created_at) if created_at else None), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_after(query, created_col, id_col, created_at: datetime, row_id: int):
+    """Keep rows after (created_at, row_id) in newest-first order."""
+    return query.where(or_(
+        created_col < created_at,
+        and_(created_col == created_at, id_col < row_id)
+    ))
+
+
+def apply_keyset(query, created_col, id_col, cursor: Optional[str]):
+    """
+    Order `query` newest first by (created_col, id_col) and, if a cursor is
+    given, keep only rows after it. Callers add .limit() themselves.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = keyset_after(query, created_col, id_col, created_at, row_id)
+    return query.order_by(created_col.desc(), id_col.desc())
+
+
+def set_next_cursor(response: Response, rows: Sequence, limit: int) -> Optional[str]:
+    """Expose the cursor for the page after `rows` (none when this page is the last)."""
+    if not rows or len(rows) < limit:
+        return None
+    last = rows[-1]
+    cursor = encode_cursor(last.created_at, last.id)
+    response.headers[NEXT_CURSOR_HEADER] = cursor
+    return cursor
@@ -0,0 +1,9 @@
+-- Migration: Incremental per-merchant fee ledger
+-- fee_total_paid = Sum(merchant_fee_payments.amount) + Sum(transactions.amount WHERE status = 'SUCESSO')
+-- Existing rows stay NULL until backfilled with: python scripts/rebuild_fee_ledger.py
+
+ALTER TABLE merchants ADD COLUMN fee_total_paid DECIMAL(14, 2) NULL DEFAULT 0.00;
+ALTER TABLE merchants ADD COLUMN fee_ledger_reconciled_date DATE NULL;
+
+-- Existing merchants: mark ledger as "not built" so reads fall back to history until the rebuild runs
+UPDATE merchants SET fee_total_paid = NULL;
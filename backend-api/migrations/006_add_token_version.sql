@@ -0,0 +1,7 @@
+-- Migration: Per-principal token version (JWT revocation counter)
+-- Tokens carry the version they were issued with ("ver"); bumping the column
+-- (status, role, scope, credential or market changes) invalidates them.
+
+ALTER TABLE users ADD COLUMN token_version INT NOT NULL DEFAULT 0;
+ALTER TABLE agents ADD COLUMN token_version INT NOT NULL DEFAULT 0;
+ALTER TABLE merchants ADD COLUMN token_version INT NOT NULL DEFAULT 0;
@@ -0,0 +1,5 @@
+-- Migration: Index for status scans by age
+-- Used by the PENDING/TIMEOUT reconciliation job (status IN (...) AND created_at < ?
+-- ORDER BY created_at, id) and by status + date filters on transactions.
+
+CREATE INDEX idx_transactions_status_created_at ON transactions (status, created_at);
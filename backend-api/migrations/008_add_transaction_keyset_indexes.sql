@@ -0,0 +1,7 @@
+-- Migration: Indexes for keyset pagination of transactions
+-- ORDER BY created_at DESC, id DESC with WHERE (created_at, id) < (?, ?)
+-- InnoDB secondary indexes include the primary key, so (x, created_at) covers (x, created_at, id).
+
+CREATE INDEX idx_transactions_created_at ON transactions (created_at);
+CREATE INDEX idx_transactions_merchant_created_at ON transactions (merchant_id, created_at);
+CREATE INDEX idx_transactions_agent_created_at ON transactions (agent_id, created_at);
@@ -0,0 +1,19 @@
+-- Migration: Daily revenue rollup (pre-aggregated transactions per day)
+-- Maintained incrementally by the application; populate/rebuild with:
+--   python scripts/rebuild_revenue_rollup.py
+-- agent_id / pos_id use 0 for "none" (NULLs would not collide in the UNIQUE key).
+
+CREATE TABLE IF NOT EXISTS daily_revenue_rollup (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    day DATE NOT NULL,
+    market_id BIGINT NOT NULL,
+    agent_id BIGINT NOT NULL DEFAULT 0,
+    pos_id BIGINT NOT NULL DEFAULT 0,
+    payment_method ENUM('DINHEIRO', 'MPESA', 'EMOLA', 'MKESH') NOT NULL,
+    status ENUM('PENDING', 'SUCESSO', 'FALHOU', 'CANCELADO', 'TIMEOUT') NOT NULL,
+    total_amount DECIMAL(18, 2) NOT NULL DEFAULT 0,
+    tx_count INT NOT NULL DEFAULT 0,
+    UNIQUE KEY uq_daily_revenue_rollup_key (day, market_id, agent_id, pos_id, payment_method, status),
+    INDEX idx_daily_revenue_rollup_market_day (market_id, day),
+    INDEX idx_daily_revenue_rollup_agent_day (agent_id, day)
+);
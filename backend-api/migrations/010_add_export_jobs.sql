@@ -0,0 +1,31 @@
+-- Migration: Background export jobs (POST /exports/transactions, /exports/audit-logs)
+-- Files are written to EXPORT_DIR by the export worker and removed after
+-- EXPORT_JOB_RETENTION_HOURS (status EXPIRED).
+
+CREATE TABLE IF NOT EXISTS export_jobs (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    job_uuid VARCHAR(36) NOT NULL,
+    kind ENUM('TRANSACTIONS', 'AUDIT_LOGS') NOT NULL,
+    export_format VARCHAR(10) NOT NULL DEFAULT 'csv',
+    gzip BOOLEAN NOT NULL DEFAULT FALSE,
+    params JSON NULL,
+    requested_by_user_id BIGINT NOT NULL,
+    user_role VARCHAR(50) NULL,
+    scope_province VARCHAR(100) NULL,
+    scope_district VARCHAR(100) NULL,
+    status ENUM('QUEUED', 'RUNNING', 'DONE', 'FAILED', 'EXPIRED') NOT NULL DEFAULT 'QUEUED',
+    rows_total INT NULL,
+    rows_written INT NOT NULL DEFAULT 0,
+    bytes_written BIGINT NOT NULL DEFAULT 0,
+    error TEXT NULL,
+    file_path VARCHAR(500) NULL,
+    file_name VARCHAR(255) NULL,
+    created_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP NULL,
+    heartbeat_at TIMESTAMP NULL,
+    finished_at TIMESTAMP NULL,
+    expires_at TIMESTAMP NULL,
+    UNIQUE KEY uq_export_jobs_uuid (job_uuid),
+    INDEX idx_export_jobs_status (status, id),
+    INDEX idx_export_jobs_user (requested_by_user_id, id)
+);
@@ -0,0 +1,11 @@
+-- Migration: Per-(market, month) receipt number sequences
+-- Replaces SELECT COUNT(*) FROM receipts on every receipt. Rows are created on
+-- first use, starting after the highest existing code of that market/month.
+
+CREATE TABLE IF NOT EXISTS receipt_sequences (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    market_id BIGINT NOT NULL,
+    period VARCHAR(7) NOT NULL,
+    last_value BIGINT NOT NULL DEFAULT 0,
+    UNIQUE KEY uq_receipt_sequences_market_period (market_id, period)
+);
@@ -0,0 +1,11 @@
+-- Migration: Requester type on export jobs
+-- get_current_user can return a User, Agent or Merchant, each with its own id
+-- sequence: ownership checks on /exports need (type, id), not only the id.
+-- Existing jobs were all requested through the user-only export roles.
+
+ALTER TABLE export_jobs
+    ADD COLUMN requested_by_type VARCHAR(20) NOT NULL DEFAULT 'User' AFTER params;
+
+ALTER TABLE export_jobs
+    DROP INDEX idx_export_jobs_user,
+    ADD INDEX idx_export_jobs_requester (requested_by_type, requested_by_user_id, id);
@@ -0,0 +1,7 @@
+-- Migration: Manual review flag for unreconciled M-Pesa transactions
+-- The reconciliation job no longer marks PENDING/TIMEOUT rows FALHOU after 48h
+-- without a final gateway answer (the customer may have paid): it sets
+-- reconcile_review_at instead, keeps the status and stops querying the row.
+
+ALTER TABLE transactions
+    ADD COLUMN reconcile_review_at TIMESTAMP NULL AFTER response_payload;
@@ -0,0 +1,22 @@
+-- Migration: Market snapshot on transactions
+-- daily_revenue_rollup is keyed by the transaction's market. It used to be
+-- read from the merchant's current market, so after a merchant changed market
+-- status changes on its older transactions were retracted from the new
+-- market's rows while the old rows kept them. transactions.market_id is now
+-- set at insert (like province/district) and never follows the merchant.
+--
+-- Existing rows get the merchant's current market (the best value available).
+-- Rebuild the rollup afterwards:
+--   python scripts/rebuild_revenue_rollup.py
+
+ALTER TABLE transactions
+    ADD COLUMN market_id BIGINT NULL AFTER funcionario_id;
+
+UPDATE transactions t
+    JOIN merchants m ON m.id = t.merchant_id
+    SET t.market_id = m.market_id
+    WHERE t.market_id IS NULL;
+
+ALTER TABLE transactions
+    MODIFY COLUMN market_id BIGINT NOT NULL,
+    ADD CONSTRAINT fk_transactions_market FOREIGN KEY (market_id) REFERENCES markets(id);
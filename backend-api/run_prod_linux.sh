@@ -55,6 +55,10 @@ echo "Workers: $WORKERS"
 echo "Address: $HOST:$PORT"
 echo ""
 
+# Background exports run outside the API workers (EXPORT_JOBS_IN_SCHEDULER=false)
+python -m scripts.export_worker &
+echo "✅ Export worker started (PID $!)"
+
 # Start Gunicorn
 exec gunicorn app.main:app \
     -w $WORKERS \
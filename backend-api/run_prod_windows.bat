@@ -68,6 +68,10 @@ echo Workers: %WORKERS%
 echo Address: %HOST%:%PORT%
 echo.
 
+REM Background exports run outside the API workers (EXPORT_JOBS_IN_SCHEDULER=false)
+start "Paysafe Export Worker" /min python -m scripts.export_worker
+echo [OK] Export worker started
+
 uvicorn app.main:app --host %HOST% --port %PORT% --workers %WORKERS%
 
 pause
@@ -0,0 +1,83 @@
+"""
+Benchmark: DATE(created_at) filters vs half-open created_at ranges (MySQL).
+
+For the dashboard/report query shapes, prints the EXPLAIN access plan
+(type / key / rows) and the average execution time of the old
+`DATE(created_at) ...` form next to the sargable form used by the routers
+(app/utils/date_range.py). Expected: ALL (full scan) before, range on
+idx_transactions_status_created_at / idx_transactions_created_at after.
+
+Usage:
+    python scripts/explain_date_filters.py [--runs 20]
+"""
+import asyncio
+import sys
+import os
+import time
+from datetime import date, timedelta
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+TODAY = date.today()
+MONTH_START = TODAY.replace(day=1)
+LAST_30 = TODAY - timedelta(days=30)
+
+# name -> (old SQL, new SQL, params)
+QUERIES = {
+    "revenue_today": (
+        "SELECT SUM(amount) FROM transactions WHERE status = 'SUCESSO' AND DATE(created_at) = :day",
+        "SELECT SUM(amount) FROM transactions WHERE status = 'SUCESSO' AND created_at >= :day AND created_at < :next_day",
+        {"day": TODAY, "next_day": TODAY + timedelta(days=1)},
+    ),
+    "tx_count_today": (
+        "SELECT COUNT(id) FROM transactions WHERE DATE(created_at) = :day",
+        "SELECT COUNT(id) FROM transactions WHERE created_at >= :day AND created_at < :next_day",
+        {"day": TODAY, "next_day": TODAY + timedelta(days=1)},
+    ),
+    "revenue_month": (
+        "SELECT SUM(amount) FROM transactions WHERE status = 'SUCESSO' AND DATE(created_at) >= :start",
+        "SELECT SUM(amount) FROM transactions WHERE status = 'SUCESSO' AND created_at >= :start",
+        {"start": MONTH_START},
+    ),
+    "revenue_chart_30d": (
+        "SELECT DATE(created_at), SUM(amount) FROM transactions "
+        "WHERE status = 'SUCESSO' AND DATE(created_at) >= :start GROUP BY DATE(created_at)",
+        "SELECT DATE(created_at), SUM(amount) FROM transactions "
+        "WHERE status = 'SUCESSO' AND created_at >= :start GROUP BY DATE(created_at)",
+        {"start": LAST_30},
+    ),
+}
+
+
+async def explain(db, sql, params):
+    rows = (await db.execute(text("EXPLAIN " + sql), params)).mappings().all()
+    return ", ".join(f"type={r.get('type')} key={r.get('key')} rows={r.get('rows')}" for r in rows)
+
+
+async def timed(db, sql, params, runs):
+    started = time.perf_counter()
+    for _ in range(runs):
+        await db.execute(text(sql), params)
+    return (time.perf_counter() - started) * 1000 / runs
+
+
+async def main(runs: int):
+    from app.database import SessionLocal, engine
+
+    async with SessionLocal() as db:
+        for name, (old_sql, new_sql, params) in QUERIES.items():
+            print(f"== {name}")
+            for label, sql in (("DATE()", old_sql), ("range ", new_sql)):
+                plan = await explain(db, sql, params)
+                ms = await timed(db, sql, params, runs)
+                print(f"   {label} {ms:8.2f} ms  {plan}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    runs = 20
+    if "--runs" in sys.argv:
+        runs = int(sys.argv[sys.argv.index("--runs") + 1])
+    asyncio.run(main(runs))
@@ -0,0 +1,52 @@
+"""
+Dedicated worker for background exports (/exports).
+
+Runs export jobs outside the API processes (the default: with
+EXPORT_JOBS_IN_SCHEDULER=false, no API worker runs them). Start it next to
+Gunicorn.
+Must run on the same host as the API (files are written to EXPORT_DIR).
+Several workers may run at once: each job is claimed by exactly one.
+
+Usage:
+    python scripts/export_worker.py           # poll every EXPORT_JOB_POLL_SECONDS
+    python scripts/export_worker.py --once    # one pass (cron)
+"""
+import asyncio
+import logging
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def work(once: bool):
+    from app.config import settings
+    from app.database import engine
+    from app.services.export_job_service import process_export_jobs
+
+    logging.basicConfig(level=settings.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    print(f"Export worker started (dir: {settings.EXPORT_DIR})")
+    try:
+        while True:
+            try:
+                summary = await process_export_jobs()
+                if summary["ran"] or summary["failed_stale"] or summary["expired"]:
+                    print(
+                        f"ran={summary['ran']} failed_stale={summary['failed_stale']} "
+                        f"expired={summary['expired']}"
+                    )
+            except Exception as e:
+                print(f"[ERROR] Export pass failed: {e}")
+                if once:
+                    return 1
+            if once:
+                return 0
+            await asyncio.sleep(settings.EXPORT_JOB_POLL_SECONDS)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(asyncio.run(work("--once" in sys.argv)))
+    except KeyboardInterrupt:
+        print("\nExport worker stopped")
@@ -0,0 +1,42 @@
+"""
+Script to rebuild the incremental merchant fee ledger from history.
+Recomputes Sum(FeePayments) + Sum(Transactions SUCESSO) per merchant,
+reports drift against merchants.fee_total_paid and writes corrections.
+
+Usage:
+    python scripts/rebuild_fee_ledger.py           # rebuild (write corrections)
+    python scripts/rebuild_fee_ledger.py --check   # drift report only
+"""
+import asyncio
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def rebuild(check_only: bool):
+    from app.database import SessionLocal, engine
+    from app.services.fee_service import rebuild_fee_ledger
+    
+    async with SessionLocal() as db:
+        summary = await rebuild_fee_ledger(db, check_only=check_only)
+    
+    print(f"Merchants checked: {summary['checked']}")
+    print(f"Drifted:           {summary['drifted']}")
+    for d in summary["drift"][:50]:
+        print(f"   - Merchant {d['merchant_id']}: stored={d['stored']} actual={d['actual']}")
+    if summary["drifted"] > 50:
+        print(f"   ... and {summary['drifted'] - 50} more")
+    
+    if check_only:
+        print("\n[CHECK] No changes written")
+    else:
+        print(f"\n[OK] Ledger rebuilt ({summary['written']} rows corrected) in {summary['duration_ms']} ms")
+    
+    await engine.dispose()
+    
+    # Non-zero exit on drift in check mode (usable from cron/monitoring)
+    return 1 if check_only and summary["drifted"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(rebuild("--check" in sys.argv)))
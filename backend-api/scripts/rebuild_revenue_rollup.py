@@ -0,0 +1,37 @@
+"""
+Script to (re)build daily_revenue_rollup from the transactions table.
+Run once after migration 009, and whenever the rollup needs repairing
+(e.g. after manual SQL changes to transactions).
+
+Usage:
+    python scripts/rebuild_revenue_rollup.py                      # all days
+    python scripts/rebuild_revenue_rollup.py --since 2026-01-01   # days >= date
+"""
+import asyncio
+import sys
+import os
+from datetime import date
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def rebuild(since):
+    from app.database import SessionLocal, engine
+    from app.services.revenue_rollup_service import rebuild_revenue_rollup
+
+    async with SessionLocal() as db:
+        summary = await rebuild_revenue_rollup(db, since=since)
+
+    print(f"Since:        {summary['since'] or 'beginning'}")
+    print(f"Rows removed: {summary['deleted']}")
+    print(f"Rows written: {summary['rows']}")
+    print(f"\n[OK] Revenue rollup rebuilt in {summary['duration_ms']} ms")
+
+    await engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    since = None
+    if "--since" in sys.argv:
+        since = date.fromisoformat(sys.argv[sys.argv.index("--since") + 1])
+    sys.exit(asyncio.run(rebuild(since)))
@@ -1,3 +1,4 @@
+from portalsdk.api import APIClient
 from portalsdk.api import APIContext
 from portalsdk.api import APIMethodType
 from portalsdk.api import APIRequest
@@ -1,28 +1,103 @@
 import json
+import threading
+import time
 from enum import Enum
 from pprint import pprint
 
 import requests
+from requests.adapters import HTTPAdapter
 from base64 import b64decode, b64encode
 from Crypto.PublicKey import RSA
 from Crypto.Cipher import PKCS1_v1_5 as Cipher_PKCS1_v1_5
 
 
+# Bearer tokens are reused for this many seconds (0 = new token per request)
+DEFAULT_TOKEN_LIFETIME = 300
+
+
+class APIClient:
+    """
+    Reusable client: keep-alive session pool, parsed public key cache and
+    bearer token cache. Share one instance per process (see get_default_client).
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=20, token_lifetime=DEFAULT_TOKEN_LIFETIME, timeout=None):
+        self.token_lifetime = token_lifetime
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._ciphers = {}
+        self._tokens = {}
+
+    def _cipher(self, public_key):
+        cipher = self._ciphers.get(public_key)
+        if cipher is None:
+            key_pub = RSA.importKey(b64decode(public_key))
+            cipher = Cipher_PKCS1_v1_5.new(key_pub)
+            self._ciphers[public_key] = cipher
+        return cipher
+
+    def create_bearer_token(self, api_key, public_key):
+        cache_key = (api_key, public_key)
+        now = time.monotonic()
+        cached = self._tokens.get(cache_key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        cipher_text = self._cipher(public_key).encrypt(api_key.encode('ascii'))
+        token = b64encode(cipher_text)
+        if self.token_lifetime > 0:
+            self._tokens[cache_key] = (now + self.token_lifetime, token)
+        return token
+
+    def execute(self, context):
+        method = {
+            APIMethodType.GET: 'GET',
+            APIMethodType.POST: 'POST',
+            APIMethodType.PUT: 'PUT'
+        }.get(context.method_type)
+        if method is None:
+            raise Exception('Unknown Method')
+
+        if method == 'GET':
+            kwargs = {'params': context.get_parameters()}
+        else:
+            kwargs = {'json': context.get_parameters()}
+        r = self.session.request(method, context.get_url(), headers=context.get_headers(), timeout=self.timeout, **kwargs)
+        return APIResponse(r.status_code, dict(r.headers), json.loads(r.text))
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    """Process-wide APIClient used by APIRequest when none is given."""
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = APIClient()
+    return _default_client
+
+
 class APIRequest:
 
-    def __init__(self, context=None):
+    def __init__(self, context=None, client=None):
         self.context = context
+        self.client = client or get_default_client()
 
     def execute(self):
         if self.context is not None:
             self.create_default_headers()
             # pprint(self.context)
             try:
-                return {
-                    APIMethodType.GET: self.__get,
-                    APIMethodType.POST: self.__post,
-                    APIMethodType.PUT: self.__put
-                }.get(self.context.method_type, self.__unknown)()
+                return self.client.execute(self.context)
             except requests.exceptions.ConnectionError as ce:
                 print(ce)
                 return None
@@ -30,38 +105,13 @@ class APIRequest:
             raise TypeError('Context cannot be None.')
 
     def create_bearer_token(self):
-        key_der = b64decode(self.context.public_key)
-        key_pub = RSA.importKey(key_der)
-        cipher = Cipher_PKCS1_v1_5.new(key_pub)
-        cipher_text = cipher.encrypt(self.context.api_key.encode('ascii'))
-        encrypted_msg = b64encode(cipher_text)
-
-        return encrypted_msg
+        return self.client.create_bearer_token(self.context.api_key, self.context.public_key)
 
     def create_default_headers(self):
         self.context.add_header('Authorization', 'Bearer {}'.format(self.create_bearer_token().decode('utf-8')))
         self.context.add_header('Content-Type', 'application/json')
         self.context.add_header('Host', self.context.address)
 
-    def __get(self):
-        r = requests.get(self.context.get_url(), params=self.context.get_parameters(), headers=self.context.get_headers())
-        print(r)
-        return APIResponse(r.status_code, json.loads(r.headers.__str__().replace("'", '"')), json.loads(r.text))
-
-    def __post(self):
-        r = requests.post(self.context.get_url(), headers=self.context.get_headers(), json=self.context.get_parameters())
-        print(r)
-        return APIResponse(r.status_code, json.loads(r.headers.__str__().replace("'", '"')), json.loads(r.text))
-
-    def __put(self):
-        print('PUT')
-        r = requests.put(self.context.get_url(), headers=self.context.get_headers(), json=self.context.get_parameters())
-        print('PUT', r)
-        return APIResponse(r.status_code, json.loads(r.headers.__str__().replace("'", '"')), json.loads(r.text))
-
-    def __unknown(self):
-        raise Exception('Unknown Method')
-
 
 class APIResponse(dict):
 
@@ -114,7 +164,7 @@ class APIMethodType(Enum):
 
 class APIContext(dict):
 
-    def __init__(self, api_key='', public_key='', ssl=False, method_type=APIMethodType.GET, address='', port=80, path='', headers={}, parameters={}):
+    def __init__(self, api_key='', public_key='', ssl=False, method_type=APIMethodType.GET, address='', port=80, path='', headers=None, parameters=None):
         super(APIContext, self).__init__()
 
         self['api_key']: str = api_key
@@ -124,8 +174,9 @@ class APIContext(dict):
         self['address']: str = address
         self['port']: int = port
         self['path']: str = path
-        self['headers']: dict = headers
-        self['parameters']: dict = parameters
+        # Copies: add_header/add_parameter must not mutate shared or caller dicts
+        self['headers']: dict = dict(headers or {})
+        self['parameters']: dict = dict(parameters or {})
 
     def get_url(self):
         if self.ssl is True: